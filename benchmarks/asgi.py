@@ -0,0 +1,119 @@
+""" Measures the read throughput of the ASGI entry point per number of
+threads, with and without a client exporting whole tables meanwhile.
+
+Usage:
+    python -m benchmarks.asgi [--threads 1,2,4,8] [--clients 16]
+        [--seconds 5] [--size 10000]
+
+A database is seeded with 'size' persons as by 'benchmarks.routes'. Then
+for each number of threads, 'clients' concurrent clients send reads of
+single persons, resident sheets, searches and phone lookups to the ASGI
+application, in-process, for 'seconds'. Reads completed per second are
+reported, along with the p50 and p99 latencies of the lookups, once alone
+and once while one more client exports every resident in a loop.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.routes import Seed, percentile
+from fiches_urgence import create_app, db
+from fiches_urgence.asgi import WsgiToAsgi
+
+READS = (
+    lambda seed: f"/persons/{seed.random.choice(seed.persons)}",
+    lambda seed: f"/residents/{seed.random.choice(seed.residents)}/sheet",
+    lambda seed: f"/persons/search?q={seed.name()[:3]}",
+    lambda seed: f"/lookup/phone/{seed.random.choice(seed.phones)}",
+)
+
+
+async def get(asgi: WsgiToAsgi, url: str) -> int:
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [],
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await asgi(scope, receive, send)
+    return status[0]
+
+
+async def run(asgi: WsgiToAsgi, seed: Seed, args: argparse.Namespace,
+              export: bool) -> tuple:
+    deadline = time.perf_counter() + args.seconds
+    reads, lookups = [0], []
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            build = seed.random.choice(READS)
+            start = time.perf_counter()
+            await get(asgi, build(seed))
+            if build is READS[-1]:
+                lookups.append(time.perf_counter() - start)
+            reads[0] += 1
+
+    async def exporter():
+        while time.perf_counter() < deadline:
+            await get(asgi, "/residents")
+
+    tasks = [reader() for _ in range(args.clients)]
+    if export:
+        tasks.append(exporter())
+    await asyncio.gather(*tasks)
+    return reads[0] / args.seconds, lookups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", default="1,2,4,8")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--size", type=int, default=10000)
+    args = parser.parse_args()
+
+    app = create_app()
+    with tempfile.TemporaryDirectory() as directory:
+        app.config["SQLALCHEMY_DATABASE_URI"] = \
+            "sqlite:///" + os.path.join(directory, "asgi.db")
+        with app.app_context():
+            db.create_all()
+            seed = Seed(random.Random(args.size))
+            seed.fill(args.size)
+            db.session.remove()
+
+        print(f"{args.clients} clients, {args.size} persons")
+        for threads in (int(count) for count in args.threads.split(",")):
+            asgi = WsgiToAsgi(app, threads)
+            for export in (False, True):
+                throughput, lookups = asyncio.run(
+                    run(asgi, seed, args, export))
+                print(
+                    f"  {threads:3d} threads {'export' if export else '':6} "
+                    f"{throughput:8.1f} reads/s   lookups "
+                    f"p50 {percentile(lookups, 0.5) * 1e3:8.2f} ms "
+                    f"p99 {percentile(lookups, 0.99) * 1e3:8.2f} ms"
+                )
+            asgi.executor.shutdown()
+
+        with app.app_context():
+            db.get_engine().dispose()
+
+
+if __name__ == "__main__":
+    main()
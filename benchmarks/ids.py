@@ -0,0 +1,95 @@
+""" Compares the ids of 'src.ids' with the legacy 'utils.random_id'.
+
+Usage:
+    python -m benchmarks.ids [--rows 200000] [--batch 1000]
+
+The micro-benchmark times the allocation of one id. The insert benchmark
+fills a 'person' table with each kind of id, through the same executemany
+inserts as the bulk endpoints, with a small page cache so that the cost of
+scattering random keys over the primary key index shows. Random ids as long
+as the new ones are also inserted, to tell the gain of time ordering apart
+from the one of the id length.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import timeit
+
+from src import ids, utils
+
+PAGE_CACHE_KIB = 2000
+
+
+def time_allocation(repeat: int = 100000):
+    legacy = timeit.timeit(lambda: utils.random_id(8), number=repeat)
+    single = timeit.timeit(ids.new_id, number=repeat)
+    batched = timeit.timeit(lambda: ids.new_ids(1000), number=repeat // 1000)
+
+    print("Allocation of one id")
+    for name, seconds in (
+        ("utils.random_id(8)", legacy),
+        ("ids.new_id()", single),
+        ("ids.new_ids(1000)", batched)
+    ):
+        print(f"  {name:<20} {seconds / repeat * 1e6:8.2f} us")
+
+
+def time_inserts(name: str, allocate, rows: int, batch: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(os.path.join(directory, f"{name}.db"))
+        connection.execute(f"PRAGMA cache_size=-{PAGE_CACHE_KIB}")
+        connection.execute(
+            "CREATE TABLE person ("
+            "id VARCHAR NOT NULL PRIMARY KEY, "
+            "firstName VARCHAR NOT NULL, "
+            "lastName VARCHAR NOT NULL)"
+        )
+
+        start = time.perf_counter()
+        for _ in range(rows // batch):
+            connection.executemany(
+                "INSERT INTO person VALUES (?, 'first', 'last')",
+                ((id,) for id in allocate(batch))
+            )
+            connection.commit()
+        elapsed = time.perf_counter() - start
+
+        pages, = connection.execute("PRAGMA page_count").fetchone()
+        connection.close()
+
+    print(
+        f"  {name:<20} {rows / elapsed:10.0f} rows/s "
+        f"{pages:8d} pages"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    time_allocation()
+
+    print(f"Insertion of {args.rows} persons by batches of {args.batch}")
+    time_inserts(
+        "utils.random_id(8)",
+        lambda count: [utils.random_id(8) for _ in range(count)],
+        args.rows, args.batch
+    )
+    time_inserts(
+        "random 26 chars",
+        lambda count: [
+            ids.encode(int.from_bytes(os.urandom(16), "big") >> 2)
+            for _ in range(count)
+        ],
+        args.rows, args.batch
+    )
+    time_inserts("ids.new_ids", ids.new_ids, args.rows, args.batch)
+
+
+if __name__ == "__main__":
+    main()
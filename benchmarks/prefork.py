@@ -0,0 +1,127 @@
+""" Measures how the read throughput of 'fiches_urgence.server' scales with
+its number of workers.
+
+Usage:
+    python -m benchmarks.prefork [--workers 1,2,4] [--clients 16]
+        [--seconds 5] [--size 10000]
+
+A database is seeded with 'size' persons as by 'benchmarks.routes', then
+served by the prefork server with each number of workers in turn. Client
+processes send reads of single persons, resident sheets, searches and
+phone lookups over HTTP for 'seconds'. Reads completed per second are
+reported, along with the speedup over a single worker. Throughput should
+grow about linearly up to the number of cores, minus the ones taken by the
+clients.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.routes import Seed
+from fiches_urgence import create_app, db
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_serving(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def client(port: int, urls: list, seconds: float) -> int:
+    """ Sends reads until 'seconds' elapsed
+
+    Returns:
+        int: the number of reads completed
+    """
+    generator = random.Random()
+    deadline = time.perf_counter() + seconds
+    reads = 0
+    while time.perf_counter() < deadline:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", generator.choice(urls))
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        if response.status != 200:
+            raise RuntimeError(f"{response.status} {response.reason}")
+        reads += 1
+    return reads
+
+
+def urls(seed: Seed, count: int = 2000) -> list:
+    builders = (
+        lambda: f"/persons/{seed.random.choice(seed.persons)}",
+        lambda: f"/residents/{seed.random.choice(seed.residents)}/sheet",
+        lambda: f"/persons/search?q={seed.name()[:3]}",
+        lambda: f"/lookup/phone/{seed.random.choice(seed.phones)}",
+    )
+    return [seed.random.choice(builders)() for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--size", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uri = "sqlite:///" + os.path.join(directory, "prefork.db")
+        app = create_app()
+        app.config["SQLALCHEMY_DATABASE_URI"] = uri
+        with app.app_context():
+            db.create_all()
+            seed = Seed(random.Random(args.size))
+            seed.fill(args.size)
+            targets = urls(seed)
+            db.session.remove()
+            db.get_engine().dispose()
+
+        print(f"{os.cpu_count()} cores, {args.clients} clients, "
+              f"{args.size} persons")
+        env = dict(os.environ, DATABASE_URL=uri)
+        single = None
+        for workers in (int(count) for count in args.workers.split(",")):
+            port = free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "fiches_urgence.server",
+                 "--port", str(port), "--workers", str(workers)],
+                env=env, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_serving(port)
+                with multiprocessing.Pool(args.clients) as pool:
+                    reads = sum(pool.starmap(
+                        client,
+                        [(port, targets, args.seconds)] * args.clients))
+            finally:
+                server.terminate()
+                server.wait()
+
+            throughput = reads / args.seconds
+            single = single or throughput
+            print(f"  {workers:3d} workers {throughput:10.1f} reads/s "
+                  f"x{throughput / single:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,595 @@
+""" Measures the latency of every route of the API on synthetic data sets.
+
+Usage:
+    python -m benchmarks.routes [--sizes 1000,10000,100000] [--requests 30]
+        [--output routes.json] [--baseline benchmarks/baselines/routes.json]
+        [--threshold 1.5] [--update-baseline]
+
+For each size, a database is seeded with that many persons, half of them
+residents living in cities with health mutuals, doctors, emergency contacts
+and contributors. Every route of 'fiches_urgence.routes' is then called
+through the Flask test client, and its p50 and p99 latencies, throughput
+and number of SQL statements per request are measured.
+
+Results are written as JSON. When a baseline is given, the command fails
+if a route runs more SQL statements than in the baseline, or if its p50
+latency exceeds the baseline one by more than 'threshold' times (plus one
+millisecond, so that sub-millisecond routes do not fail on noise). Routes
+without a scenario make it fail too, so that new routes get one.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src import ids, phones
+from fiches_urgence import create_app, db, sheets
+from fiches_urgence.cache import reference_cache
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    ContributionRelationship,
+    City,
+    Contributor,
+    HealthMutual
+)
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "routes.json")
+
+# Routes which are not benchmarked
+EXCLUDED = frozenset(("reset_db", "static"))
+
+# Requests of the scenarios returning whole tables, which are long at scale
+FULL_TABLE_REQUESTS = 3
+WARMUP_REQUESTS = 2
+BULK_SIZE = 100
+SLACK_MS = 1.0
+
+SYLLABLES = ("ma", "ri", "jo", "du", "pon", "le", "ber", "na", "to", "sa")
+
+# A request of a scenario, as (url, JSON body)
+Call = Tuple[str, Optional[dict]]
+
+
+#   ___ ___ ___ ___
+#  / __| __| __|   \
+#  \__ \ _|| _|| |) |
+#  |___/___|___|___/
+
+
+class Seed(object):
+    """ Inserts synthetic rows straight into the tables, and remembers their
+    ids so that the scenarios can pick some.
+    """
+
+    def __init__(self, generator: random.Random):
+        self.random = generator
+        self.persons = []
+        self.residents = []
+        self.cities = []
+        self.mutuals = []
+        self.contributors = []
+        self.emergency = []
+        self.contributions = []
+        self.phones = []
+
+    def insert(self, model: db.Model, rows: List[dict]) -> List[str]:
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+        return [row["id"] for row in rows]
+
+    def name(self) -> str:
+        count = self.random.randint(2, 3)
+        return "".join(self.random.choices(SYLLABLES, k=count)).capitalize()
+
+    def phone(self) -> str:
+        return "06" + "".join(self.random.choices("0123456789", k=8))
+
+    def new_persons(self, count: int) -> List[str]:
+        rows = []
+        for id in ids.new_ids(count):
+            number = self.phone()
+            rows.append({
+                "id": id,
+                "firstName": self.name(),
+                "lastName": self.name(),
+                "address": "1 rue de la Paix",
+                "mainPhoneNumber": number,
+                "mainPhoneE164": phones.to_e164(number)
+            })
+            self.phones.append(number)
+        return self.insert(Person, rows)
+
+    def new_residents(self, count: int) -> List[str]:
+        return self.insert(Resident, [{
+            "id": id,
+            "birthplace": "Paris",
+            "birthDate": None,
+            "cityId": self.random.choice(self.cities),
+            "healthMutualId": self.random.choice(self.mutuals),
+            "referringDoctorId": self.random.choice(self.persons),
+            "psychiatristId": self.random.choice(self.persons)
+        } for id in self.new_persons(count)])
+
+    def new_emergency(self, resident_id: str) -> str:
+        return self.insert(EmergencyRelationship, [{
+            "id": ids.new_id(),
+            "residentId": resident_id,
+            "personId": self.random.choice(self.persons),
+            "relationship": "sibling"
+        }])[0]
+
+    def new_contribution(self, resident_id: str) -> str:
+        return self.insert(ContributionRelationship, [{
+            "id": ids.new_id(),
+            "residentId": resident_id,
+            "contributorId": self.random.choice(self.contributors),
+            "socialAdvising": False
+        }])[0]
+
+    def fill(self, size: int):
+        """ Seeds 'size' persons, half of them residents """
+        self.cities = self.insert(City, [
+            {"id": id, "name": self.name(), "postalCode": "75000"}
+            for id in ids.new_ids(max(10, size // 100))
+        ])
+        self.mutuals = self.insert(HealthMutual, [
+            {"id": id, "name": self.name(), "address": "2 rue du Port"}
+            for id in ids.new_ids(20)
+        ])
+        self.persons = self.new_persons(size - size // 2)
+        self.contributors = self.insert(Contributor, [
+            {"id": id, "role": "nurse"}
+            for id in self.persons[:max(1, len(self.persons) // 5)]
+        ])
+        self.residents = self.new_residents(size // 2)
+
+        emergency, contributions = [], []
+        for resident_id in self.residents:
+            for _ in range(2):
+                emergency.append({
+                    "id": ids.new_id(),
+                    "residentId": resident_id,
+                    "personId": self.random.choice(self.persons),
+                    "relationship": "sibling"
+                })
+            contributions.append({
+                "id": ids.new_id(),
+                "residentId": resident_id,
+                "contributorId": self.random.choice(self.contributors),
+                "socialAdvising": False
+            })
+        self.emergency = list(zip(
+            (row["residentId"] for row in emergency),
+            self.insert(EmergencyRelationship, emergency)
+        ))
+        self.contributions = list(zip(
+            (row["residentId"] for row in contributions),
+            self.insert(ContributionRelationship, contributions)
+        ))
+
+
+#   ___  ___ ___ _  _   _   ___ ___ ___  ___
+#  / __|/ __| __| \| | /_\ | _ \_ _/ _ \/ __|
+#  \__ \ (__| _|| .` |/ _ \|   /| | (_) \__ \
+#  |___/\___|___|_|\_/_/ \_\_|_\___\___/|___/
+
+
+class Scenario(NamedTuple):
+    endpoint: str
+    method: str
+    label: str
+    # Builds the requests of the scenario, one per iteration
+    calls: Callable[[Seed], Iterator[Call]]
+    full_table: bool = False
+
+
+def each(build: Callable[[Seed], Call]) -> Callable[[Seed], Iterator[Call]]:
+    return lambda seed: (build(seed) for _ in itertools.count())
+
+
+def const(url: str) -> Callable[[Seed], Iterator[Call]]:
+    return each(lambda seed: (url, None))
+
+
+def person_body(seed: Seed) -> dict:
+    return {
+        "firstName": seed.name(),
+        "lastName": seed.name(),
+        "mainPhoneNumber": seed.phone()
+    }
+
+
+def item_scenarios(endpoint: str, path: str,
+                   pick: Callable[[Seed], str],
+                   update: dict,
+                   new: Callable[[Seed], str]) -> List[Scenario]:
+    """ The GET, PUT, PATCH and DELETE scenarios of an item route. Items
+    are deleted once created for the purpose, free of dependent rows.
+    """
+    return [
+        Scenario(endpoint, "GET", f"GET {path}",
+                 each(lambda seed: (path.format(pick(seed)), None))),
+        Scenario(endpoint, "PUT", f"PUT {path}",
+                 each(lambda seed: (path.format(pick(seed)), update))),
+        Scenario(endpoint, "PATCH", f"PATCH {path}",
+                 each(lambda seed: (path.format(pick(seed)), update))),
+        Scenario(endpoint, "DELETE", f"DELETE {path}",
+                 each(lambda seed: (path.format(new(seed)), None))),
+    ]
+
+
+def relationship_path(kind: str, pair: Tuple[str, str]) -> str:
+    return f"/residents/{pair[0]}/{kind}/{pair[1]}"
+
+
+def relationship_scenarios(endpoint: str, kind: str,
+                           pairs: Callable[[Seed], list],
+                           update: dict,
+                           new: Callable[[Seed, str], str]) -> List[Scenario]:
+    label = f"/residents/{{resident}}/{kind}/{{id}}"
+
+    def new_pair(seed: Seed) -> Tuple[str, str]:
+        resident_id = seed.random.choice(seed.residents)
+        return resident_id, new(seed, resident_id)
+
+    return [
+        Scenario(endpoint, "GET", f"GET {label}", each(lambda seed: (
+            relationship_path(kind, seed.random.choice(pairs(seed))), None))),
+        Scenario(endpoint, "PUT", f"PUT {label}", each(lambda seed: (
+            relationship_path(kind, seed.random.choice(pairs(seed))),
+            update))),
+        Scenario(endpoint, "PATCH", f"PATCH {label}", each(lambda seed: (
+            relationship_path(kind, seed.random.choice(pairs(seed))),
+            update))),
+        Scenario(endpoint, "DELETE", f"DELETE {label}", each(lambda seed: (
+            relationship_path(kind, new_pair(seed)), None))),
+    ]
+
+
+def pick(attribute: str) -> Callable[[Seed], str]:
+    return lambda seed: seed.random.choice(getattr(seed, attribute))
+
+
+SCENARIOS = [
+    # Persons
+    Scenario("person_collection", "GET", "GET /persons", const("/persons"),
+             full_table=True),
+    Scenario("person_collection", "GET", "GET /persons?limit=100&sort=..",
+             const("/persons?limit=100&sort=lastName")),
+    Scenario("person_collection", "POST", "POST /persons",
+             each(lambda seed: ("/persons", person_body(seed)))),
+    Scenario("person_bulk", "POST", "POST /persons/bulk", each(lambda seed: (
+        "/persons/bulk", [person_body(seed) for _ in range(BULK_SIZE)]))),
+    Scenario("person_search", "GET", "GET /persons/search",
+             each(lambda seed: (
+                 f"/persons/search?q={seed.name()[:3]}", None))),
+    *item_scenarios(
+        "person_item", "/persons/{}", pick("persons"),
+        {"address": "3 rue Neuve"},
+        lambda seed: seed.new_persons(1)[0]
+    ),
+    Scenario("phone_lookup", "GET", "GET /lookup/phone/{number}",
+             each(lambda seed: (
+                 f"/lookup/phone/{seed.random.choice(seed.phones)}", None))),
+
+    # Residents
+    Scenario("resident_collection", "GET", "GET /residents",
+             const("/residents"), full_table=True),
+    Scenario("resident_collection", "GET", "GET /residents?cityId=..",
+             each(lambda seed: (
+                 f"/residents?cityId={seed.random.choice(seed.cities)}"
+                 f"&limit=100", None))),
+    Scenario("resident_collection", "POST", "POST /residents",
+             each(lambda seed: ("/residents", {
+                 "id": seed.new_persons(1)[0],
+                 "cityId": seed.random.choice(seed.cities)
+             }))),
+    Scenario("resident_bulk", "POST", "POST /residents/bulk",
+             each(lambda seed: ("/residents/bulk", [
+                 {"id": id, "cityId": seed.random.choice(seed.cities)}
+                 for id in seed.new_persons(BULK_SIZE)
+             ]))),
+    *item_scenarios(
+        "resident_item", "/residents/{}", pick("residents"),
+        {"emergencyBag": "blue"},
+        lambda seed: seed.new_residents(1)[0]
+    ),
+    Scenario("resident_sheet", "GET", "GET /residents/{id}/sheet",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}/sheet",
+                 None))),
+
+    # Emergency relationships
+    Scenario("emergency_relationship", "GET",
+             "GET /residents/{id}/emergency-relationships",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/emergency-relationships", None))),
+    Scenario("emergency_relationship", "POST",
+             "POST /residents/{id}/emergency-relationships",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/emergency-relationships",
+                 {"personId": seed.random.choice(seed.persons),
+                  "relationship": "friend"}))),
+    Scenario("emergency_relationship_bulk", "POST",
+             "POST /residents/{id}/emergency-relationships/bulk",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/emergency-relationships/bulk",
+                 [{"personId": seed.random.choice(seed.persons),
+                   "relationship": "friend"} for _ in range(BULK_SIZE)]))),
+    *relationship_scenarios(
+        "emergency_relationship_item", "emergency-relationships",
+        lambda seed: seed.emergency, {"relationship": "cousin"},
+        lambda seed, resident_id: seed.new_emergency(resident_id)
+    ),
+
+    # Contribution relationships
+    Scenario("contributionRelationships_collection", "GET",
+             "GET /residents/{id}/contribution-relationships",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/contribution-relationships", None))),
+    Scenario("contributionRelationships_collection", "POST",
+             "POST /residents/{id}/contribution-relationships",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/contribution-relationships",
+                 {"contributorId": seed.random.choice(seed.contributors),
+                  "socialAdvising": True}))),
+    Scenario("contribution_relationship_bulk", "POST",
+             "POST /residents/{id}/contribution-relationships/bulk",
+             each(lambda seed: (
+                 f"/residents/{seed.random.choice(seed.residents)}"
+                 f"/contribution-relationships/bulk",
+                 [{"contributorId": seed.random.choice(seed.contributors),
+                   "socialAdvising": True} for _ in range(BULK_SIZE)]))),
+    *relationship_scenarios(
+        "contribution_relationship_item", "contribution-relationships",
+        lambda seed: seed.contributions, {"socialAdvising": True},
+        lambda seed, resident_id: seed.new_contribution(resident_id)
+    ),
+
+    # Reference data and contributors
+    Scenario("cities_collection", "GET", "GET /cities", const("/cities")),
+    Scenario("cities_collection", "POST", "POST /cities",
+             each(lambda seed: ("/cities", {"name": seed.name()}))),
+    Scenario("city_bulk", "POST", "POST /cities/bulk", each(lambda seed: (
+        "/cities/bulk", [{"name": seed.name()} for _ in range(BULK_SIZE)]))),
+    *item_scenarios(
+        "city_item", "/cities/{}", pick("cities"), {"postalCode": "69000"},
+        lambda seed: seed.insert(
+            City, [{"id": ids.new_id(), "name": "new"}])[0]
+    ),
+    Scenario("health_mutual_collection", "GET", "GET /health-mutuals",
+             const("/health-mutuals")),
+    Scenario("health_mutual_collection", "POST", "POST /health-mutuals",
+             each(lambda seed: ("/health-mutuals", {"name": seed.name()}))),
+    Scenario("health_mutual_bulk", "POST", "POST /health-mutuals/bulk",
+             each(lambda seed: ("/health-mutuals/bulk", [
+                 {"name": seed.name()} for _ in range(BULK_SIZE)]))),
+    *item_scenarios(
+        "health_mutual_item", "/health-mutuals/{}", pick("mutuals"),
+        {"address": "4 rue Basse"},
+        lambda seed: seed.insert(
+            HealthMutual, [{"id": ids.new_id(), "name": "new"}])[0]
+    ),
+    Scenario("contributor_collection", "GET", "GET /contributors",
+             const("/contributors"), full_table=True),
+    Scenario("contributor_collection", "POST", "POST /contributors",
+             each(lambda seed: ("/contributors", {
+                 "id": seed.new_persons(1)[0], "role": "doctor"}))),
+    Scenario("contributor_bulk", "POST", "POST /contributors/bulk",
+             each(lambda seed: ("/contributors/bulk", [
+                 {"id": id, "role": "doctor"}
+                 for id in seed.new_persons(BULK_SIZE)]))),
+    *item_scenarios(
+        "contributor_item", "/contributors/{}", pick("contributors"),
+        {"role": "social worker"},
+        lambda seed: seed.insert(Contributor, [
+            {"id": seed.new_persons(1)[0], "role": "new"}])[0]
+    ),
+
+    # Batches, creating a resident from scratch in one request
+    Scenario("batch_requests", "POST", "POST /batch", each(lambda seed: (
+        "/batch", [
+            {"ref": "person", "method": "POST", "path": "/persons",
+             "body": person_body(seed)},
+            {"method": "POST", "path": "/residents",
+             "body": {"id": "${person.id}"}},
+            {"method": "POST",
+             "path": "/residents/${person.id}/emergency-relationships",
+             "body": {"personId": seed.random.choice(seed.persons),
+                      "relationship": "sister"}},
+            {"method": "POST",
+             "path": "/residents/${person.id}/contribution-relationships",
+             "body": {"contributorId": seed.random.choice(seed.contributors),
+                      "socialAdvising": True}},
+        ]))),
+
+    # Administration
+    Scenario("cache_stats", "GET", "GET /admin/cache",
+             const("/admin/cache")),
+    Scenario("pool_stats", "GET", "GET /admin/pool", const("/admin/pool")),
+    Scenario("profiles", "GET", "GET /admin/profiles",
+             const("/admin/profiles")),
+    Scenario("metrics", "GET", "GET /metrics", const("/metrics")),
+]
+
+
+#   ___ _   _ _  _
+#  | _ \ | | | \| |
+#  |   / |_| | .` |
+#  |_|_\\___/|_|\_|
+
+
+def uncovered_routes(app) -> List[str]:
+    covered = {(scenario.endpoint, scenario.method) for scenario in SCENARIOS}
+    return sorted(
+        f"{method} {rule.rule}"
+        for rule in app.url_map.iter_rules()
+        if rule.endpoint not in EXCLUDED
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+        if (rule.endpoint, method) not in covered
+    )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(client, seed: Seed, scenario: Scenario, count: int) -> dict:
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    calls = scenario.calls(seed)
+    durations, queries = [], []
+    event.listen(Engine, "before_cursor_execute", count_statement)
+    try:
+        for index in range(WARMUP_REQUESTS + count):
+            url, body = next(calls)
+            before = statements[0]
+            start = time.perf_counter()
+            res = client.open(url, method=scenario.method, json=body)
+            res.get_data()
+            elapsed = time.perf_counter() - start
+
+            if res.status_code >= 400:
+                raise RuntimeError(
+                    f"{scenario.label}: {res.status_code} "
+                    f"{res.get_data(as_text=True)[:200]}")
+            if index >= WARMUP_REQUESTS:
+                durations.append(elapsed)
+                queries.append(statements[0] - before)
+    finally:
+        event.remove(Engine, "before_cursor_execute", count_statement)
+
+    return {
+        "requests": count,
+        "p50_ms": round(percentile(durations, 0.5) * 1e3, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1e3, 3),
+        "throughput_rps": round(count / sum(durations), 1),
+        "queries": max(queries)
+    }
+
+
+def run_size(app, size: int, requests: int) -> dict:
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        sheets.cache.clear()
+        reference_cache.clear()
+
+        start = time.perf_counter()
+        seed = Seed(random.Random(size))
+        seed.fill(size)
+        print(f"Seeded {size} persons in {time.perf_counter() - start:.1f} s")
+
+        results = {}
+        for scenario in SCENARIOS:
+            count = FULL_TABLE_REQUESTS if scenario.full_table else requests
+            results[scenario.label] = measure(client, seed, scenario, count)
+            result = results[scenario.label]
+            print(
+                f"  {scenario.label:<58} p50 {result['p50_ms']:9.2f} ms "
+                f"p99 {result['p99_ms']:9.2f} ms "
+                f"{result['throughput_rps']:8.1f} req/s "
+                f"{result['queries']:3d} queries"
+            )
+        return results
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> List[str]:
+    failures = []
+    for size, routes in results["sizes"].items():
+        for label, result in routes.items():
+            reference = baseline["sizes"].get(size, {}).get(label)
+            if reference is None:
+                continue
+            if result["queries"] > reference["queries"]:
+                failures.append(
+                    f"{size} {label}: {result['queries']} queries, "
+                    f"{reference['queries']} in the baseline")
+            limit = reference["p50_ms"] * threshold + SLACK_MS
+            if result["p50_ms"] > limit:
+                failures.append(
+                    f"{size} {label}: p50 {result['p50_ms']} ms, "
+                    f"limit {limit:.3f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--output", default="routes.json")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    missing = uncovered_routes(app)
+    if missing:
+        sys.exit("Routes without a scenario: " + ", ".join(missing))
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "requests": args.requests
+        },
+        "sizes": {}
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        app.config["SQLALCHEMY_DATABASE_URI"] = \
+            "sqlite:///" + os.path.join(directory, "routes.db")
+        for size in (int(size) for size in args.sizes.split(",")):
+            results["sizes"][str(size)] = run_size(app, size, args.requests)
+        with app.app_context():
+            db.session.remove()
+            db.get_engine().dispose()
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}")
+        return
+
+    with open(args.baseline) as baseline:
+        failures = regressions(results, json.load(baseline), args.threshold)
+    if failures:
+        sys.exit("Regressions:\n  " + "\n  ".join(failures))
+    print("No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
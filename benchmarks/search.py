@@ -0,0 +1,89 @@
+""" Times the person search of 'fiches_urgence.search' on a large table.
+
+Usage:
+    python -m benchmarks.search [--rows 100000] [--repeat 200]
+
+A 'person' table is filled with random names through the triggers keeping
+the FTS5 index in sync, then the queries an operator types are timed
+against the index, and against the 'LIKE' scan a client-side filter would
+amount to.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import string
+import tempfile
+import time
+
+from fiches_urgence import search
+
+QUERIES = ("d", "du", "dup", "jea dup", "mar jean", "zzz")
+
+
+def random_name(generator: random.Random) -> str:
+    length = generator.randint(3, 10)
+    return "".join(generator.choices(string.ascii_lowercase, k=length))
+
+
+def fill(connection: sqlite3.Connection, rows: int):
+    connection.execute(
+        "CREATE TABLE person ("
+        "id VARCHAR NOT NULL PRIMARY KEY, "
+        "firstName VARCHAR NOT NULL, "
+        "lastName VARCHAR NOT NULL)"
+    )
+    for statement in search.CREATE_INDEX + search.CREATE_TRIGGERS:
+        connection.execute(statement)
+
+    generator = random.Random(0)
+    start = time.perf_counter()
+    connection.executemany(
+        "INSERT INTO person VALUES (?, ?, ?)",
+        (
+            (str(index), random_name(generator), random_name(generator))
+            for index in range(rows)
+        )
+    )
+    connection.commit()
+    elapsed = time.perf_counter() - start
+    print(f"Insertion of {rows} persons: {rows / elapsed:10.0f} rows/s")
+
+
+def time_query(connection, statement: str, params: dict, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        connection.execute(statement, params).fetchall()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = sqlite3.connect(os.path.join(directory, "search.db"))
+        fill(connection, args.rows)
+
+        like = (
+            "SELECT * FROM person WHERE firstName LIKE :pattern "
+            "OR lastName LIKE :pattern ORDER BY lastName LIMIT 20"
+        )
+        print(f"{'query':<12} {'fts5 (ms)':>10} {'like (ms)':>10}")
+        for query in QUERIES:
+            indexed = time_query(connection, search.SEARCH, {
+                "expression": search.match_expression(query),
+                "limit": 20
+            }, args.repeat)
+            scanned = time_query(connection, like, {
+                "pattern": f"%{search.tokens(query)[-1]}%"
+            }, args.repeat)
+            print(
+                f"{query!r:<12} {indexed * 1e3:10.3f} {scanned * 1e3:10.3f}")
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+""" Compares concurrent throughput between the SQLite profiles of 'Config'.
+
+Usage:
+    python -m benchmarks.sqlite_profiles [--readers 4] [--writers 2]
+        [--seconds 5] [--rows 20000]
+
+For each profile, a 'person' table is filled, then reader threads fetch
+pages of persons by keyset while writer threads insert and update rows in
+small transactions, each thread on its own connection set up by the same
+pragmas as the application. Completed operations are counted per second,
+along with the ones failing with 'database is locked'.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from src import ids
+from fiches_urgence import set_sqlite_pragmas
+from fiches_urgence.config import Config
+
+PAGE_SIZE = 100
+
+
+def connect(path: str, pragmas: dict) -> sqlite3.Connection:
+    # Connected as SQLAlchemy does, with pysqlite's default busy timeout
+    connection = sqlite3.connect(path, check_same_thread=False)
+    set_sqlite_pragmas(pragmas, connection, None)
+    return connection
+
+
+def fill(path: str, pragmas: dict, rows: int):
+    connection = connect(path, pragmas)
+    connection.execute(
+        "CREATE TABLE person ("
+        "id VARCHAR NOT NULL PRIMARY KEY, "
+        "firstName VARCHAR NOT NULL, "
+        "lastName VARCHAR NOT NULL)"
+    )
+    connection.executemany(
+        "INSERT INTO person VALUES (?, 'first', 'last')",
+        ((id,) for id in ids.new_ids(rows))
+    )
+    connection.commit()
+    connection.close()
+
+
+def reader(connection: sqlite3.Connection, stop: threading.Event,
+           counts: dict):
+    cursor = ""
+    while not stop.is_set():
+        try:
+            rows = connection.execute(
+                "SELECT * FROM person WHERE id > ? ORDER BY id LIMIT ?",
+                (cursor, PAGE_SIZE)
+            ).fetchall()
+            cursor = rows[-1][0] if len(rows) == PAGE_SIZE else ""
+            counts["reads"] += 1
+        except sqlite3.OperationalError:
+            counts["locked"] += 1
+
+
+def writer(connection: sqlite3.Connection, stop: threading.Event,
+           counts: dict):
+    while not stop.is_set():
+        try:
+            with connection:
+                id = ids.new_id()
+                connection.execute(
+                    "INSERT INTO person VALUES (?, 'first', 'last')", (id,))
+                connection.execute(
+                    "UPDATE person SET lastName = 'other' WHERE id = ?",
+                    (id,))
+            counts["writes"] += 1
+        except sqlite3.OperationalError:
+            counts["locked"] += 1
+
+
+def run(profile: str, args: argparse.Namespace):
+    pragmas = Config.SQLITE_PROFILES[profile]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{profile}.db")
+        fill(path, pragmas, args.rows)
+
+        stop = threading.Event()
+        threads = []
+        connections = []
+        results = []
+        for target, count in ((reader, args.readers), (writer, args.writers)):
+            for _ in range(count):
+                counts = {"reads": 0, "writes": 0, "locked": 0}
+                results.append(counts)
+                connections.append(connect(path, pragmas))
+                threads.append(threading.Thread(
+                    target=target, args=(connections[-1], stop, counts)))
+
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for connection in connections:
+            connection.close()
+
+    total = {
+        key: sum(counts[key] for counts in results) / args.seconds
+        for key in ("reads", "writes", "locked")
+    }
+    print(
+        f"  {profile:<10} {total['reads']:10.0f} reads/s "
+        f"{total['writes']:10.0f} writes/s {total['locked']:10.0f} locked/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(
+        f"{args.readers} readers and {args.writers} writers "
+        f"for {args.seconds} s"
+    )
+    for profile in Config.SQLITE_PROFILES:
+        run(profile, args)
+
+
+if __name__ == "__main__":
+    main()
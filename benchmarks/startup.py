@@ -0,0 +1,94 @@
+""" Measures the cold-start cost of the application.
+
+Usage:
+    python -m benchmarks.startup [--runs 10]
+
+Each run starts a fresh interpreter which imports the package and calls
+'create_app', once on a new database, where the tables are created, and
+once on an existing database, where only the stored schema version is
+read. The time to import the package, to build the application and the
+whole process are reported, as medians. The time taken in-process by
+'create_all' on an existing database is reported as well, for comparison
+with the version check replacing it.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fiches_urgence import create_app, db
+from fiches_urgence.schema_version import ensure_schema
+
+# Run by each fresh interpreter, printing its timings in JSON
+PROBE = """
+import json, time
+start = time.perf_counter()
+import fiches_urgence
+imported = time.perf_counter()
+fiches_urgence.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported
+}))
+"""
+
+
+def probe(env: dict) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], env=env, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    ).stdout
+    timings = json.loads(output.splitlines()[-1])
+    timings["process"] = time.perf_counter() - start
+    return timings
+
+
+def report(label: str, runs: list):
+    print(f"  {label:<18}" + "".join(
+        f" {key} {statistics.median(run[key] for run in runs) * 1e3:8.1f} ms"
+        for key in ("import", "create_app", "process")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fresh, existing = [], []
+        for run in range(args.runs):
+            env = dict(
+                os.environ,
+                DATABASE_URL="sqlite:///" + os.path.join(
+                    directory, f"startup-{run}.db"))
+            fresh.append(probe(env))
+            existing.append(probe(env))
+
+        print(f"Median of {args.runs} runs")
+        report("new database", fresh)
+        report("existing database", existing)
+
+        app = create_app()
+        app.config["SQLALCHEMY_DATABASE_URI"] = \
+            "sqlite:///" + os.path.join(directory, "startup-0.db")
+        with app.app_context():
+            for label, function in (("create_all", db.create_all),
+                                    ("ensure_schema", ensure_schema)):
+                durations = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    function()
+                    durations.append(time.perf_counter() - start)
+                print(f"  {label:<18} "
+                      f"{statistics.median(durations) * 1e3:8.2f} ms")
+            db.get_engine().dispose()
+
+
+if __name__ == "__main__":
+    main()
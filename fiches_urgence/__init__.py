@@ -1,23 +1,81 @@
+from functools import partial
+
 from flask import Flask
 from flask_cors import CORS
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.pool import StaticPool
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from flask_marshmallow import Marshmallow
 from fiches_urgence.config import Config
+from fiches_urgence.pool import MeteredQueuePool
 
-db = SQLAlchemy()
-ma = Marshmallow()
+# Engine options only a queue of connections accepts
+QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
 
 
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
-    """ Forces any sqlite db to enable foreign keys check """
+def set_sqlite_pragmas(pragmas: dict, dbapi_connection, connection_record):
+    """ Applies the pragmas of a SQLite profile to a new connection """
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
     cursor.close()
 
 
+class Session(SignallingSession):
+    """ Session whose commits only release the current savepoint while a
+    batch of requests holds its transaction, so that the requests of the
+    batch are committed together by 'fiches_urgence.batch' or not at all.
+    """
+
+    def commit(self):
+        if self.info.get("batch") and not self.transaction.nested:
+            self.flush()
+            return
+        super(Session, self).commit()
+
+
+class Database(SQLAlchemy):
+    """ Pools the connections of every database but in-memory ones in a
+    'MeteredQueuePool', sized by 'SQLALCHEMY_ENGINE_OPTIONS', in-memory ones
+    keeping their single connection. Applies the SQLite profile selected by
+    'SQLITE_PROFILE' to the connections of the SQLite engines, and only to
+    them.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        super(Database, self).apply_driver_hacks(app, sa_url, options)
+        if options.get("poolclass") is not StaticPool:
+            # Flask-SQLAlchemy opens a new SQLite connection per checkout
+            options["poolclass"] = MeteredQueuePool
+        if sa_url.drivername.startswith("sqlite"):
+            # Pooled connections are used by one thread at a time, but not
+            # always the same one
+            options.setdefault("connect_args", {})["check_same_thread"] = \
+                False
+            profile = app.config["SQLITE_PROFILE"]
+            options["sqlite_pragmas"] = app.config["SQLITE_PROFILES"][profile]
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=Session, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop("sqlite_pragmas", None)
+        if engine_opts.get("poolclass") is StaticPool:
+            # An in-memory database lives in its single connection, which the
+            # sizes of 'SQLALCHEMY_ENGINE_OPTIONS', set afterwards, are not for
+            for name in QUEUE_POOL_OPTIONS:
+                engine_opts.pop(name, None)
+        engine = super(Database, self).create_engine(sa_url, engine_opts)
+        if pragmas:
+            event.listen(
+                engine, "connect", partial(set_sqlite_pragmas, pragmas))
+        return engine
+
+
+db = Database()
+ma = Marshmallow()
+
+
 def create_app() -> Flask:
     """ Constructs the core applications
 
@@ -30,6 +88,15 @@ def create_app() -> Flask:
     db.init_app(app)
 
     with app.app_context():
-        from fiches_urgence import routes, models, schemas  # noqa: F401
-        db.create_all()
+        from fiches_urgence import (  # noqa: F401
+            routes, models, schemas, schema_version, search, upgrades, cli
+        )
+        from fiches_urgence.cache import reference_cache
+        from fiches_urgence.metrics import request_metrics
+        from fiches_urgence.profiling import request_profiler
+        reference_cache.init_app(app)
+        request_metrics.init_app(app)
+        request_profiler.init_app(app)
+        app.cli.add_command(cli.import_command)
+        schema_version.ensure_schema()
         return app
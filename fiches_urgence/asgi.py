@@ -0,0 +1,169 @@
+""" ASGI entry point, serving the routes of the application from a bounded
+pool of threads so that the event loop of the server never blocks.
+
+Usage:
+    uvicorn --factory fiches_urgence.asgi:create_asgi_app --port 5000
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Tuple
+
+from flask import Flask
+from fiches_urgence import create_app
+
+#     _   ___  ___ ___
+#    /_\ / __|/ __|_ _|
+#   / _ \\__ \ (_ || |
+#  /_/ \_\___/\___|___|
+
+Receive = Callable[[], Awaitable[dict]]
+Send = Callable[[dict], Awaitable[None]]
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """ Translates the scope of an ASGI HTTP request to a WSGI environ """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ[name] = value
+        elif name != "CONTENT_LENGTH":
+            key = "HTTP_" + name
+            environ[key] = environ[key] + "," + value \
+                if key in environ else value
+    return environ
+
+
+class WsgiToAsgi(object):
+    """ Serves a WSGI application to an ASGI server.
+
+    Each request runs on a pool of 'max_threads' threads, body included, so
+    that a slow request only holds one of them while the other requests go
+    on. Requests arriving while every thread is busy wait for one. Bodies of
+    streamed responses are sent as they are produced, the thread waiting
+    for each chunk to be sent before producing the next one.
+    """
+
+    def __init__(self, wsgi_app: Callable, max_threads: int):
+        self.wsgi_app = wsgi_app
+        self.max_threads = max_threads
+        self.executor = ThreadPoolExecutor(
+            max_threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope: dict, receive: Receive, send: Send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"unsupported ASGI scope {scope['type']}")
+
+    async def lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope: dict, receive: Receive, send: Send):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        environ = build_environ(scope, b"".join(chunks))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self.executor, self.run, environ, loop, send)
+
+    def run(self, environ: dict, loop: asyncio.AbstractEventLoop,
+            send: Send):
+        """ Runs the WSGI application in a thread of the pool """
+        response = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]],
+                           exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+
+        def send_sync(message: dict):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def send_start():
+            status, headers = response
+            send_sync({
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [
+                    (name.lower().encode("latin1"), value.encode("latin1"))
+                    for name, value in headers
+                ]
+            })
+
+        started = False
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    send_start()
+                    started = True
+                send_sync({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True
+                })
+            if not started:
+                send_start()
+            send_sync({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+def asgi_app(app: Flask) -> WsgiToAsgi:
+    """ Wraps a Flask application in an ASGI application running its views
+    on at most 'ASGI_MAX_THREADS' threads
+    """
+    return WsgiToAsgi(app, app.config["ASGI_MAX_THREADS"])
+
+
+def create_asgi_app() -> WsgiToAsgi:
+    """ Constructs the core application, served through ASGI
+
+    Returns:
+        WsgiToAsgi: an ASGI application
+    """
+    return asgi_app(create_app())
@@ -0,0 +1,199 @@
+import json
+import re
+from typing import Any, Tuple
+
+from flask import current_app
+from werkzeug.exceptions import HTTPException
+from fiches_urgence import db, sheets
+from fiches_urgence.cache import reference_cache
+from fiches_urgence.exceptions import InvalidRequestException
+
+#   ____    _  _____ ____ _   _
+#  | __ )  / \|_   _/ ___| | | |
+#  |  _ \ / _ \ | || |   | |_| |
+#  | |_) / ___ \| || |___|  _  |
+#  |____/_/   \_\_| \____|_| |_|
+
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+# A field of the response of an earlier operation, as '${name.field}'
+REFERENCE = re.compile(r"\$\{(\w+)\.(\w+)\}")
+
+
+def check_operations(operations: list, max_operations: int):
+    """ Checks the shape of every operation before any of them runs
+
+    Raises:
+        InvalidRequestException: If an operation is malformed, or there are
+            too many of them.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidRequestException("expected a list of operations")
+    if len(operations) > max_operations:
+        raise InvalidRequestException(
+            f"at most {max_operations} operations are accepted")
+
+    names = set()
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise InvalidRequestException(
+                f"operation {index} is not an object")
+        if operation.get("method") not in METHODS:
+            raise InvalidRequestException(
+                f"operation {index} has no method among {', '.join(METHODS)}")
+        path = operation.get("path")
+        if not isinstance(path, str) or not path.startswith("/"):
+            raise InvalidRequestException(f"operation {index} has no path")
+        if path.split("?")[0].rstrip("/") == "/batch":
+            raise InvalidRequestException(
+                f"operation {index} is a batch itself")
+        if not isinstance(operation.get("headers", {}), dict):
+            raise InvalidRequestException(
+                f"operation {index} has invalid headers")
+
+        name = operation.get("ref")
+        if name is not None:
+            if not isinstance(name, str) or not name.isidentifier() or \
+                    name in names:
+                raise InvalidRequestException(
+                    f"operation {index} has an invalid or duplicate ref")
+            names.add(name)
+
+
+def resolve(value: Any, results: dict) -> Any:
+    """ Replaces the references to the responses of earlier operations in
+    'value'. A string which is a single reference is replaced by the value
+    referenced, whatever its type, references within a longer string by
+    their text.
+
+    Raises:
+        InvalidRequestException: If a reference names no earlier operation,
+            or no field of its response.
+    """
+    def lookup(match: re.Match) -> Any:
+        name, field = match.groups()
+        result = results.get(name)
+        if not isinstance(result, dict) or field not in result:
+            raise InvalidRequestException(
+                f"{match.group(0)} refers to no earlier response")
+        return result[field]
+
+    if isinstance(value, str):
+        whole = REFERENCE.fullmatch(value)
+        if whole:
+            return lookup(whole)
+        return REFERENCE.sub(lambda match: str(lookup(match)), value)
+    if isinstance(value, dict):
+        return {key: resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, results) for item in value]
+    return value
+
+
+def begin_transaction():
+    """ Opens the transaction of the session in the database right away.
+    pysqlite defers BEGIN to the first write, so a SAVEPOINT issued before
+    would start, and its release commit, a transaction of its own.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite" and \
+            not connection.connection.in_transaction:
+        connection.execute("BEGIN")
+
+
+def dispatch(method: str, path: str, body: Any,
+             headers: dict) -> Tuple[int, Any]:
+    """ Runs one operation through the view of its route, within the
+    application context, and so the session, of the batch
+
+    Returns:
+        Tuple[int, Any]: the status code and the decoded body of the
+        response
+    """
+    app = current_app._get_current_object()
+    with app.test_request_context(
+        path, method=method, json=body, headers=headers
+    ):
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as err:
+            return err.code, {"message": err.description}
+        data = response.get_data(as_text=True)
+
+    if not data:
+        return response.status_code, None
+    if response.is_json:
+        return response.status_code, json.loads(data)
+    return response.status_code, data
+
+
+def run_batch(operations: list, max_operations: int) -> Tuple[int, dict]:
+    """ Runs 'operations' in order against the routes of the application,
+    in a single transaction: each of them in a savepoint, and every write is
+    committed once the last one succeeded, or none is.
+
+    Each operation is an object with a 'method', a 'path', and optionally a
+    'body', 'headers', and a 'ref' naming it so that the fields of its
+    response can be used in the path, body or headers of the next ones as
+    '${name.field}'.
+
+    Args:
+        operations (list): the operations to run
+        max_operations (int): the number of operations accepted
+    Returns:
+        Tuple[int, dict]: the HTTP status code, and the response of every
+        operation run, with the index of the one which failed if any
+    Raises:
+        InvalidRequestException: If an operation is malformed.
+    """
+    check_operations(operations, max_operations)
+
+    session = db.session()
+    begin_transaction()
+    session.info["batch"] = True
+    results, named = [], {}
+    try:
+        for index, operation in enumerate(operations):
+            try:
+                path, body, headers = resolve([
+                    operation["path"],
+                    operation.get("body"),
+                    operation.get("headers", {})
+                ], named)
+            except InvalidRequestException as err:
+                status, response = err.status_code, {"message": err.message}
+            else:
+                savepoint = session.begin_nested()
+                status, response = dispatch(
+                    operation["method"], path, body, headers)
+                if savepoint.is_active:
+                    if status < 400:
+                        savepoint.commit()
+                    else:
+                        savepoint.rollback()
+
+            results.append({"status": status, "body": response})
+            if status >= 400:
+                return status, abort(index, results)
+            if operation.get("ref"):
+                named[operation["ref"]] = response
+    finally:
+        session.info.pop("batch", None)
+
+    session.commit()
+    return 200, {"results": results}
+
+
+def abort(index: int, results: list) -> dict:
+    """ Rolls back every operation of a batch after one of them failed """
+    db.session.rollback()
+    # Entries may have been built from the rows rolled back by earlier reads
+    # of the batch, and tagged with the versions which are left unchanged
+    if len(results) > 1:
+        reference_cache.clear()
+        sheets.cache.clear()
+    return {
+        "message": f"Operation {index} failed, no operation was applied",
+        "failed": index,
+        "results": results
+    }
@@ -0,0 +1,193 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+from flask import current_app
+from marshmallow import ValidationError
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from src import ids
+from fiches_urgence import db, ma
+from fiches_urgence.cache import reference_cache
+from fiches_urgence.exceptions import InvalidRequestException
+
+#   ____  _   _ _     _  __
+#  | __ )| | | | |   | |/ /
+#  |  _ \| | | | |   | ' /
+#  | |_) | |_| | |___| . \
+#  |____/ \___/|_____|_|\_\
+
+# Maximum number of values bound to a single 'IN' clause
+IN_CLAUSE_SIZE = 500
+
+# Number of commits attempted when generated ids collide with existing ones
+ID_ALLOCATION_ATTEMPTS = 3
+
+# Validation errors of a batch, by index of the faulty row
+RowErrors = Dict[int, Dict[str, List[str]]]
+
+
+def existing_values(column: db.Column, values: Iterable) -> Set:
+    """ Selects which of the given 'values' are present in 'column'
+
+    Args:
+        column (db.Column): the column to look the values up in
+        values (Iterable): the values to look up
+    Returns:
+        Set: the values found in the column
+    """
+    values = list(set(values))
+    found = set()
+
+    for start in range(0, len(values), IN_CLAUSE_SIZE):
+        chunk = values[start:start + IN_CLAUSE_SIZE]
+        found.update(
+            value for value, in
+            db.session.query(column).filter(column.in_(chunk))
+        )
+
+    return found
+
+
+def check_references(
+    model: db.Model,
+    items: List[db.Model],
+    generated: Set[int] = frozenset()
+) -> RowErrors:
+    """ Checks, with one query per foreign key, that the rows referenced by
+    'items' exist and that none of their given ids is already taken, so that
+    a faulty row is reported by its index instead of failing the whole insert.
+
+    Args:
+        model (db.Model): the type of the items
+        items (List[db.Model]): the items about to be inserted
+        generated (Set[int], optional): indexes of the items whose id was
+            allocated by the server, collisions are handled on commit instead
+    Returns:
+        RowErrors: the errors found, by index of the item
+    """
+    errors = {}
+
+    def add_error(index: int, field: str, message: str):
+        errors.setdefault(index, {}).setdefault(field, []).append(message)
+
+    seen = {}
+    for index, item in enumerate(items):
+        if item.id in seen:
+            add_error(index, "id", f"Duplicate of row {seen[item.id]}.")
+        seen.setdefault(item.id, index)
+
+    given = [id for id, index in seen.items() if index not in generated]
+    for taken in existing_values(model.id, given):
+        add_error(seen[taken], "id", f"{taken} already exists.")
+
+    for foreign_key in model.__table__.foreign_keys:
+        field = foreign_key.parent.key
+        values = {
+            getattr(item, field) for item in items
+            if getattr(item, field) is not None
+        }
+        missing = values - existing_values(foreign_key.column, values)
+
+        for index, item in enumerate(items):
+            if getattr(item, field) in missing:
+                add_error(
+                    index, field, f"{getattr(item, field)} does not exist.")
+
+    return errors
+
+
+def commit_new_items(
+    model: db.Model,
+    items: List[db.Model],
+    generated: List[db.Model] = ()
+):
+    """ Adds 'items' to the session and commits them. If the commit fails
+    because an id allocated by the server is already taken, the colliding
+    ids are reallocated and the commit is retried.
+
+    Args:
+        model (db.Model): the type of the items
+        items (List[db.Model]): the items to insert
+        generated (List[db.Model], optional): the items whose id was
+            allocated by the server. Defaults to none
+    Raises:
+        InvalidRequestException: If the insert breaks any other constraint,
+            such as a reference to a missing row or a given id taken.
+        IntegrityError: If allocated ids still collide after
+            ID_ALLOCATION_ATTEMPTS commits.
+    """
+    for attempt in range(1, ID_ALLOCATION_ATTEMPTS + 1):
+        db.session.add_all(items)
+        try:
+            db.session.commit()
+            return
+        except IntegrityError as err:
+            db.session.rollback()
+            taken = existing_values(
+                model.id, [item.id for item in generated])
+            if not taken:
+                raise InvalidRequestException(
+                    f"rejected by the database, {err.orig}")
+            if attempt == ID_ALLOCATION_ATTEMPTS:
+                raise
+
+            colliding = [item for item in generated if item.id in taken]
+            for item, id in zip(colliding, ids.new_ids(len(colliding))):
+                item.id = id
+
+
+def bulk_create(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    payloads: list,
+    new_id: bool = True
+) -> Tuple[List[str], RowErrors]:
+    """ Validates every payload of a batch with 'schema' and, when they are
+    all valid, inserts them in a single transaction. Rows sharing the same
+    columns are sent to the DB as one executemany statement by the flush.
+
+    Args:
+        model (db.Model): the type of rows expected
+        schema (ma.SQLAlchemyAutoSchema): the schema to deserialize your
+        rows with
+        payloads (list): attributes and values of each item to create
+        new_id (bool, optional): whether to generate an id for every item,
+            ignoring the given ones. Defaults to True, ids are generated
+            anyway for items coming without one
+    Returns:
+        Tuple[List[str], RowErrors]: the ids of the created items, or the
+        errors by index of the faulty payloads in which case nothing is
+        inserted
+    Raises:
+        InvalidRequestException: If 'payloads' is not a list of objects or
+        is too large.
+    """
+    if not isinstance(payloads, list) or not payloads:
+        raise InvalidRequestException("a non-empty list is expected")
+    if len(payloads) > current_app.config["BULK_MAX_ITEMS"]:
+        raise InvalidRequestException(
+            f"at most {current_app.config['BULK_MAX_ITEMS']} items "
+            "can be created at once", 413)
+    if not all(isinstance(payload, dict) for payload in payloads):
+        raise InvalidRequestException("every item should be an object")
+
+    generated = {
+        index for index, payload in enumerate(payloads)
+        if not payload.get("id") or new_id
+    }
+    for index, id in zip(sorted(generated), ids.new_ids(len(generated))):
+        payloads[index]["id"] = id
+
+    try:
+        items = schema.load(payloads, many=True)
+    except ValidationError as err:
+        return [], err.messages
+
+    errors = check_references(model, items, generated)
+    if errors:
+        return [], errors
+
+    commit_new_items(model, items, [items[index] for index in generated])
+    # Read from the identity keys, which do not expire with the commit
+    created_ids = [inspect(item).identity[0] for item in items]
+    reference_cache.invalidate(model, created_ids)
+    return created_ids, {}
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+from flask import Flask
+from fiches_urgence import db, ma, serializers
+from fiches_urgence.models import City, HealthMutual
+from fiches_urgence.versions import versions
+
+#    ____    _    ____ _   _ _____
+#   / ___|  / \  / ___| | | | ____|
+#  | |     / _ \| |   | |_| |  _|
+#  | |___ / ___ \ |___|  _  | |___
+#   \____/_/   \_\____|_| |_|_____|
+
+# Maximum number of values bound to a single 'IN' clause
+IN_CLAUSE_SIZE = 500
+
+
+class ReferenceCache(object):
+    """ Read-through LRU cache of serialized reference rows, cities and
+    health mutuals, which almost never change but are read by every resident.
+
+    Entries are dropped by the generic write helpers when their row changes,
+    expire after a TTL, and are ignored as soon as any write on their table
+    is committed, whatever path it went through.
+    """
+
+    def __init__(
+        self,
+        models: Iterable[db.Model],
+        max_entries: int = 10000,
+        ttl: float = 300.0
+    ):
+        self.models = frozenset(models)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app: Flask):
+        self.max_entries = app.config["REFERENCE_CACHE_MAX_ENTRIES"]
+        self.ttl = app.config["REFERENCE_CACHE_TTL"]
+
+    def is_reference(self, model: db.Model) -> bool:
+        return model in self.models
+
+    # Entries are keyed by (table, row id or None for collections, variant)
+
+    def _lookup(self, key: tuple) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires, version, value = entry
+        if expires < time.monotonic() or version != versions.get(key[:1]):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: tuple, version: tuple, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_load(
+        self,
+        model: db.Model,
+        id: str,
+        variant: Hashable,
+        load: Callable[[], Any]
+    ) -> Any:
+        """ Gets a value computed from the rows of 'model' from the cache, or
+        computes it with 'load' and caches it.
+
+        Args:
+            model (db.Model): the model the value is computed from
+            id (str): the id of the row the value is computed from, None if
+                it is computed from the whole table
+            variant (Hashable): whatever else the value depends on
+            load (Callable[[], Any]): computes the value from the DB
+        Returns:
+            Any: the value, None values are not cached
+        """
+        key = (model.__tablename__, id, variant)
+        # Read before loading, a write committed meanwhile makes it stale
+        version = versions.get(key[:1])
+
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = load()
+        if value is not None:
+            with self._lock:
+                self._store(key, version, value)
+        return value
+
+    def get_item(
+        self,
+        model: db.Model,
+        id: str,
+        schema: ma.SQLAlchemyAutoSchema
+    ) -> dict:
+        """ Gets the row of 'model' with given 'id' serialized by 'schema'
+
+        Returns:
+            dict: the serialized row, None if there is no such row
+        """
+        def load():
+            item = model.query.get(id)
+            return serializers.dump(schema, item) if item else None
+
+        return self.get_or_load(model, id, schema, load)
+
+    def prefetch(
+        self,
+        model: db.Model,
+        ids: Iterable[str],
+        schema: ma.SQLAlchemyAutoSchema
+    ):
+        """ Loads every row of 'ids' missing from the cache in one query, so
+        that serializing many objects referencing them costs no more.
+        """
+        table = model.__tablename__
+        version = versions.get((table,))
+
+        with self._lock:
+            missing = [
+                id for id in set(ids)
+                if id is not None
+                and self._lookup((table, id, schema)) is None
+            ]
+            self.misses += len(missing)
+
+        for start in range(0, len(missing), IN_CLAUSE_SIZE):
+            items = model.query.filter(
+                model.id.in_(missing[start:start + IN_CLAUSE_SIZE]))
+            loaded = [(item.id, serializers.dump(schema, item))
+                      for item in items]
+            with self._lock:
+                for id, value in loaded:
+                    self._store((table, id, schema), version, value)
+
+    def invalidate(self, model: db.Model, ids: Iterable[str] = None):
+        """ Drops the entries computed from the rows of 'model' with given
+        'ids', and the ones computed from the whole table. Every entry of the
+        table is dropped when 'ids' is None.
+        """
+        if not self.is_reference(model):
+            return
+
+        table = model.__tablename__
+        ids = None if ids is None else set(ids) | {None}
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == table and (ids is None or key[1] in ids):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+
+reference_cache = ReferenceCache((City, HealthMutual))
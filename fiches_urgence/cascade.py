@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import Table, case, func, not_, null, or_, select
+from sqlalchemy.sql import Select
+from fiches_urgence import db
+from fiches_urgence.models import Resident
+
+#    ____    _    ____   ____    _    ____  _____
+#   / ___|  / \  / ___| / ___|  / \  |  _ \| ____|
+#  | |     / _ \ \___ \| |     / _ \ | | | |  _|
+#  | |___ / ___ \ ___) | |___ / ___ \| |_| | |___
+#   \____/_/   \_\____/ \____/_/   \_\____/|_____|
+
+# Optional references, set to NULL when the row they point to is deleted.
+# The rows of any other foreign key are deleted along with the row they
+# depend on.
+SET_NULL = (
+    Resident.__table__.c.cityId,
+    Resident.__table__.c.healthMutualId,
+    Resident.__table__.c.referringDoctorId,
+    Resident.__table__.c.psychiatristId,
+)
+
+# Affected rows, by table name, as {"deleted": {...}, "updated": {...}}
+Counts = Dict[str, Dict[str, int]]
+
+# The ids of the rows deleted from a table, as given or as a subquery
+Ids = Union[List[str], Select]
+
+
+class CascadePlan(object):
+    """ Statements deleting rows with given 'ids' of a table and every row
+    depending on them, one DELETE and at most one UPDATE per table, each
+    selecting its rows with subqueries on the rows deleted from the tables
+    it references rather than with their ids.
+
+    Writes are ordered from the dependent tables to the referenced ones, so
+    that each runs while the rows its subqueries select from are still
+    there.
+    """
+
+    def __init__(self, table: Table, ids: List[str]):
+        self.table = table
+        self.ids = ids
+        self._conditions = {}
+
+    def condition(self, table: Table) -> Optional[object]:
+        """ Builds the clause selecting the rows of 'table' to delete
+
+        Returns:
+            Optional[object]: the clause, None if no row is deleted
+        """
+        if table in self._conditions:
+            return self._conditions[table]
+
+        if table is self.table:
+            clause = table.c.id.in_(self.ids)
+        else:
+            clauses = []
+            for foreign_key in table.foreign_keys:
+                if foreign_key.parent in SET_NULL:
+                    continue
+                ids = self.deleted_ids(foreign_key.column.table)
+                if ids is not None:
+                    clauses.append(foreign_key.parent.in_(ids))
+            clause = or_(*clauses) if clauses else None
+
+        self._conditions[table] = clause
+        return clause
+
+    def deleted_ids(self, table: Table) -> Optional[Ids]:
+        if table is self.table:
+            return self.ids
+        clause = self.condition(table)
+        if clause is None:
+            return None
+        return select([table.c.id]).where(clause)
+
+    def nulled(self, table: Table) -> dict:
+        """ Lists the optional references of 'table' to deleted rows
+
+        Returns:
+            dict: the ids deleted, by referencing column
+        """
+        nulled = {}
+        for foreign_key in table.foreign_keys:
+            if foreign_key.parent in SET_NULL:
+                ids = self.deleted_ids(foreign_key.column.table)
+                if ids is not None:
+                    nulled[foreign_key.parent] = ids
+        return nulled
+
+    def update_clause(self, table: Table, nulled: dict) -> object:
+        clause = or_(*(column.in_(ids) for column, ids in nulled.items()))
+        deleted = self.condition(table)
+        if deleted is not None:
+            clause = clause & not_(deleted)
+        return clause
+
+    def steps(self) -> list:
+        """ Lists the writes to run, in order, as (kind, table, clause,
+        values) where kind is "deleted" or "updated", and values are the
+        ones an update sets
+        """
+        steps = []
+        for table in reversed(db.metadata.sorted_tables):
+            nulled = self.nulled(table)
+            if nulled:
+                values = {
+                    column.key: case([(column.in_(ids), null())],
+                                     else_=column)
+                    for column, ids in nulled.items()
+                }
+                if "version" in table.c:
+                    values["version"] = table.c.version + 1
+                steps.append((
+                    "updated", table, self.update_clause(table, nulled),
+                    values
+                ))
+
+            deleted = self.condition(table)
+            if deleted is not None:
+                steps.append(("deleted", table, deleted, None))
+        return steps
+
+    def counts(self) -> Counts:
+        """ Counts the rows the writes would delete or update, without
+        writing anything
+        """
+        counts = {"deleted": {}, "updated": {}}
+        for kind, table, clause, values in self.steps():
+            count = db.session.execute(
+                select([func.count()]).select_from(table).where(clause)
+            ).scalar()
+            if count:
+                counts[kind][table.name] = count
+        return counts
+
+    def execute(self) -> Counts:
+        """ Runs the writes in the transaction of the session
+
+        Returns:
+            Counts: the rows deleted or updated
+        """
+        counts = {"deleted": {}, "updated": {}}
+        for kind, table, clause, values in self.steps():
+            if kind == "deleted":
+                statement = table.delete().where(clause)
+            else:
+                statement = table.update().where(clause).values(**values)
+            count = db.session.execute(statement).rowcount
+            if count:
+                counts[kind][table.name] = count
+        return counts
+
+
+def delete_cascade(
+    model: db.Model,
+    ids: List[str],
+    dry_run: bool = False
+) -> Counts:
+    """ Deletes the rows of 'model' with given 'ids', the rows depending on
+    them, and clears the optional references to them, with one set-based
+    statement per table in the transaction of the session. The caller
+    commits, or rolls back.
+
+    Args:
+        model (db.Model): the type of rows to delete
+        ids (List[str]): the ids of the rows
+        dry_run (bool, optional): only count the rows affected. Defaults to
+            False
+    Returns:
+        Counts: the rows deleted and updated, by table, tables without any
+        left out
+    """
+    plan = CascadePlan(model.__table__, list(ids))
+    if dry_run:
+        return plan.counts()
+    return plan.execute()
@@ -0,0 +1,215 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from fiches_urgence import bulk, db, ma, schemas
+from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    ContributionRelationship,
+    City,
+    Contributor,
+    HealthMutual
+)
+
+#    ____ _     ___
+#   / ___| |   |_ _|
+#  | |   | |    | |
+#  | |___| |___ | |
+#   \____|_____|___|
+
+
+# Model and name of the schema of each resource
+RESOURCES = {
+    "persons": (Person, "person_schema"),
+    "residents": (Resident, "resident_schema"),
+    "cities": (City, "city_schema"),
+    "contributors": (Contributor, "contributor_schema"),
+    "health-mutuals": (HealthMutual, "health_mutual_schema"),
+    "emergency-relationships": (
+        EmergencyRelationship, "emergency_relationship_schema"),
+    "contribution-relationships": (
+        ContributionRelationship, "contribution_relationship_schema")
+}
+
+
+def read_rows(path: str, file_format: str) -> Iterator[dict]:
+    """ Reads a CSV file with a header line, or a NDJSON file, row by row.
+    Empty CSV cells are read as null values.
+
+    Args:
+        path (str): the path of the file
+        file_format (str): either 'csv' or 'ndjson'
+    Yields:
+        dict: attributes and values of each row
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            for row in csv.DictReader(file):
+                yield {
+                    key: value if value != "" else None
+                    for key, value in row.items()
+                }
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def read_checkpoint(checkpoint: str, path: str, resource: str) -> int:
+    """ Reads how many rows of 'path' were already imported
+
+    Returns:
+        int: the number of rows to skip, 0 if there is no matching checkpoint
+    """
+    if not os.path.exists(checkpoint):
+        return 0
+
+    with open(checkpoint) as file:
+        state = json.load(file)
+
+    if state.get("path") != path or state.get("resource") != resource:
+        return 0
+    return state["rows"]
+
+
+def write_checkpoint(checkpoint: str, path: str, resource: str, rows: int):
+    """ Records that the first 'rows' rows of 'path' are imported. The file
+    is replaced atomically so that a crash never leaves it half written.
+    """
+    temporary = f"{checkpoint}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"path": path, "resource": resource, "rows": rows}, file)
+    os.replace(temporary, checkpoint)
+
+
+def import_chunk(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    chunk: List[dict],
+    skip_invalid: bool
+) -> Tuple[List[str], bulk.RowErrors]:
+    """ Inserts the rows of a chunk, or with 'skip_invalid' the valid ones.
+    Rows are validated before their references are checked, so the rows
+    left after skipping the invalid ones are inserted again until none of
+    them is rejected.
+
+    Returns:
+        Tuple[List[str], bulk.RowErrors]: the ids of the inserted rows, and
+        the errors of every rejected one by index in the chunk
+    """
+    remaining = list(range(len(chunk)))
+    ids, errors = [], {}
+    while remaining:
+        ids, rejected = bulk.bulk_create(
+            model, schema, [chunk[index] for index in remaining],
+            new_id=False)
+        errors.update(
+            (remaining[index], messages)
+            for index, messages in rejected.items())
+        if not rejected or not skip_invalid:
+            break
+        remaining = [
+            index for position, index in enumerate(remaining)
+            if position not in rejected
+        ]
+    return ids, errors
+
+
+@click.command("import")
+@click.argument("resource", type=click.Choice(sorted(RESOURCES)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format", "file_format", type=click.Choice(["csv", "ndjson"]),
+    help="Format of the file, guessed from its extension by default.")
+@click.option(
+    "--chunk-size", default=1000, show_default=True,
+    help="Number of rows validated and committed at once.")
+@click.option(
+    "--checkpoint", type=click.Path(dir_okay=False),
+    help="File recording the progress, '<path>.checkpoint' by default.")
+@click.option(
+    "--restart", is_flag=True,
+    help="Ignore the checkpoint and import the file from its first row.")
+@click.option(
+    "--skip-invalid", is_flag=True,
+    help="Report and skip invalid rows instead of stopping on them.")
+@with_appcontext
+def import_command(
+    resource: str,
+    path: str,
+    file_format: str,
+    chunk_size: int,
+    checkpoint: str,
+    restart: bool,
+    skip_invalid: bool
+):
+    """ Imports the rows of a CSV or NDJSON file as RESOURCE items.
+
+    Rows are validated with the schemas of the API and inserted by chunks,
+    each in its own transaction. Ids given in the file are kept so that rows
+    of other files can reference them. An interrupted import resumes after
+    the last committed chunk.
+    """
+    model, schema_name = RESOURCES[resource]
+    schema = getattr(schemas, schema_name)
+    path = os.path.abspath(path)
+    file_format = file_format or (
+        "csv" if path.lower().endswith(".csv") else "ndjson")
+    checkpoint = checkpoint or f"{path}.checkpoint"
+
+    if not 0 < chunk_size <= current_app.config["BULK_MAX_ITEMS"]:
+        raise click.BadParameter(
+            f"should be between 1 and {current_app.config['BULK_MAX_ITEMS']}",
+            param_hint="--chunk-size")
+
+    done = 0 if restart else read_checkpoint(checkpoint, path, resource)
+    if done:
+        click.echo(f"Resuming after row {done}")
+
+    rows = islice(read_rows(path, file_format), done, None)
+    imported = skipped = 0
+    start = time.perf_counter()
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        try:
+            ids, errors = import_chunk(model, schema, chunk, skip_invalid)
+        except InvalidRequestException as err:
+            raise click.ClickException(err.message)
+
+        for index, messages in sorted(errors.items()):
+            click.echo(f"Row {done + index + 1}: {messages}", err=True)
+        if errors and not skip_invalid:
+            raise click.ClickException(
+                f"Invalid rows, nothing imported after row {done}")
+
+        done += len(chunk)
+        imported += len(ids)
+        skipped += len(chunk) - len(ids)
+        write_checkpoint(checkpoint, path, resource, done)
+
+        elapsed = time.perf_counter() - start
+        click.echo(
+            f"{done} rows read, {imported} imported "
+            f"({imported / elapsed:.0f} rows/s)")
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Imported {imported} {resource} in {elapsed:.2f}s "
+        f"({imported / elapsed if elapsed else 0:.0f} rows/s), "
+        f"{skipped} skipped")
@@ -6,6 +6,69 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'db_instances', 'data.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connections kept open, extra ones opened under load, seconds a request
+    # waits for one before failing, seconds after which one is reopened, and
+    # whether one is tested before being handed out
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT') or 30),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 3600),
+        'pool_pre_ping':
+            (os.environ.get('DB_POOL_PRE_PING') or 'false').lower() == 'true'
+    }
+    PAGINATION_DEFAULT_LIMIT = 100
+    PAGINATION_MAX_LIMIT = 1000
+    BULK_MAX_ITEMS = 5000
+    BATCH_MAX_OPERATIONS = 100
+    STREAM_CHUNK_SIZE = 500
+    REFERENCE_CACHE_MAX_ENTRIES = 10000
+    REFERENCE_CACHE_TTL = 300
+    SEARCH_DEFAULT_LIMIT = 20
+    SEARCH_MAX_LIMIT = 100
+
+    # Address of 'fiches_urgence.server', its workers, and requests served
+    # by a worker before it is replaced, plus up to the jitter
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '127.0.0.1'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 5000)
+    SERVER_WORKERS = int(
+        os.environ.get('SERVER_WORKERS') or os.cpu_count() or 1)
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS') or 10000)
+    SERVER_MAX_REQUESTS_JITTER = int(
+        os.environ.get('SERVER_MAX_REQUESTS_JITTER') or 1000)
+
+    # Threads running the requests served through 'fiches_urgence.asgi'
+    ASGI_MAX_THREADS = int(os.environ.get('ASGI_MAX_THREADS') or 8)
+
+    # Requests sent with 'X-Profile: 1' or '?profile=1' are profiled when
+    # enabled, and their profiles saved to the directory, which keeps the
+    # most recent ones only
+    PROFILING_ENABLED = \
+        (os.environ.get('PROFILING_ENABLED') or 'false').lower() == 'true'
+    PROFILING_DIR = os.environ.get('PROFILING_DIR') or \
+        os.path.join(basedir, 'profiles')
+    PROFILING_MAX_CAPTURES = int(
+        os.environ.get('PROFILING_MAX_CAPTURES') or 50)
+
+    # Pragmas applied to every new SQLite connection. 'tuned' lets readers
+    # run alongside a writer (WAL), waits for locks instead of failing at
+    # once, and only syncs to disk at checkpoints, which WAL keeps safe
+    # against corruption but may lose the last commits on a power failure
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE') or 'tuned'
+    SQLITE_PROFILES = {
+        'default': {
+            'foreign_keys': 'ON'
+        },
+        'tuned': {
+            'foreign_keys': 'ON',
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -64000,
+            'mmap_size': 268435456,
+            'temp_store': 'MEMORY'
+        }
+    }
 
 
 class ConfigTest:
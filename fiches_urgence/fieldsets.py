@@ -0,0 +1,72 @@
+from functools import lru_cache
+from typing import FrozenSet, Optional
+
+from fiches_urgence import ma
+from fiches_urgence.exceptions import InvalidRequestException
+
+#   ___ ___ ___ _    ___  ___ ___ _____ ___
+#  | __|_ _| __| |  |   \/ __| __|_   _/ __|
+#  | _| | || _|| |__| |) \__ \ _|  | | \__ \
+#  |_| |___|___|____|___/|___/___| |_| |___/
+
+# Maximum number of distinct projections of the schemas kept at once
+MAX_PROJECTIONS = 256
+
+
+def fields_arg(args: dict) -> Optional[FrozenSet[str]]:
+    """ Reads the 'fields' parameter of a request, a comma separated list of
+    the fields to serialize. Fields of nested objects are prefixed with the
+    name of their relation, e.g. '?fields=id,person.lastName,city.name'.
+
+    Args:
+        args (dict): the query string parameters of the request
+    Returns:
+        Optional[FrozenSet[str]]: the requested fields, None when every field
+        is requested
+    Raises:
+        InvalidRequestException: If 'fields' is empty.
+    """
+    value = args.get("fields")
+    if value is None:
+        return None
+
+    names = frozenset(
+        name.strip() for name in value.split(",") if name.strip())
+    if not names:
+        raise InvalidRequestException("fields should not be empty")
+    return names
+
+
+@lru_cache(maxsize=MAX_PROJECTIONS)
+def _project(
+    schema: ma.SQLAlchemyAutoSchema,
+    names: FrozenSet[str]
+) -> ma.SQLAlchemyAutoSchema:
+    return type(schema)(only=names, many=schema.many)
+
+
+def project(
+    schema: ma.SQLAlchemyAutoSchema,
+    names: Optional[FrozenSet[str]]
+) -> ma.SQLAlchemyAutoSchema:
+    """ Gets the instance of the class of 'schema' serializing only the given
+    fields. Instances are built once per set of fields, so that neither they
+    nor their compiled dumpers are rebuilt on each request.
+
+    Args:
+        schema (ma.SQLAlchemyAutoSchema): the schema serializing every field
+        names (Optional[FrozenSet[str]]): the fields to serialize, None for
+            all of them
+    Returns:
+        ma.SQLAlchemyAutoSchema: the projected schema, 'schema' itself when
+        every field is requested
+    Raises:
+        InvalidRequestException: If a field is not one of the schema.
+    """
+    if names is None:
+        return schema
+
+    try:
+        return _project(schema, names)
+    except ValueError as err:
+        raise InvalidRequestException(str(err))
@@ -0,0 +1,169 @@
+import datetime
+import re
+from typing import Any, List, Tuple
+
+from werkzeug.datastructures import MultiDict
+from fiches_urgence import db
+from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    ContributionRelationship,
+    City,
+    Contributor,
+    HealthMutual
+)
+
+#   ___ ___ _  _____ ___ ___  ___
+#  | __|_ _| ||_   _| __| _ \/ __|
+#  | _| | || |__| | | _||   /\__ \
+#  |_| |___|____|_| |___|_|_\|___/
+
+# A column rows are ordered by, and whether the order is descending
+SortKey = Tuple[db.Column, bool]
+
+# Columns clients may filter the collections of each model on
+FILTERABLE = {
+    Person: ("firstName", "lastName"),
+    Resident: (
+        "cityId",
+        "healthMutualId",
+        "referringDoctorId",
+        "psychiatristId",
+        "entranceDate",
+        "birthDate",
+        "birthplace"
+    ),
+    City: ("name", "postalCode"),
+    HealthMutual: ("name",),
+    Contributor: ("role",),
+    EmergencyRelationship: ("personId", "relationship"),
+    ContributionRelationship: ("contributorId", "socialAdvising")
+}
+
+# Columns clients may sort the collections of each model by, besides 'id'
+SORTABLE = {
+    Person: ("firstName", "lastName"),
+    Resident: ("entranceDate", "birthDate"),
+    City: ("name", "postalCode"),
+    HealthMutual: ("name",)
+}
+
+OPERATORS = {
+    "eq": lambda column, value: column == value,
+    "ne": lambda column, value: column != value,
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "in": lambda column, values: column.in_(values),
+    "null": lambda column, value: column.is_(None) if value
+    else column.isnot(None)
+}
+
+# Parameters of the collection routes which are not filters
+RESERVED = frozenset(
+    ("limit", "cursor", "stream", "fields", "sort", "profile"))
+
+_PARAMETER = re.compile(r"^(\w+)(?:\[(\w+)\])?$")
+
+
+def parse_bool(raw: str) -> bool:
+    try:
+        return {"true": True, "false": False}[raw.lower()]
+    except KeyError:
+        raise InvalidRequestException(f"{raw} is not a boolean")
+
+
+def parse_value(column: db.Column, raw: Any) -> Any:
+    """ Converts a value read from a query string or a cursor to the type of
+    'column'.
+
+    Raises:
+        InvalidRequestException: If 'raw' is not a value of the column.
+    """
+    if raw is None or not isinstance(raw, str):
+        return raw
+
+    python_type = column.type.python_type
+    try:
+        if python_type is datetime.date:
+            return datetime.date.fromisoformat(raw)
+        if python_type is bool:
+            return parse_bool(raw)
+        return python_type(raw)
+    except ValueError:
+        raise InvalidRequestException(
+            f"{raw} is not a valid value for {column.key}")
+
+
+def _column(model: db.Model, name: str, allowed: dict) -> db.Column:
+    if name != "id" and name not in allowed.get(model, ()):
+        raise InvalidRequestException(f"cannot filter or sort on {name}")
+    return model.__table__.c[name]
+
+
+def filter_args(model: db.Model, args: MultiDict) -> list:
+    """ Translates the filters of a request into SQL criteria on the
+    whitelisted columns of 'model', e.g. '?cityId=X' or
+    '?entranceDate[gte]=2020-01-01'. Supported operators are 'eq', 'ne',
+    'gt', 'gte', 'lt', 'lte', 'in' with comma separated values and 'null'.
+
+    Args:
+        model (db.Model): the type of rows of the collection
+        args (MultiDict): the query string parameters of the request
+    Returns:
+        list: the criteria to pass to 'query.filter'
+    Raises:
+        InvalidRequestException: If a filter is malformed or targets a column
+            which is not whitelisted.
+    """
+    criteria = []
+
+    for parameter, raw in args.items(multi=True):
+        if parameter in RESERVED:
+            continue
+
+        match = _PARAMETER.match(parameter)
+        if match is None:
+            raise InvalidRequestException(f"malformed filter {parameter}")
+        name, operator = match.group(1), match.group(2) or "eq"
+        if operator not in OPERATORS:
+            raise InvalidRequestException(f"unknown operator {operator}")
+
+        column = _column(model, name, FILTERABLE)
+        if operator == "in":
+            value = [parse_value(column, item) for item in raw.split(",")]
+        elif operator == "null":
+            value = parse_bool(raw)
+        else:
+            value = parse_value(column, raw)
+        criteria.append(OPERATORS[operator](column, value))
+
+    return criteria
+
+
+def sort_args(model: db.Model, args: dict) -> List[SortKey]:
+    """ Reads the 'sort' parameter of a request, a comma separated list of
+    whitelisted columns of 'model', descending when prefixed with '-', e.g.
+    '?sort=-entranceDate,birthDate'.
+
+    Args:
+        model (db.Model): the type of rows of the collection
+        args (dict): the query string parameters of the request
+    Returns:
+        List[SortKey]: the requested order, empty when none is requested
+    Raises:
+        InvalidRequestException: If a column is not whitelisted.
+    """
+    keys = []
+
+    for name in args.get("sort", "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        descending = name.startswith("-")
+        keys.append((_column(model, name.lstrip("-+"), SORTABLE), descending))
+
+    return keys
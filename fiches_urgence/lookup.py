@@ -0,0 +1,134 @@
+from sqlalchemy import literal, null, or_, select, union_all
+from fiches_urgence import db, schemas, serializers
+from fiches_urgence.cache import reference_cache
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    City,
+    HealthMutual
+)
+
+#   _    ___   ___  _  ___   _ ___
+#  | |  / _ \ / _ \| |/ / | | | _ \
+#  | |_| (_) | (_) | ' <| |_| |  _/
+#  |____\___/ \___/|_|\_\\___/|_|
+
+# Tables a lookup is built from
+TABLES = tuple(sorted(model.__tablename__ for model in (
+    Resident,
+    Person,
+    City,
+    HealthMutual,
+    EmergencyRelationship
+)))
+
+
+def _owned_by(model: db.Model, number: str):
+    return or_(model.mainPhoneE164 == number,
+               model.alternativePhoneE164 == number)
+
+
+def links_statement(number: str):
+    """ Builds the statement finding, through the indexes, the persons and
+    health mutuals with given phone number and the residents they are linked
+    to. Each row is (kind, owner id, resident id, role, relationship), the
+    resident columns are NULL on the rows of the owners themselves.
+
+    Args:
+        number (str): the phone number, in E.164 format
+    """
+    persons = select([Person.id]).where(_owned_by(Person, number))
+    mutuals = select([HealthMutual.id]).where(_owned_by(HealthMutual, number))
+
+    def row(kind, owner_id, resident_id, role, relationship):
+        return select([
+            literal(kind).label("kind"),
+            owner_id.label("ownerId"),
+            resident_id.label("residentId"),
+            role.label("role"),
+            relationship.label("relationship")
+        ])
+
+    return union_all(
+        row("person", Person.id, null(), null(), null()).where(
+            _owned_by(Person, number)),
+        row("healthMutual", HealthMutual.id, null(), null(), null()).where(
+            _owned_by(HealthMutual, number)),
+        row(
+            "person",
+            EmergencyRelationship.personId,
+            EmergencyRelationship.residentId,
+            literal("emergencyContact"),
+            EmergencyRelationship.relationship
+        ).where(EmergencyRelationship.personId.in_(persons)),
+        row(
+            "person", Resident.referringDoctorId, Resident.id,
+            literal("referringDoctor"), null()
+        ).where(Resident.referringDoctorId.in_(persons)),
+        row(
+            "person", Resident.psychiatristId, Resident.id,
+            literal("psychiatrist"), null()
+        ).where(Resident.psychiatristId.in_(persons)),
+        row(
+            "healthMutual", Resident.healthMutualId, Resident.id,
+            literal("healthMutual"), null()
+        ).where(Resident.healthMutualId.in_(mutuals))
+    )
+
+
+def lookup_phone(number: str) -> dict:
+    """ Finds out who is calling from a phone number: the persons and health
+    mutuals with this number, each with the residents it is linked to, and
+    these residents.
+
+    Args:
+        number (str): the phone number, in E.164 format
+    Returns:
+        dict: the serialized persons, health mutuals and residents
+    """
+    links = {"person": {}, "healthMutual": {}}
+    resident_ids = set()
+
+    for kind, owner_id, resident_id, role, relationship in db.session.execute(
+        links_statement(number)
+    ):
+        owner_links = links[kind].setdefault(owner_id, [])
+        if resident_id is None:
+            continue
+        resident_ids.add(resident_id)
+        link = {"residentId": resident_id, "role": role}
+        if relationship is not None:
+            link["relationship"] = relationship
+        owner_links.append(link)
+
+    # The rows themselves are fetched by primary key
+    persons = []
+    if links["person"]:
+        persons = serializers.dump(schemas.persons_schema, Person.query.filter(
+            Person.id.in_(links["person"])).order_by(Person.id))
+    for person in persons:
+        person["links"] = links["person"][person["id"]]
+
+    mutuals = []
+    for mutual_id in sorted(links["healthMutual"]):
+        mutual = reference_cache.get_item(
+            HealthMutual, mutual_id, schemas.health_mutual_schema)
+        if mutual is not None:
+            mutuals.append(
+                dict(mutual, links=links["healthMutual"][mutual_id]))
+
+    residents = []
+    if resident_ids:
+        items = Resident.query.options(
+            *schemas.residents_schema.loader_options()
+        ).filter(Resident.id.in_(resident_ids)).order_by(Resident.id).all()
+        schemas.residents_schema.prefetch_references(items)
+        residents = serializers.dump(schemas.residents_schema, items)
+
+    return {
+        "number": number,
+        "persons": persons,
+        "healthMutuals": mutuals,
+        "residents": residents
+    }
@@ -0,0 +1,201 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Iterable, Tuple
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#   __  __ ___ _____ ___ ___ ___ ___
+#  |  \/  | __|_   _| _ \_ _/ __/ __|
+#  | |\/| | _|  | | |   /| | (__\__ \
+#  |_|  |_|___| |_| |_|_\___\___|___/
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the buckets of the histograms, '+Inf' being implied
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Route label of the requests which matched no route, so that the paths
+# of 404s do not make the number of series grow unbounded
+UNMATCHED = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"") \
+        .replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"'
+             for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """ Counts events per set of label values """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, values: Tuple[str, ...], amount: float = 1):
+        """ Not thread-safe, called under the lock of the registry """
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, total in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labels, values)} " \
+                f"{_number(total)}"
+
+
+class Histogram(object):
+    """ Distribution of observed values per set of label values, counted in
+    cumulative buckets as Prometheus expects them.
+    """
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...],
+                 buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._bounds = [_number(bound) for bound in buckets] + ["+Inf"]
+        # Label values to [count of each bucket and +Inf, sum]
+        self._values = {}
+
+    def observe(self, values: Tuple[str, ...], value: float):
+        """ Not thread-safe, called under the lock of the registry """
+        series = self._values.get(values)
+        if series is None:
+            series = self._values[values] = \
+                [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, (counts, total) in sorted(self._values.items()):
+            cumulated = 0
+            labels = _labels(self.labels, values)
+            prefix = f"{self.name}_bucket{labels[:-1]}," if labels \
+                else f"{self.name}_bucket{{"
+            for bound, count in zip(self._bounds, counts):
+                cumulated += count
+                yield f'{prefix}le="{bound}"}} {cumulated}'
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulated}"
+
+
+class RequestMetrics(object):
+    """ Records the latency, status and size of the responses of every route
+    of an application, and the number and duration of the SQL statements
+    each request runs, to expose them in the Prometheus text format.
+
+    Requests are recorded once their response is built, so the body of a
+    streamed response is neither timed nor measured. Statements are timed
+    from the cursor events of every engine, and attributed to the request
+    of the thread running them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        route = ("method", "route")
+        self.requests = Counter(
+            "http_requests_total",
+            "Requests handled, per route and status code.",
+            route + ("status",))
+        self.latency = Histogram(
+            "http_request_duration_seconds",
+            "Time spent building the responses.",
+            route, LATENCY_BUCKETS)
+        self.sizes = Histogram(
+            "http_response_size_bytes",
+            "Size of the bodies of the responses of known length.",
+            route, SIZE_BUCKETS)
+        self.queries = Histogram(
+            "sql_queries_per_request",
+            "SQL statements run per request.",
+            route, QUERY_BUCKETS)
+        self.sql_time = Histogram(
+            "sql_duration_seconds",
+            "Time spent running SQL statements per request.",
+            route, LATENCY_BUCKETS)
+        self.metrics = (
+            self.requests, self.latency, self.sizes, self.queries,
+            self.sql_time)
+
+    def init_app(self, app: Flask):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        if not event.contains(
+                Engine, "before_cursor_execute", self.before_cursor_execute):
+            event.listen(
+                Engine, "before_cursor_execute", self.before_cursor_execute)
+            event.listen(
+                Engine, "after_cursor_execute", self.after_cursor_execute)
+            event.listen(Engine, "handle_error", self.handle_error)
+
+    def before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_time = 0.0
+
+    def after_request(self, response: Response) -> Response:
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+
+        rule = request.url_rule
+        values = (request.method, rule.rule if rule else UNMATCHED)
+        size = response.calculate_content_length()
+        with self._lock:
+            self.requests.inc(values + (str(response.status_code),))
+            self.latency.observe(values, elapsed)
+            if size is not None:
+                self.sizes.observe(values, size)
+            self.queries.observe(values, g.metrics_queries)
+            self.sql_time.observe(values, g.metrics_sql_time)
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        start = conn.info["metrics_start"].pop()
+        if has_request_context() and "metrics_start" in g:
+            g.metrics_queries += 1
+            g.metrics_sql_time += time.perf_counter() - start
+
+    def handle_error(self, context):
+        # A failed statement is not followed by 'after_cursor_execute'
+        starts = context.connection.info.get("metrics_start") \
+            if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def expose(self) -> str:
+        """ Renders every metric in the Prometheus text format """
+        with self._lock:
+            lines = [line for metric in self.metrics
+                     for line in metric.expose()]
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
@@ -1,5 +1,7 @@
+from sqlalchemy import event
+from sqlalchemy.ext.declarative import declared_attr
+from src import phones
 from fiches_urgence import db
-from fiches_urgence.exceptions import InvalidRequestException
 
 #   __  __  ___  ____  _____ _     ____
 #  |  \/  |/ _ \|  _ \| ____| |   / ___|
@@ -9,27 +11,47 @@ from fiches_urgence.exceptions import InvalidRequestException
 
 
 class ModelMixin(object):
-
-    def update(self: db.Model, new_values: dict) -> db.Model:
-        """ Updates an object with new values.
-
-        Args:
-            new_values (dict): New values to update the object with
-        Returns:
-            db.Model: the updated db.Model object
-        Raises:
-            InvalidRequestException: If there is key 'id' in 'new_values'.
+    # Counts the writes on each row, checked and bumped by every UPDATE of
+    # the ORM, so that a client can tell which version it is writing over
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    @declared_attr
+    def __mapper_args__(cls) -> dict:
+        return {"version_id_col": cls.version}
+
+
+class PhoneNumbersMixin(object):
+    """ Keeps an indexed E.164 copy of the free-text phone numbers of a row,
+    refreshed whenever the row is flushed, to find who is calling.
+    """
+    mainPhoneE164 = db.Column(db.String, index=True)
+    alternativePhoneE164 = db.Column(db.String, index=True)
+
+    # Derived columns, neither serialized nor accepted from clients
+    DERIVED_COLUMNS = ("mainPhoneE164", "alternativePhoneE164")
+    # Free-text columns and their derived copies
+    PHONE_COLUMNS = {
+        "mainPhoneNumber": "mainPhoneE164",
+        "alternativePhoneNumber": "alternativePhoneE164"
+    }
+
+    def normalize_phone_numbers(self):
+        for column, derived in self.PHONE_COLUMNS.items():
+            setattr(self, derived, phones.to_e164(getattr(self, column)))
+
+    @classmethod
+    def derived_values(cls, values: dict) -> dict:
+        """ Computes the derived columns to write along with 'values', for
+        statements bypassing the ORM
         """
-        if new_values.get("id"):
-            raise InvalidRequestException("Forbidden to update id............")
-
-        for attr, value in new_values.items():
-            self.__setattr__(attr, value)
-
-        return self
+        return {
+            derived: phones.to_e164(values[column])
+            for column, derived in cls.PHONE_COLUMNS.items()
+            if column in values
+        }
 
 
-class Person(ModelMixin, db.Model):
+class Person(PhoneNumbersMixin, ModelMixin, db.Model):
     id = db.Column(db.String, primary_key=True)
     firstName = db.Column(db.String, index=True, nullable=False)
     lastName = db.Column(db.String, index=True, nullable=False)
@@ -89,7 +111,7 @@ class Contributor(ModelMixin, db.Model):
     )
 
 
-class HealthMutual(ModelMixin, db.Model):
+class HealthMutual(PhoneNumbersMixin, ModelMixin, db.Model):
     id = db.Column(db.String, primary_key=True)
     name = db.Column(db.String, index=True)
     address = db.Column(db.String, index=True)
@@ -105,6 +127,15 @@ class HealthMutual(ModelMixin, db.Model):
 
 
 class Resident(ModelMixin, db.Model):
+    # Collections are filtered on these columns and paginated by id, or
+    # sorted by the dates and paginated by (date, id)
+    __table_args__ = (
+        db.Index("ix_resident_cityId_id", "cityId", "id"),
+        db.Index("ix_resident_healthMutualId_id", "healthMutualId", "id"),
+        db.Index("ix_resident_entranceDate_id", "entranceDate", "id"),
+        db.Index("ix_resident_birthDate_id", "birthDate", "id"),
+    )
+
     id = db.Column(db.String, db.ForeignKey('person.id'), primary_key=True)
 
     birthDate = db.Column(db.Date)
@@ -118,9 +149,9 @@ class Resident(ModelMixin, db.Model):
     healthMutualId = db.Column(
         db.String, db.ForeignKey('health_mutual.id'), nullable=True)
     referringDoctorId = db.Column(
-        db.String, db.ForeignKey('person.id'), nullable=True)
+        db.String, db.ForeignKey('person.id'), nullable=True, index=True)
     psychiatristId = db.Column(
-        db.String, db.ForeignKey('person.id'), nullable=True)
+        db.String, db.ForeignKey('person.id'), nullable=True, index=True)
 
     emergencyRelationships = db.relationship(
         'EmergencyRelationship',
@@ -134,15 +165,23 @@ class Resident(ModelMixin, db.Model):
 
 class EmergencyRelationship(ModelMixin, db.Model):
     id = db.Column(db.String, primary_key=True)
-    residentId = db.Column(db.String, db.ForeignKey('resident.id'))
-    personId = db.Column(db.String, db.ForeignKey('person.id'))
+    residentId = db.Column(
+        db.String, db.ForeignKey('resident.id'), index=True)
+    personId = db.Column(db.String, db.ForeignKey('person.id'), index=True)
     relationship = db.Column(db.String)
 
 
 class ContributionRelationship(ModelMixin, db.Model):
     id = db.Column(db.String, primary_key=True)
     contributorId = db.Column(db.String, db.ForeignKey(
-        'contributor.id'))
+        'contributor.id'), index=True)
     socialAdvising = db.Column(db.Boolean)
     residentId = db.Column(db.String, db.ForeignKey(
-        'resident.id'))
+        'resident.id'), index=True)
+
+
+@event.listens_for(db.session, "before_flush")
+def receive_before_flush(session, flush_context, instances):
+    for item in session.new | session.dirty:
+        if isinstance(item, PhoneNumbersMixin):
+            item.normalize_phone_numbers()
@@ -0,0 +1,220 @@
+import base64
+import binascii
+import datetime
+import json
+from typing import List, Optional, Tuple
+
+from flask import current_app, request
+from sqlalchemy import and_, false, or_
+from werkzeug.urls import url_encode
+from fiches_urgence import db
+from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.filters import SortKey, parse_value
+
+#   ____   _    ____ ___ _   _    _  _____ ___ ___  _   _
+#  |  _ \ / \  / ___|_ _| \ | |  / \|_   _|_ _/ _ \| \ | |
+#  | |_) / _ \| |  _ | ||  \| | / _ \ | |  | | | | |  \| |
+#  |  __/ ___ \ |_| || || |\  |/ ___ \| |  | | |_| | |\  |
+#  |_| /_/   \_\____|___|_| \_/_/   \_\_| |___\___/|_| \_|
+
+
+def encode_cursor(values: list) -> str:
+    """ Encodes the keyset values of the last row of a page into an opaque
+    cursor.
+
+    Args:
+        values (list): the keyset values of the last row of the page
+    Returns:
+        str: an url-safe opaque cursor
+    """
+    values = [
+        value.isoformat() if isinstance(value, datetime.date) else value
+        for value in values
+    ]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """ Decodes a cursor generated by 'encode_cursor'.
+
+    Args:
+        cursor (str): the opaque cursor passed by the client
+    Returns:
+        list: the keyset values of the last row of the previous page
+    Raises:
+        InvalidRequestException: If the cursor is malformed.
+    """
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, binascii.Error):
+        raise InvalidRequestException("malformed cursor")
+
+    if not isinstance(values, list) or not values:
+        raise InvalidRequestException("malformed cursor")
+
+    return values
+
+
+def page_args(args: dict) -> Tuple[Optional[int], Optional[list]]:
+    """ Reads the 'limit' and 'cursor' pagination parameters of a request.
+
+    Args:
+        args (dict): the query string parameters of the request
+    Returns:
+        Tuple[Optional[int], Optional[list]]: the page size and the decoded
+        cursor, (None, None) when the client did not ask for a page
+    Raises:
+        InvalidRequestException: If 'limit' or 'cursor' is invalid.
+    """
+    limit = args.get("limit")
+    cursor = args.get("cursor")
+
+    if limit is None and cursor is None:
+        return None, None
+
+    if limit is None:
+        limit = current_app.config["PAGINATION_DEFAULT_LIMIT"]
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise InvalidRequestException("limit should be an integer")
+        if limit < 1:
+            raise InvalidRequestException("limit should be positive")
+
+    limit = min(limit, current_app.config["PAGINATION_MAX_LIMIT"])
+
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def order_clauses(keys: List[SortKey]) -> list:
+    """ Builds the 'ORDER BY' clauses of the given sort keys """
+    return [
+        column.desc() if descending else column.asc()
+        for column, descending in keys
+    ]
+
+
+def after(keys: List[SortKey], values: list):
+    """ Builds the criterion selecting the rows coming after the row with
+    given 'values' in the order of 'keys'. NULLs come first in ascending
+    order and last in descending order, as SQLite sorts them.
+
+    Args:
+        keys (List[SortKey]): the order of the rows, ending with a unique key
+        values (list): the values of 'keys' in the last row of a page
+    """
+    clauses = []
+    equal = []
+
+    for (column, descending), value in zip(keys, values):
+        if value is None:
+            greater = false() if descending else column.isnot(None)
+            same = column.is_(None)
+        else:
+            greater = column < value if descending else column > value
+            if descending and column.nullable:
+                greater = or_(greater, column.is_(None))
+            same = column == value
+        clauses.append(and_(*equal, greater))
+        equal.append(same)
+
+    # A range on the first key, implied by the criterion, lets the index
+    # on the keys be scanned from the cursor rather than from its start
+    (column, descending), value = keys[0], values[0]
+    if value is None:
+        bound = column.is_(None) if descending else None
+    elif descending:
+        bound = None if column.nullable else column <= value
+    else:
+        bound = column >= value
+
+    if bound is None:
+        return or_(*clauses)
+    return and_(bound, or_(*clauses))
+
+
+def cursor_values(keys: List[SortKey], cursor: Optional[list]) -> list:
+    """ Converts the values of a decoded cursor to the types of the columns
+    of 'keys'.
+
+    Raises:
+        InvalidRequestException: If the cursor was built for another order.
+    """
+    if not cursor:
+        return cursor
+    if len(cursor) != len(keys):
+        raise InvalidRequestException("cursor does not match sort")
+    return [
+        parse_value(column, value) for (column, _), value in zip(keys, cursor)
+    ]
+
+
+def paginate(
+    query: db.Query,
+    keys: List[SortKey],
+    limit: int,
+    cursor: list = None
+) -> Tuple[List[db.Model], Optional[str]]:
+    """ Fetches one page of 'query' with a keyset range scan on 'keys'.
+
+    Args:
+        query (db.Query): the query to paginate
+        keys (List[SortKey]): the columns the pages are ordered by, the last
+            one being unique
+        limit (int): the maximum number of rows of the page
+        cursor (list, optional): the values of 'keys' in the last row of
+            the previous page, see 'cursor_values'. Defaults to None, in that
+            case the first page is fetched
+    Returns:
+        Tuple[List[db.Model], Optional[str]]: the rows of the page and the
+        cursor of the next page, None if this page is the last one
+    """
+    if cursor:
+        query = query.filter(after(keys, cursor))
+
+    # One more row than needed tells whether there is a next page
+    items = query.order_by(*order_clauses(keys)).limit(limit + 1).all()
+
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    return items, encode_cursor(
+        [getattr(items[-1], column.key) for column, _ in keys])
+
+
+def link_headers(next_cursor: Optional[str]) -> dict:
+    """ Builds the headers advertising the next page of the current request.
+
+    Args:
+        next_cursor (Optional[str]): the cursor of the next page
+    Returns:
+        dict: 'Link' and 'X-Next-Cursor' headers, empty on the last page
+    """
+    if not next_cursor:
+        return {}
+
+    args = request.args.to_dict(flat=False)
+    args["cursor"] = next_cursor
+    next_url = f"{request.base_url}?{url_encode(args)}"
+
+    return {
+        "Link": f'<{next_url}>; rel="next"',
+        "X-Next-Cursor": next_cursor
+    }
+
+
+def fetch_page(
+    query: db.Query,
+    keys: List[SortKey],
+    limit: int,
+    cursor: list = None
+) -> Tuple[List[db.Model], dict]:
+    """ Fetches one page of 'query' with 'paginate' and builds the headers
+    advertising the next one with 'link_headers'.
+    """
+    items, next_cursor = paginate(query, keys, limit, cursor)
+    return items, link_headers(next_cursor)
@@ -0,0 +1,148 @@
+from typing import Optional, Set
+
+from marshmallow import ValidationError
+from werkzeug.datastructures import ETags
+from werkzeug.http import quote_etag
+from fiches_urgence import db, ma
+from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.models import PhoneNumbersMixin
+
+#   ____   _  _____ ____ _   _ _____ ____
+#  |  _ \ / \|_   _/ ___| | | | ____/ ___|
+#  | |_) / _ \ | || |   | |_| |  _| \___ \
+#  |  __/ ___ \| || |___|  _  | |___ ___) |
+#  |_| /_/   \_\_| \____|_| |_|_____|____/
+
+# Columns never written from a payload, the derived ones aside
+PROTECTED_COLUMNS = ("id", "version")
+
+
+def row_etag(version: int, state: str) -> str:
+    """ Builds the strong entity tag of a single row, as '"<version>-<state>"'
+    where 'version' is the one of the row, checked by 'If-Match' on writes,
+    and 'state' the tag of everything else the response depends on, checked
+    by 'If-None-Match' on reads.
+
+    Args:
+        version (int): the version of the row
+        state (str): the tag of the tables and URL of the response, unquoted
+    Returns:
+        str: the entity tag, quoted
+    """
+    return quote_etag(f"{version}-{state}")
+
+
+def tag_version(tag: str) -> Optional[int]:
+    """ Reads the version of a row from an unquoted entity tag, either
+    built by 'row_etag' or the bare version
+
+    Returns:
+        Optional[int]: the version, None if the tag has none
+    """
+    version = tag.partition("-")[0]
+    return int(version) if version.isdigit() else None
+
+
+def tag_state(tag: str) -> Optional[str]:
+    """ Reads the state part of an unquoted entity tag built by 'row_etag' """
+    return tag.partition("-")[2] or None
+
+
+def expected_versions(if_match: ETags) -> Optional[Set[int]]:
+    """ Reads the versions of a row a client is willing to overwrite from
+    the 'If-Match' header, where each strong entity tag is the one the row
+    was sent with, or its bare 'version'.
+
+    Args:
+        if_match (ETags): the parsed 'If-Match' header
+    Returns:
+        Optional[Set[int]]: the versions expected, None if any version
+        is. Empty if none of the tags can be a version, so that nothing
+        matches.
+    """
+    if not if_match or if_match.star_tag:
+        return None
+    versions = (tag_version(tag) for tag in if_match.as_set())
+    return {version for version in versions if version is not None}
+
+
+def patchable_columns(model: db.Model) -> Set[str]:
+    derived = getattr(model, "DERIVED_COLUMNS", ())
+    return {
+        column.key for column in model.__table__.columns
+        if column.key not in PROTECTED_COLUMNS and column.key not in derived
+    }
+
+
+def patch_values(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    payload: dict
+) -> dict:
+    """ Validates a partial payload with 'schema' and translates it into the
+    values of the columns to write, derived columns included.
+
+    Args:
+        model (db.Model): the type of row patched
+        schema (ma.SQLAlchemyAutoSchema): the schema to validate the payload
+        with, only the fields present are required
+        payload (dict): the attributes and values to change
+    Returns:
+        dict: the new values, by column
+    Raises:
+        InvalidRequestException: If the payload is not an object, or has a
+            key 'id'.
+        ValidationError: If a field is invalid or is not a column of the
+            model.
+    """
+    if not isinstance(payload, dict):
+        raise InvalidRequestException("expected an object")
+    if "id" in payload:
+        raise InvalidRequestException("Forbidden to update id")
+
+    item = schema.load(payload, partial=True)
+    columns = patchable_columns(model)
+    unknown = sorted(name for name in payload if name not in columns)
+    if unknown:
+        raise ValidationError(
+            {name: ["Cannot be patched."] for name in unknown})
+
+    values = {name: getattr(item, name) for name in payload}
+    if issubclass(model, PhoneNumbersMixin):
+        values.update(model.derived_values(values))
+    return values
+
+
+def apply_patch(
+    model: db.Model,
+    id: str,
+    values: dict,
+    expected: Optional[Set[int]] = None
+) -> bool:
+    """ Writes 'values' on the row with given 'id' and bumps its version, in
+    a single 'UPDATE ... WHERE id = ? AND version IN (...)' statement run in
+    the transaction of the session. Nothing is read beforehand, so a
+    concurrent write between the read of the client and this one is noticed
+    by the database itself.
+
+    Args:
+        model (db.Model): the type of row patched
+        id (str): the id of the row
+        values (dict): the new values, by column
+        expected (Optional[Set[int]]): the versions the row may be at,
+            None for any
+    Returns:
+        bool: True if the row was written, False if it does not exist or is
+        at another version
+    """
+    if expected is not None and not expected:
+        return False
+
+    table = model.__table__
+    statement = table.update().where(table.c.id == id)
+    if expected is not None:
+        statement = statement.where(table.c.version.in_(sorted(expected)))
+
+    result = db.session.execute(
+        statement.values(version=table.c.version + 1, **values))
+    return result.rowcount == 1
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool, QueuePool
+
+#   ___  ___   ___  _
+#  | _ \/ _ \ / _ \| |
+#  |  _/ (_) | (_) | |__
+#  |_|  \___/ \___/|____|
+
+
+class PoolMetrics(object):
+    """ Thread-safe counters of the life of the connections of a pool,
+    collected from its events, and of the time spent waiting for them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def register(self, pool: Pool):
+        event.listen(pool, "connect", self.receive_connect)
+        event.listen(pool, "checkout", self.receive_checkout)
+        event.listen(pool, "checkin", self.receive_checkin)
+        event.listen(pool, "invalidate", self.receive_invalidate)
+
+    def receive_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def receive_checkout(self, dbapi_connection, connection_record,
+                         connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def receive_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def receive_invalidate(self, dbapi_connection, connection_record,
+                           exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def waited(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "waitSeconds": {
+                    "total": self.wait_total,
+                    "max": self.wait_max,
+                    "mean": self.wait_total / self.waits if self.waits else 0
+                }
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """ Queue pool timing how long each checkout waits for a connection,
+    either for one to be checked in or for a new one to be opened.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MeteredQueuePool, self).__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self.metrics.register(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super(MeteredQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            self.metrics.waited(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.waited(time.perf_counter() - start)
+        return connection
+
+    def stats(self) -> dict:
+        """ Live state of the pool along with its metrics """
+        return {
+            "size": self.size(),
+            "checkedIn": self.checkedin(),
+            "checkedOut": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "maxOverflow": self._max_overflow,
+            **self.metrics.stats()
+        }
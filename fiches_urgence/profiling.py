@@ -0,0 +1,180 @@
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import List
+
+from flask import Flask, Response, g, request
+
+#   ___ ___  ___  ___ ___ _    ___ _  _  ___
+#  | _ \ _ \/ _ \| __|_ _| |  |_ _| \| |/ __|
+#  |  _/   / (_) | _| | || |__ | || .` | (_ |
+#  |_| |_|_\\___/|_| |___|____|___|_|\_|\___|
+
+# Frames kept per allocation site, and sites and functions summarized
+TRACEMALLOC_FRAMES = 10
+TOP_ENTRIES = 25
+
+
+class RequestProfiler(object):
+    """ Profiles the requests asking for it with the 'X-Profile' header or
+    the 'profile' query parameter, when 'PROFILING_ENABLED' is set.
+
+    The request runs under cProfile while tracemalloc traces its
+    allocations. The profile is saved to 'PROFILING_DIR' as a '.prof' file
+    readable by 'pstats' or snakeviz, along with a '.json' summary of its
+    slowest functions and largest allocation sites. Only one request is
+    profiled at a time, since tracemalloc traces the whole process. When
+    profiling is disabled, no hook is registered.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.max_captures = 50
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask):
+        if not app.config["PROFILING_ENABLED"]:
+            return
+        self.directory = app.config["PROFILING_DIR"]
+        self.max_captures = app.config["PROFILING_MAX_CAPTURES"]
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def requested(self) -> bool:
+        value = request.headers.get("X-Profile") or request.args.get("profile")
+        return value in ("1", "true")
+
+    def before_request(self):
+        if not self.requested() or not self._lock.acquire(blocking=False):
+            return
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        g.profile_request = request._get_current_object()
+        g.profile = cProfile.Profile()
+        g.profile_start = time.perf_counter()
+        g.profile.enable()
+
+    def after_request(self, response: Response) -> Response:
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+
+        profile.disable()
+        try:
+            duration = time.perf_counter() - g.pop("profile_start")
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            self._lock.release()
+
+        name = self.save(profile, snapshot, {
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": response.status_code,
+            "duration": duration,
+            "peakMemory": peak
+        })
+        response.headers["X-Profile-Capture"] = name
+        return response
+
+    def teardown_request(self, exception: BaseException = None):
+        # Requests run by 'POST /batch' share the 'g' of the batch, whose
+        # profile is left running
+        if g.get("profile_request") is not request._get_current_object():
+            return
+
+        # Releases the profiler when no response was built
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile.disable()
+            tracemalloc.stop()
+            self._lock.release()
+
+    def save(
+        self,
+        profile: cProfile.Profile,
+        snapshot: tracemalloc.Snapshot,
+        capture: dict
+    ) -> str:
+        """ Writes a profile and the summary of a capture, then drops the
+        oldest captures beyond 'max_captures'.
+
+        Returns:
+            str: the name of the capture
+        """
+        name = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path + ".prof")
+
+        output = io.StringIO()
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats("cumulative").print_stats(TOP_ENTRIES)
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        allocations = [
+            {
+                "site": str(stat.traceback[0]),
+                "size": stat.size,
+                "count": stat.count
+            }
+            for stat in snapshot.statistics("lineno")[:TOP_ENTRIES]
+        ]
+
+        with open(path + ".json", "w") as summary:
+            json.dump({
+                "name": name,
+                "createdAt": time.time(),
+                **capture,
+                "allocations": allocations,
+                "profile": output.getvalue()
+            }, summary)
+
+        for old in self.names()[self.max_captures:]:
+            for extension in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, old + extension))
+                except FileNotFoundError:
+                    pass
+        return name
+
+    def names(self) -> List[str]:
+        """ Names of the captures, the most recent first """
+        if not self.enabled:
+            return []
+        return sorted(
+            (entry[:-5] for entry in os.listdir(self.directory)
+             if entry.endswith(".json")),
+            reverse=True)
+
+    def captures(self) -> List[dict]:
+        """ Lists the captures, the most recent first, without their profile
+        and with their five largest allocation sites only
+        """
+        listing = []
+        for name in self.names():
+            try:
+                with open(os.path.join(self.directory, name + ".json")) as f:
+                    capture = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            capture.pop("profile")
+            capture["allocations"] = capture["allocations"][:5]
+            listing.append(capture)
+        return listing
+
+
+request_profiler = RequestProfiler()
@@ -1,11 +1,33 @@
+from typing import Optional, Tuple
 from flask import request, Response
+from werkzeug.http import quote_etag
+from sqlalchemy import inspect
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.exc import IntegrityError
 from marshmallow import ValidationError
-from src import utils
+from src import ids, phones, utils
 from flask import current_app as app
-from fiches_urgence import db, ma
+from fiches_urgence import (
+    db,
+    ma,
+    batch,
+    bulk,
+    cascade,
+    fieldsets,
+    filters,
+    lookup,
+    pagination,
+    patches,
+    schemas,
+    search,
+    serializers,
+    sheets,
+    versions
+)
+from fiches_urgence.cache import reference_cache
 from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.metrics import request_metrics, CONTENT_TYPE
+from fiches_urgence.profiling import request_profiler
 from fiches_urgence.models import (
     Resident,
     Person,
@@ -15,15 +37,6 @@ from fiches_urgence.models import (
     Contributor,
     HealthMutual
 )
-from fiches_urgence.schemas import (
-    resident_schema, residents_schema,
-    person_schema, persons_schema,
-    city_schema, cities_schema,
-    contributor_schema, contributors_schema,
-    emergency_relationship_schema, emergencyRelationships_schema,
-    contribution_relationship_schema, contribution_relationships_schema,
-    health_mutual_schema, health_mutuals_schema
-)
 #      _    ____ ___
 #     / \  |  _ \_ _|
 #    / _ \ | |_) | |
@@ -33,20 +46,143 @@ from fiches_urgence.schemas import (
 
 # Generic CRUD functions
 
-def get_collection(model: db.Model, schema: ma.SQLAlchemyAutoSchema) -> list:
+def wants_stream() -> bool:
+    """ Tells whether the client asked for a collection as a stream of
+    newline-delimited JSON rows, with '?stream=1' or through 'Accept'.
+    """
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+
+def not_modified(tables: tuple) -> Tuple[str, Optional[Response]]:
+    """ Tags the response to the current request with the versions of the
+    'tables' it is built from. When the client already holds that version,
+    the '304 Not Modified' answer is built at once, the versions being the
+    only query run.
+
+    Args:
+        tables (tuple): the tables the data of the response comes from
+    Returns:
+        Tuple[str, Optional[Response]]: the ETag of the response, and the
+        '304 Not Modified' response if the client's copy is still fresh
+    """
+    tag = versions.etag(tables, request.full_path, str(wants_stream()))
+    etag = quote_etag(tag, weak=True)
+    if request.if_none_match.contains_weak(tag):
+        return etag, utils.http_response(
+            utils.HTTPStatus.NOT_MODIFIED, None, {"ETag": etag})
+    return etag, None
+
+
+def item_not_modified(tables: tuple) -> Tuple[str, Optional[Response]]:
+    """ Tags the state of the response to the current request for a single
+    row, from the versions of the 'tables' it is built from, without the
+    version of the row itself which is only known once it is read. When the
+    client holds a tag of the row with that state, the '304 Not Modified'
+    answer is built at once, the versions being the only query run.
+
+    Args:
+        tables (tuple): the tables the data of the response comes from
+    Returns:
+        Tuple[str, Optional[Response]]: the state to build the ETag of the
+        response with, and the '304 Not Modified' response if the client's
+        copy is still fresh
+    """
+    state = versions.etag(tables, request.full_path)
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if patches.tag_state(tag) == state:
+            return state, utils.http_response(
+                utils.HTTPStatus.NOT_MODIFIED, None,
+                {"ETag": quote_etag(tag)})
+    return state, None
+
+
+def get_collection(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    query: db.Query = None
+) -> Response:
     """ Gets a list of rows of given 'model' in the DB and then
-    serializes it with the given 'schema'.
+    serializes it with the given 'schema'. When the request carries a 'limit'
+    or a 'cursor' parameter, only one page ordered by id is returned and the
+    next page is advertised through the 'Link' and 'X-Next-Cursor' headers.
+    Rows are streamed one JSON document per line when 'wants_stream'. Only
+    the fields listed by the 'fields' parameter are selected and serialized.
 
     Args:
         model (db.Model): the type of rows expected
         schema (ma.SQLAlchemyAutoSchema): the schema to serialize your model
         rows with
+        query (db.Query, optional): the query selecting the rows.
+            Defaults to None, in that case every row of 'model' is selected
     Returns:
         Response: HTTP status code and list of serialized rows in JSON
     """
-    items = model.query.all()
-    list_result = schema.dump(items)
-    return utils.http_response(utils.HTTPStatus.OK, list_result)
+    try:
+        schema = fieldsets.project(schema, fieldsets.fields_arg(request.args))
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    etag, response = not_modified(versions.schema_tables(schema))
+    if response:
+        return response
+
+    if query is None:
+        query = model.query
+    query = query.options(*schema.loader_options())
+
+    try:
+        limit, cursor = pagination.page_args(request.args)
+        query = query.filter(*filters.filter_args(model, request.args))
+        order = filters.sort_args(model, request.args)
+        # Pages are ordered by the requested columns, then by id in the
+        # same direction, so that one index on (column, id) serves both
+        keys = order + [
+            (model.__table__.c.id, bool(order) and order[-1][1])]
+        cursor = pagination.cursor_values(keys, cursor)
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    if limit is None and order:
+        query = query.order_by(*pagination.order_clauses(order))
+
+    headers = {"ETag": etag}
+
+    if wants_stream():
+        # Rows are fetched, serialized and sent by chunks, so that the whole
+        # collection is never held in memory
+        if limit is None:
+            items = query.yield_per(app.config["STREAM_CHUNK_SIZE"])
+        else:
+            items, links = pagination.fetch_page(
+                query, keys, limit, cursor)
+            headers.update(links)
+        return utils.ndjson_response(
+            utils.HTTPStatus.OK,
+            (serializers.dump(schema, item, many=False) for item in items),
+            headers
+        )
+
+    def load() -> Tuple[list, dict]:
+        if limit is None:
+            items, links = query.all(), {}
+        else:
+            items, links = pagination.fetch_page(
+                query, keys, limit, cursor)
+        schema.prefetch_references(items)
+        return serializers.dump(schema, items), links
+
+    if reference_cache.is_reference(model):
+        list_result, links = reference_cache.get_or_load(
+            model, None, (schema, request.full_path), load)
+    else:
+        list_result, links = load()
+
+    headers.update(links)
+    return utils.http_response(utils.HTTPStatus.OK, list_result, headers)
 
 
 def get_item_by_id(
@@ -67,11 +203,35 @@ def get_item_by_id(
         Response: HTTP status code and serialized row in JSON
     """
     try:
-        item = model.query.filter_by(id=id).one()
+        projected = fieldsets.project(
+            schema, fieldsets.fields_arg(request.args))
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    state, response = item_not_modified(versions.schema_tables(projected))
+    if response:
+        return response
+
+    if reference_cache.is_reference(model):
+        # The version is read from the whole row, which may not be projected
+        row = reference_cache.get_item(model, id, schema)
+        if row is None:
+            return {"message": f"{id} could not be found."}, 404
+        item_result = row if projected is schema else \
+            reference_cache.get_item(model, id, projected)
+        return utils.http_response(
+            utils.HTTPStatus.OK, item_result,
+            {"ETag": patches.row_etag(row["version"], state)})
+
+    try:
+        item = model.query.options(
+            *projected.loader_options()).filter_by(id=id).one()
     except NoResultFound:
         return {"message": f"{id} could not be found."}, 404
-    item_result = schema.dump(item)
-    return utils.http_response(utils.HTTPStatus.OK, item_result)
+    item_result = serializers.dump(projected, item)
+    return utils.http_response(
+        utils.HTTPStatus.OK, item_result,
+        {"ETag": patches.row_etag(item.version, state)})
 
 
 def update_item_by_id(
@@ -80,8 +240,12 @@ def update_item_by_id(
     id: str
 ) -> Response:
     """Updates a single row with given 'id' of given 'model' in the DB and then
-    serializes it with the given 'schema'.
-    Tipycally for PUT or PATCH API methods
+    serializes it with the given 'schema'. The attributes given are validated
+    and written like the ones of a PATCH, in a single UPDATE bumping the
+    version of the row, the others are kept. When the request has an
+    'If-Match' header, the row is only updated if it is at one of the versions
+    given.
+    Tipycally for PUT API methods
 
     Args:
         model (db.Model): the type of row expected
@@ -92,41 +256,99 @@ def update_item_by_id(
     Returns:
         Response: HTTP status code and serialized updated row in JSON
     """
+    return patch_item_by_id(model, schema, id)
+
+
+def patch_item_by_id(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    id: str
+) -> Response:
+    """ Changes some attributes of a single row with given 'id' of given
+    'model' in the DB, with a single UPDATE statement, and then serializes it
+    with the given 'schema'. When the request has an 'If-Match' header, the
+    row is only updated if it is at one of the versions given, by the ETag
+    the row was sent with.
+    Tipycally for PATCH API methods
+
+    Args:
+        model (db.Model): the type of row expected
+        schema (ma.SQLAlchemyAutoSchema): the schema to validate the
+        attributes and serialize your model row with
+        id (str): the id of the row expected to be updated
+
+    Returns:
+        Response: HTTP status code and serialized updated row in JSON, with
+        its new ETag
+    """
     payload = request.get_json()
 
     if not payload:
         return {"message": "No input data provided"}, 400
 
     try:
-        item = model.query.get(id)
-        item.update(payload)
-
+        values = patches.patch_values(model, schema, payload)
     except ValidationError as err:
-        db.session.rollback()
         return err.messages, 422
     except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    try:
+        written = patches.apply_patch(
+            model, id, values, patches.expected_versions(request.if_match))
+    except IntegrityError:
         db.session.rollback()
-        return err.message, err.status_code
+        return {"message": "Invalid request: unknown reference"}, 400
 
+    if not written:
+        found = db.session.query(model.id).filter_by(id=id).first()
+        db.session.rollback()
+        if found is None:
+            return {"message": f"{id} could not be found."}, 404
+        return {"message": f"{id} was modified meanwhile."}, 412
+
+    versions.pending_tables(db.session).add(model.__tablename__)
+    sheets.invalidate_statement(db.session, model, id, values)
+    item = model.query.options(
+        *schema.loader_options()).populate_existing().filter_by(id=id).one()
+    item_result = serializers.dump(schema, item)
     db.session.commit()
-    item_result = schema.dump(item)
-    return utils.http_response(utils.HTTPStatus.OK, item_result)
+    reference_cache.invalidate(model, [id])
+    # Tagged like the response to a GET of the row, once the versions of
+    # its tables are bumped
+    state = versions.etag(versions.schema_tables(schema), request.full_path)
+    return utils.http_response(
+        utils.HTTPStatus.OK, item_result,
+        {"ETag": patches.row_etag(item_result["version"], state)})
 
 
 def delete_item_by_id(model: db.Model, id: str) -> Response:
-    """ Deletes a single row with given 'id' of given 'model' in the DB
+    """ Deletes a single row with given 'id' of given 'model' in the DB, along
+    with the rows depending on it, and clears the optional references to it.
+    With a 'dryRun' query parameter, only counts the rows affected.
 
     Args:
         model (db.Model): the type of row expected
-        schema (ma.SQLAlchemyAutoSchema): the schema to serialize your model
-        row with
         id (str): the id of the row expected
 
     Returns:
-        Response: HTTP status code
+        Response: HTTP status code, and the rows affected by table in JSON
+        for a dry run
     """
-    model.query.filter_by(id=id).delete()
+    if request.args.get("dryRun") in ("1", "true"):
+        counts = cascade.delete_cascade(model, [id], dry_run=True)
+        db.session.rollback()
+        return utils.http_response(utils.HTTPStatus.OK, counts)
+
+    counts = cascade.delete_cascade(model, [id])
+    written = set(counts["deleted"]) | set(counts["updated"])
+    versions.pending_tables(db.session).update(written)
+    if written - {model.__tablename__}:
+        sheets.invalidate_all(db.session)
+    else:
+        sheets.invalidate_statement(db.session, model, id, ())
     db.session.commit()
+    reference_cache.invalidate(model, [id])
     return utils.http_response(utils.HTTPStatus.NO_CONTENT, None)
 
 
@@ -158,36 +380,112 @@ def create_new_item(
             if not payload:
                 return {"message": "No input data provided"}, 400
 
-        if not payload.get("id") or new_id:
-            payload["id"] = utils.random_id(8)
+        generated = not payload.get("id") or new_id
+        if generated:
+            payload["id"] = ids.new_id()
 
         # Validate and deserialize input
         item = schema.load(payload)
     except ValidationError as err:
         return err.messages, 422
 
-    db.session.add(item)
-    db.session.commit()
-    result = schema.dump(model.query.get(item.id))
+    try:
+        bulk.commit_new_items(model, [item], [item] if generated else [])
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+    reference_cache.invalidate(model, inspect(item).identity)
+    result = serializers.dump(schema, model.query.get(item.id))
     return utils.http_response(utils.HTTPStatus.CREATED, result)
 
 
+def create_new_items(
+    model: db.Model,
+    schema: ma.SQLAlchemyAutoSchema,
+    new_id: bool = True,
+    defaults: dict = None
+) -> Response:
+    """ Creates many rows of given 'model' in the DB in one transaction from
+    the list passed in request. Nothing is created if any item is invalid.
+    Tipycally for POST methods on '/bulk' routes
+
+    Args:
+        model (db.Model): the type of rows expected
+        schema (ma.SQLAlchemyAutoSchema): the schema to deserialize your
+        model rows with
+        new_id (bool, optional): whether to generate the ids of the items.
+            Defaults to True
+        defaults (dict, optional): Attributes and values set on every item.
+            Defaults to None
+    Returns:
+        Response: HTTP status code and ids of the new rows in JSON, or the
+        validation errors by index of the faulty items
+    """
+    payloads = request.get_json()
+
+    if not payloads:
+        return {"message": "No input data provided"}, 400
+
+    try:
+        if defaults and isinstance(payloads, list):
+            for payload in payloads:
+                if isinstance(payload, dict):
+                    payload.update(defaults)
+        created_ids, errors = bulk.bulk_create(
+            model, schema, payloads, new_id)
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    if errors:
+        return {"errors": errors}, 422
+    return utils.http_response(
+        utils.HTTPStatus.CREATED, {"ids": created_ids})
+
+
 # API routes
 
 @app.route("/persons", methods=["GET", "POST"])
 def person_collection() -> utils.Response:
     if request.method == "GET":
-        return get_collection(Person, persons_schema)
+        return get_collection(Person, schemas.persons_schema)
     if request.method == "POST":
-        return create_new_item(Person, person_schema)
+        return create_new_item(Person, schemas.person_schema)
+
+
+@app.route("/persons/bulk", methods=["POST"])
+def person_bulk() -> utils.Response:
+    return create_new_items(Person, schemas.person_schema)
+
+
+@app.route("/persons/search", methods=["GET"])
+def person_search() -> utils.Response:
+    """ Finds persons by the beginning of their names, as typed by an
+    operator, e.g. '/persons/search?q=jea dup&limit=10'
+    """
+    etag, response = not_modified((Person.__tablename__,))
+    if response is not None:
+        return response
+
+    try:
+        query, limit = search.search_args(request.args)
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+
+    persons = search.search_persons(query, limit)
+    return utils.http_response(
+        utils.HTTPStatus.OK,
+        serializers.dump(schemas.persons_schema, persons),
+        {"ETag": etag}
+    )
 
 
 @app.route("/persons/<string:id>", methods=["GET", "PUT", "PATCH", "DELETE"])
 def person_item(id: str) -> utils.Response:
     if request.method == "GET":
-        return get_item_by_id(Person, person_schema, id)
-    if request.method in ["PUT", "PATCH"]:
-        return update_item_by_id(Person, person_schema, id)
+        return get_item_by_id(Person, schemas.person_schema, id)
+    if request.method == "PUT":
+        return update_item_by_id(Person, schemas.person_schema, id)
+    if request.method == "PATCH":
+        return patch_item_by_id(Person, schemas.person_schema, id)
     if request.method == "DELETE":
         return delete_item_by_id(Person, id)
 
@@ -195,23 +493,25 @@ def person_item(id: str) -> utils.Response:
 @app.route("/residents", methods=["GET", "POST"])
 def resident_collection() -> utils.Response:
     if request.method == "GET":
-        return get_collection(Resident, residents_schema)
+        return get_collection(Resident, schemas.residents_schema)
     if request.method == "POST":
-        try:
-            return create_new_item(Resident, resident_schema, None, False)
-        except IntegrityError:
-            message = {
-                "message": "id attribute should be an existing person id"
-            }
-            return utils.http_response(utils.HTTPStatus.BAD_REQUEST, message)
+        return create_new_item(
+            Resident, schemas.resident_schema, None, False)
+
+
+@app.route("/residents/bulk", methods=["POST"])
+def resident_bulk() -> utils.Response:
+    return create_new_items(Resident, schemas.resident_schema, new_id=False)
 
 
 @app.route("/residents/<string:id>", methods=["GET", "PUT", "PATCH", "DELETE"])
 def resident_item(id: str) -> utils.Response:
     if request.method == "GET":
-        return get_item_by_id(Resident, resident_schema, id)
-    if request.method in ["PUT", "PATCH"]:
-        return update_item_by_id(Resident, resident_schema, id)
+        return get_item_by_id(Resident, schemas.resident_schema, id)
+    if request.method == "PUT":
+        return update_item_by_id(Resident, schemas.resident_schema, id)
+    if request.method == "PATCH":
+        return patch_item_by_id(Resident, schemas.resident_schema, id)
     if request.method == "DELETE":
         return delete_item_by_id(Resident, id)
 
@@ -219,17 +519,24 @@ def resident_item(id: str) -> utils.Response:
 @app.route("/cities", methods=["GET", "POST"])
 def cities_collection() -> utils.Response:
     if request.method == "GET":
-        return get_collection(City, cities_schema)
+        return get_collection(City, schemas.cities_schema)
     if request.method == "POST":
-        return create_new_item(City, city_schema)
+        return create_new_item(City, schemas.city_schema)
+
+
+@app.route("/cities/bulk", methods=["POST"])
+def city_bulk() -> utils.Response:
+    return create_new_items(City, schemas.city_schema)
 
 
 @app.route("/cities/<string:id>", methods=["GET", "PUT", "PATCH", "DELETE"])
 def city_item(id: str) -> utils.Response:
     if request.method == "GET":
-        return get_item_by_id(City, city_schema, id)
-    if request.method in ["PUT", "PATCH"]:
-        return update_item_by_id(City, city_schema, id)
+        return get_item_by_id(City, schemas.city_schema, id)
+    if request.method == "PUT":
+        return update_item_by_id(City, schemas.city_schema, id)
+    if request.method == "PATCH":
+        return patch_item_by_id(City, schemas.city_schema, id)
     if request.method == "DELETE":
         return delete_item_by_id(City, id)
 
@@ -237,29 +544,31 @@ def city_item(id: str) -> utils.Response:
 @app.route("/contributors", methods=["GET", "POST"])
 def contributor_collection() -> utils.Response:
     if request.method == "GET":
-        return get_collection(Contributor, contributors_schema)
+        return get_collection(Contributor, schemas.contributors_schema)
     if request.method == "POST":
-        try:
-            return create_new_item(
-                Contributor,
-                contributor_schema,
-                payload=None,
-                new_id=False
-            )
-        except IntegrityError:
-            message = {
-                "message": "id attribute should be an existing person id"
-            }
-            return utils.http_response(utils.HTTPStatus.BAD_REQUEST, message)
+        return create_new_item(
+            Contributor,
+            schemas.contributor_schema,
+            payload=None,
+            new_id=False
+        )
+
+
+@app.route("/contributors/bulk", methods=["POST"])
+def contributor_bulk() -> utils.Response:
+    return create_new_items(
+        Contributor, schemas.contributor_schema, new_id=False)
 
 
 @app.route("/contributors/<string:id>",
            methods=["GET", "PUT", "PATCH", "DELETE"])
 def contributor_item(id: str) -> utils.Response:
     if request.method == "GET":
-        return get_item_by_id(Contributor, contributor_schema, id)
-    if request.method in ["PUT", "PATCH"]:
-        return update_item_by_id(Contributor, contributor_schema, id)
+        return get_item_by_id(Contributor, schemas.contributor_schema, id)
+    if request.method == "PUT":
+        return update_item_by_id(Contributor, schemas.contributor_schema, id)
+    if request.method == "PATCH":
+        return patch_item_by_id(Contributor, schemas.contributor_schema, id)
     if request.method == "DELETE":
         return delete_item_by_id(Contributor, id)
 
@@ -267,18 +576,27 @@ def contributor_item(id: str) -> utils.Response:
 @app.route("/health-mutuals", methods=["GET", "POST"])
 def health_mutual_collection() -> utils.Response:
     if request.method == "GET":
-        return get_collection(HealthMutual, health_mutuals_schema)
+        return get_collection(HealthMutual, schemas.health_mutuals_schema)
     if request.method == "POST":
-        return create_new_item(HealthMutual, health_mutual_schema)
+        return create_new_item(HealthMutual, schemas.health_mutual_schema)
+
+
+@app.route("/health-mutuals/bulk", methods=["POST"])
+def health_mutual_bulk() -> utils.Response:
+    return create_new_items(HealthMutual, schemas.health_mutual_schema)
 
 
 @app.route("/health-mutuals/<string:id>",
            methods=["GET", "PUT", "PATCH", "DELETE"])
 def health_mutual_item(id: str) -> utils.Response:
     if request.method == "GET":
-        return get_item_by_id(HealthMutual, health_mutual_schema, id)
-    if request.method in ["PUT", "PATCH"]:
-        return update_item_by_id(HealthMutual, health_mutual_schema, id)
+        return get_item_by_id(HealthMutual, schemas.health_mutual_schema, id)
+    if request.method == "PUT":
+        return update_item_by_id(
+            HealthMutual, schemas.health_mutual_schema, id)
+    if request.method == "PATCH":
+        return patch_item_by_id(
+            HealthMutual, schemas.health_mutual_schema, id)
     if request.method == "DELETE":
         return delete_item_by_id(HealthMutual, id)
 
@@ -291,15 +609,26 @@ def emergency_relationship(id: str) -> utils.Response:
         payload["residentId"] = id
         return create_new_item(
             EmergencyRelationship,
-            emergency_relationship_schema,
+            schemas.emergency_relationship_schema,
             payload
         )
 
     if request.method == "GET":
-        er_collection = EmergencyRelationship.query.filter_by(
-            residentId=id).all()
-        list_result = emergencyRelationships_schema.dump(er_collection)
-        return utils.http_response(utils.HTTPStatus.OK, list_result)
+        return get_collection(
+            EmergencyRelationship,
+            schemas.emergencyRelationships_schema,
+            EmergencyRelationship.query.filter_by(residentId=id)
+        )
+
+
+@app.route('/residents/<string:id>/emergency-relationships/bulk',
+           methods=["POST"])
+def emergency_relationship_bulk(id: str) -> utils.Response:
+    return create_new_items(
+        EmergencyRelationship,
+        schemas.emergency_relationship_schema,
+        defaults={"residentId": id}
+    )
 
 
 @app.route('/residents/<string:_>/emergency-relationships/<string:er_id>',
@@ -308,13 +637,19 @@ def emergency_relationship_item(_, er_id: str) -> utils.Response:
     if request.method == "GET":
         return get_item_by_id(
             EmergencyRelationship,
-            emergency_relationship_schema,
+            schemas.emergency_relationship_schema,
             er_id
         )
-    if request.method in ["PUT", "PATCH"]:
+    if request.method == "PUT":
         return update_item_by_id(
             EmergencyRelationship,
-            emergency_relationship_schema,
+            schemas.emergency_relationship_schema,
+            er_id
+        )
+    if request.method == "PATCH":
+        return patch_item_by_id(
+            EmergencyRelationship,
+            schemas.emergency_relationship_schema,
             er_id
         )
     if request.method == "DELETE":
@@ -325,44 +660,143 @@ def emergency_relationship_item(_, er_id: str) -> utils.Response:
            methods=["GET", "POST"])
 def contributionRelationships_collection(id: str) -> utils.Response:
     if request.method == "GET":
-        er_collection = ContributionRelationship.query.filter_by(
-            residentId=id).all()
-        list_result = contribution_relationships_schema.dump(er_collection)
-        return utils.http_response(utils.HTTPStatus.OK, list_result)
+        return get_collection(
+            ContributionRelationship,
+            schemas.contribution_relationships_schema,
+            ContributionRelationship.query.filter_by(residentId=id)
+        )
 
     if request.method == "POST":
         payload = request.get_json()
         payload["residentId"] = id
         return create_new_item(
             ContributionRelationship,
-            contribution_relationship_schema,
+            schemas.contribution_relationship_schema,
             payload
         )
 
 
+@app.route('/residents/<string:id>/contribution-relationships/bulk',
+           methods=["POST"])
+def contribution_relationship_bulk(id: str) -> utils.Response:
+    return create_new_items(
+        ContributionRelationship,
+        schemas.contribution_relationship_schema,
+        defaults={"residentId": id}
+    )
+
+
 @app.route('/residents/<string:_>/contribution-relationships/<string:cr_id>',
            methods=["GET", "PUT", "PATCH", "DELETE"])
 def contribution_relationship_item(_, cr_id: str) -> utils.Response:
     if request.method == "GET":
         return get_item_by_id(
             ContributionRelationship,
-            contribution_relationship_schema,
+            schemas.contribution_relationship_schema,
             cr_id
         )
-    if request.method in ["PUT", "PATCH"]:
+    if request.method == "PUT":
         return update_item_by_id(
             ContributionRelationship,
-            contribution_relationship_schema,
+            schemas.contribution_relationship_schema,
+            cr_id
+        )
+    if request.method == "PATCH":
+        return patch_item_by_id(
+            ContributionRelationship,
+            schemas.contribution_relationship_schema,
             cr_id
         )
     if request.method == "DELETE":
         return delete_item_by_id(ContributionRelationship, cr_id)
 
 
+@app.route('/residents/<string:id>/sheet', methods=["GET"])
+def resident_sheet(id: str) -> utils.Response:
+    """ Gets the whole emergency sheet of a resident in a single call """
+    etag, response = not_modified(sheets.TABLES)
+    if response:
+        return response
+
+    sheet = sheets.get_sheet(id)
+    if sheet is None:
+        return {"message": f"{id} could not be found."}, 404
+    return Response(
+        sheet, status=utils.HTTPStatus.OK.value, mimetype='application/json',
+        headers={"ETag": etag})
+
+
+@app.route('/lookup/phone/<string:number>', methods=['GET'])
+def phone_lookup(number: str) -> utils.Response:
+    """ Finds out who is calling: the persons and health mutuals with this
+    phone number, in any format, and the residents they are linked to
+    """
+    normalized = phones.to_e164(number)
+    if normalized is None:
+        return {"message": f"{number} is not a phone number."}, 400
+
+    etag, response = not_modified(lookup.TABLES)
+    if response is not None:
+        return response
+
+    return utils.http_response(
+        utils.HTTPStatus.OK, lookup.lookup_phone(normalized), {"ETag": etag})
+
+
+@app.route('/batch', methods=['POST'])
+def batch_requests() -> utils.Response:
+    operations = request.get_json()
+
+    if not operations:
+        return {"message": "No input data provided"}, 400
+
+    try:
+        status, result = batch.run_batch(
+            operations, app.config["BATCH_MAX_OPERATIONS"])
+    except InvalidRequestException as err:
+        return {"message": err.message}, err.status_code
+    return utils.http_response(utils.HTTPStatus(status), result)
+
+
+@app.route('/admin/cache', methods=['GET'])
+def cache_stats() -> utils.Response:
+    """ Counters of the reference data cache """
+    return utils.http_response(
+        utils.HTTPStatus.OK, {"reference": reference_cache.stats()})
+
+
+@app.route('/admin/pool', methods=['GET'])
+def pool_stats() -> utils.Response:
+    """ State and counters of the pool of connections to the database """
+    pool = db.engine.pool
+    stats = pool.stats() if hasattr(pool, "stats") else None
+    return utils.http_response(utils.HTTPStatus.OK, {"pool": stats})
+
+
+@app.route('/admin/profiles', methods=['GET'])
+def profiles() -> utils.Response:
+    """ Recent profiles of the requests sent with 'X-Profile: 1' """
+    return utils.http_response(utils.HTTPStatus.OK, {
+        "enabled": request_profiler.enabled,
+        "captures": request_profiler.captures()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics() -> utils.Response:
+    """ Latency, status and size of the responses of every route, and the
+    SQL statements they run, in the Prometheus text format
+    """
+    return Response(request_metrics.expose(), content_type=CONTENT_TYPE)
+
+
 @app.route('/db-reset', methods=['POST'])
 def reset_db() -> utils.Response:
     """ Reset database """
     db.drop_all()
     db.create_all()
+    sheets.cache.clear()
+    reference_cache.clear()
+    versions.versions.bump(versions.all_tables())
 
     return utils.http_response(utils.HTTPStatus.NO_CONTENT, None)
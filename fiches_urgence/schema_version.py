@@ -0,0 +1,231 @@
+import hashlib
+import logging
+from typing import Callable, List, Optional
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.engine import Connectable, Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+from fiches_urgence import db
+
+#   ___  ___ _  _ ___ __  __   _    __   _____ ___  ___ ___ ___  _  _
+#  / __|/ __| || | __|  \/  | /_\   \ \ / / __| _ \/ __|_ _/ _ \| \| |
+#  \__ \ (__| __ | _|| |\/| |/ _ \   \ V /| _||   /\__ \| | (_) | .` |
+#  |___/\___|_||_|___|_|  |_/_/ \_\   \_/ |___|_|_\|___/___\___/|_|\_|
+
+logger = logging.getLogger(__name__)
+
+# Version of the schema the database was created with, in a single row
+schema_version = db.Table(
+    "schema_version",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("version", db.String, nullable=False)
+)
+
+# Statements run on the creation of the tables besides the ones of the models
+_extra_ddl = []
+_versions = {}
+# Functions run by 'upgrade', in order
+_upgrade_steps = []
+
+
+class SchemaError(RuntimeError):
+    """ Raised when the database does not match the models and cannot be
+    upgraded to them, so that the application does not start on it
+    """
+
+
+def include_ddl(*statements: str):
+    """ Makes the version of the schema depend on statements run by an
+    'after_create' listener, so that changing them is noticed as well
+    """
+    _extra_ddl.extend(statements)
+    _versions.clear()
+
+
+def model_tables() -> List[db.Table]:
+    return [
+        table for table in db.metadata.sorted_tables
+        if table is not schema_version
+    ]
+
+
+def current_version(dialect) -> str:
+    """ Hashes the DDL of the tables and indexes of the models, and of the
+    statements given to 'include_ddl', for the given dialect
+
+    Returns:
+        str: the version of the schema expected by the application
+    """
+    version = _versions.get(dialect.name)
+    if version is not None:
+        return version
+
+    digest = hashlib.blake2b(digest_size=12)
+    for table in model_tables():
+        digest.update(str(CreateTable(table).compile(dialect=dialect))
+                      .encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect))
+                          .encode())
+    for statement in _extra_ddl:
+        digest.update(statement.encode())
+
+    version = _versions[dialect.name] = digest.hexdigest()
+    return version
+
+
+def stored_version(connectable: Connectable) -> Optional[str]:
+    """ Reads the version the database was created with
+
+    Returns:
+        Optional[str]: the version, None if it was never stored
+    """
+    try:
+        return connectable.execute(
+            select([schema_version.c.version])
+            .where(schema_version.c.id == 1)
+        ).scalar()
+    except DBAPIError:
+        return None
+
+
+def store_version(connection: Connection):
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert(), {
+        "id": 1,
+        "version": current_version(connection.dialect)
+    })
+
+
+def upgrade_step(function: Callable) -> Callable:
+    """ Registers a function bringing the tables of a database created with
+    an older schema up to date, called with a connection by 'upgrade'. The
+    schema the database was created with is unknown, so each step checks
+    what is left for it to change, and an interrupted upgrade is resumed on
+    the next start.
+    """
+    _upgrade_steps.append(function)
+    return function
+
+
+def add_missing_column(
+    connection: Connection,
+    column: db.Column,
+    default: Optional[str] = None
+) -> bool:
+    """ Adds a column of the models to its existing table, unless the table
+    has it already
+
+    Args:
+        connection (Connection): the connection to the database upgraded
+        column (db.Column): the column of the models
+        default (Optional[str], optional): the SQL expression filling the
+            column of the existing rows. Defaults to None, leaving them null
+    Returns:
+        bool: True if the column was added
+    """
+    table = column.table
+    existing = {
+        column["name"] for column in inspect(connection).get_columns(
+            table.name)}
+    if column.name in existing:
+        return False
+
+    definition = str(CreateColumn(column).compile(dialect=connection.dialect))
+    if default is not None:
+        definition += f" DEFAULT {default}"
+    name = connection.dialect.identifier_preparer.format_table(table)
+    connection.execute(text(f"ALTER TABLE {name} ADD COLUMN {definition}"))
+    return True
+
+
+def missing_columns(connection: Connection) -> List[str]:
+    """ Lists the columns of the models which the tables of the database
+    lack, as 'table.column'
+    """
+    inspector = inspect(connection)
+    missing = []
+    for table in model_tables():
+        existing = {
+            column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(
+            f"{table.name}.{column.name}" for column in table.columns
+            if column.name not in existing)
+    return missing
+
+
+def create_missing_indexes(connection: Connection):
+    """ Creates the indexes of the models missing from their existing tables,
+    which 'create_all' only creates along with a new table
+    """
+    inspector = inspect(connection)
+    for table in model_tables():
+        existing = {index["name"] for index in inspector.get_indexes(
+            table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(connection)
+
+
+def upgrade(engine: Engine):
+    """ Brings the database up to the current schema: creates the missing
+    tables, runs the registered upgrade steps, creates the missing indexes,
+    and stores the current version once the tables have every column of the
+    models.
+
+    Raises:
+        SchemaError: If columns are still missing after the upgrade steps.
+    """
+    with engine.begin() as connection:
+        db.metadata.create_all(connection)
+        for step in _upgrade_steps:
+            step(connection)
+        create_missing_indexes(connection)
+
+        missing = missing_columns(connection)
+        if missing:
+            raise SchemaError(
+                "The database lacks the columns " + ", ".join(missing)
+                + ", migrate or reset it")
+        store_version(connection)
+
+
+def ensure_schema() -> bool:
+    """ Creates the tables of a new database, or upgrades an existing one,
+    unless it was created with the current version of the schema, which
+    costs a single query instead of the inspection of every table.
+
+    An existing database without a stored version is considered outdated
+    as well, since it may have been created from older models.
+
+    Returns:
+        bool: True if the tables were created or upgraded, False if the
+        stored version matched
+    Raises:
+        SchemaError: If the database cannot be upgraded to the models.
+    """
+    engine = db.engine
+    stored = stored_version(engine)
+    current = current_version(engine.dialect)
+    if stored == current:
+        return False
+
+    existing = set(engine.table_names())
+    if not existing & {table.name for table in model_tables()}:
+        db.create_all()
+        return True
+
+    logger.warning(
+        "The database was created with schema version %s, the models "
+        "expect %s: upgrading it", stored or "unknown", current)
+    upgrade(engine)
+    return True
+
+
+@event.listens_for(db.metadata, "after_create")
+def receive_after_create(target, connection, tables=(), **kwargs):
+    # Only the tables of a new database are known to match the models, the
+    # ones of an existing database are left to 'upgrade'
+    if set(model_tables()) <= set(tables):
+        store_version(connection)
@@ -1,5 +1,8 @@
 from marshmallow import fields, ValidationError, post_load
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
 from fiches_urgence import ma
+from fiches_urgence.cache import reference_cache
 from fiches_urgence.models import (
     Resident,
     Person,
@@ -18,12 +21,99 @@ from fiches_urgence.models import (
 #  |____/ \____|_| |_|_____|_|  |_/_/   \_\____/
 
 
+class ReferenceNested(fields.Nested):
+    """ Nested reference row, serialized from the reference cache by the
+    value of its foreign key rather than loaded with the object.
+    """
+
+    def __init__(self, nested, foreign_key: str, **kwargs):
+        super(ReferenceNested, self).__init__(nested, **kwargs)
+        self.foreign_key = foreign_key
+
+    def serialize(self, attr, obj, accessor=None, **kwargs):
+        id = getattr(obj, self.foreign_key)
+        if id is None:
+            return None
+        return reference_cache.get_item(
+            self.schema.Meta.model, id, self.schema)
+
+
 class SchemaMixin(object):
+    # Written by the database only, sent back in 'If-Match' to update a row
+    version = fields.Integer(dump_only=True)
+
     @post_load
     def make_object(self, data, **kwargs):
 
         return self.Meta.model(**data)
 
+    def loaded_columns(self) -> set:
+        """ Lists the columns of the model the schema reads, the ones of its
+        fields and the foreign keys its reference fields are served from.
+        The version is always read, the entity tag of a row is built from it.
+        """
+        columns = inspect(self.Meta.model).column_attrs.keys()
+        loaded = {"version"}
+
+        for name, field in self.dump_fields.items():
+            if isinstance(field, ReferenceNested):
+                loaded.add(field.foreign_key)
+            elif (field.attribute or name) in columns:
+                loaded.add(field.attribute or name)
+
+        return loaded
+
+    def loader_options(self) -> list:
+        """ Builds the query options eagerly loading every relationship
+        serialized by a nested field of the schema, so that dumping any number
+        of rows costs a constant number of queries. When the schema only
+        serializes some of the fields, the other columns are not selected.
+
+        Returns:
+            list: the loader options to pass to 'query.options'
+        """
+        mapper = inspect(self.Meta.model)
+        relationships = mapper.relationships
+        options = []
+
+        loaded = self.loaded_columns()
+        if len(loaded) < len(mapper.column_attrs):
+            options.append(load_only(*loaded))
+
+        for name, field in self.dump_fields.items():
+            if not isinstance(field, fields.Nested) or \
+                    isinstance(field, ReferenceNested):
+                continue
+
+            relationship = relationships.get(field.attribute or name)
+            if relationship is None:
+                continue
+
+            # Scalars are joined to the main query, collections are fetched
+            # by one extra 'SELECT ... WHERE ... IN' per relationship
+            loader = selectinload if relationship.uselist else joinedload
+            nested_options = field.schema.loader_options()
+            options.append(
+                loader(relationship.class_attribute).options(*nested_options)
+            )
+
+        return options
+
+    def prefetch_references(self, items: list):
+        """ Loads in the reference cache, with one query per reference field
+        of the schema, the reference rows 'items' point to.
+
+        Args:
+            items (list): the objects about to be serialized
+        """
+        for field in self.dump_fields.values():
+            if isinstance(field, ReferenceNested):
+                reference_cache.prefetch(
+                    field.schema.Meta.model,
+                    (getattr(item, field.foreign_key) for item in items),
+                    field.schema
+                )
+
 
 def must_not_be_blank(data):
     if not data:
@@ -34,6 +124,7 @@ class PersonSchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         include_fk = True
         model = Person
+        exclude = Person.DERIVED_COLUMNS
 
 
 class CitySchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
@@ -52,6 +143,7 @@ class HealthMutualSchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
     class Meta:
         include_fk = True
         model = HealthMutual
+        exclude = HealthMutual.DERIVED_COLUMNS
 
 
 class ResidentSchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
@@ -59,8 +151,12 @@ class ResidentSchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
         include_fk = True
         model = Resident
     person = fields.Nested(PersonSchema)
-    city = fields.Nested(CitySchema)
-    healthMutual = fields.Nested(HealthMutualSchema)
+    city = ReferenceNested(CitySchema, foreign_key="cityId")
+    healthMutual = ReferenceNested(
+        HealthMutualSchema,
+        foreign_key="healthMutualId",
+        attribute="health_mutual"
+    )
     doctor = fields.Nested(PersonSchema)
     psychiatrist = fields.Nested(PersonSchema)
 
@@ -77,17 +173,35 @@ class ContributionRelationshipSchema(SchemaMixin, ma.SQLAlchemyAutoSchema):
         model = ContributionRelationship
 
 
-person_schema = PersonSchema()
-persons_schema = PersonSchema(many=True)
-resident_schema = ResidentSchema()
-residents_schema = ResidentSchema(many=True)
-city_schema = CitySchema()
-cities_schema = CitySchema(many=True)
-contributor_schema = ContributorSchema()
-contributors_schema = ContributorSchema(many=True)
-health_mutual_schema = HealthMutualSchema()
-health_mutuals_schema = HealthMutualSchema(many=True)
-emergency_relationship_schema = EmergencyRelationshipSchema()
-emergencyRelationships_schema = EmergencyRelationshipSchema(many=True)
-contribution_relationship_schema = ContributionRelationshipSchema()
-contribution_relationships_schema = ContributionRelationshipSchema(many=True)
+# Instances shared by the application, built on first use, as (schema,
+# keyword arguments)
+INSTANCES = {
+    "person_schema": (PersonSchema, {}),
+    "persons_schema": (PersonSchema, {"many": True}),
+    "resident_schema": (ResidentSchema, {}),
+    "residents_schema": (ResidentSchema, {"many": True}),
+    "city_schema": (CitySchema, {}),
+    "cities_schema": (CitySchema, {"many": True}),
+    "contributor_schema": (ContributorSchema, {}),
+    "contributors_schema": (ContributorSchema, {"many": True}),
+    "health_mutual_schema": (HealthMutualSchema, {}),
+    "health_mutuals_schema": (HealthMutualSchema, {"many": True}),
+    "emergency_relationship_schema": (EmergencyRelationshipSchema, {}),
+    "emergencyRelationships_schema": (
+        EmergencyRelationshipSchema, {"many": True}),
+    "contribution_relationship_schema": (ContributionRelationshipSchema, {}),
+    "contribution_relationships_schema": (
+        ContributionRelationshipSchema, {"many": True}),
+}
+
+
+def __getattr__(name: str) -> ma.SQLAlchemyAutoSchema:
+    """ Builds the shared instances of 'INSTANCES' on first access, after
+    which they are plain attributes of the module
+    """
+    try:
+        schema, kwargs = INSTANCES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    # Threads racing to build an instance all get the first one stored
+    return globals().setdefault(name, schema(**kwargs))
@@ -0,0 +1,206 @@
+import re
+from typing import List
+
+from flask import current_app
+from sqlalchemy import event, or_, text
+from fiches_urgence import db, schema_version
+from fiches_urgence.exceptions import InvalidRequestException
+from fiches_urgence.models import Person
+
+#   ____  _____    _    ____   ____ _   _
+#  / ___|| ____|  / \  |  _ \ / ___| | | |
+#  \___ \|  _|   / _ \ | |_) | |   | |_| |
+#   ___) | |___ / ___ \|  _ <| |___|  _  |
+#  |____/|_____/_/   \_\_| \_\\____|_| |_|
+
+# Tokens of a query beyond this number are ignored
+MAX_TOKENS = 8
+
+# An FTS5 index of the names of the persons, without a copy of them: the
+# index is contentless, and triggers keep it in sync. Its rowids are the keys
+# 'person_search_key' declares for the persons, since the implicit rowid of
+# 'person', whose primary key is a string, may be renumbered by VACUUM.
+# Diacritics are removed from the names and the queries alike, and prefixes
+# of up to 3 characters are indexed so that the first keystrokes of an
+# operator are answered without scanning the whole index.
+CREATE_INDEX = (
+    """
+    CREATE TABLE IF NOT EXISTS person_search_key (
+        id INTEGER PRIMARY KEY,
+        personId VARCHAR NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS person_search USING fts5(
+        firstName,
+        lastName,
+        content='',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    """
+)
+
+CREATE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS person_search_insert
+    AFTER INSERT ON person BEGIN
+        INSERT INTO person_search_key(personId) VALUES (new.id);
+        INSERT INTO person_search(rowid, firstName, lastName)
+        SELECT id, new.firstName, new.lastName FROM person_search_key
+        WHERE personId = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS person_search_delete
+    AFTER DELETE ON person BEGIN
+        INSERT INTO person_search(person_search, rowid, firstName, lastName)
+        SELECT 'delete', id, old.firstName, old.lastName
+        FROM person_search_key WHERE personId = old.id;
+        DELETE FROM person_search_key WHERE personId = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS person_search_update
+    AFTER UPDATE OF firstName, lastName ON person BEGIN
+        INSERT INTO person_search(person_search, rowid, firstName, lastName)
+        SELECT 'delete', id, old.firstName, old.lastName
+        FROM person_search_key WHERE personId = old.id;
+        INSERT INTO person_search(rowid, firstName, lastName)
+        SELECT id, new.firstName, new.lastName FROM person_search_key
+        WHERE personId = new.id;
+    END
+    """
+)
+
+schema_version.include_ddl(*CREATE_INDEX, *CREATE_TRIGGERS)
+
+# Indexes the persons inserted before the index was created
+REBUILD_INDEX = (
+    "DELETE FROM person_search_key",
+    "INSERT INTO person_search_key(personId) SELECT id FROM person",
+    """
+    INSERT INTO person_search(rowid, firstName, lastName)
+    SELECT person_search_key.id, person.firstName, person.lastName
+    FROM person_search_key
+    JOIN person ON person.id = person_search_key.personId
+    """
+)
+
+# Drops the index, and the one of earlier versions keyed on the rowid of
+# 'person', whose triggers have the same names
+DROP_INDEX = (
+    "DROP TRIGGER IF EXISTS person_search_insert",
+    "DROP TRIGGER IF EXISTS person_search_delete",
+    "DROP TRIGGER IF EXISTS person_search_update",
+    "DROP TABLE IF EXISTS person_search",
+    "DROP TABLE IF EXISTS person_search_key"
+)
+
+SEARCH = """
+SELECT person.* FROM person_search
+JOIN person_search_key ON person_search_key.id = person_search.rowid
+JOIN person ON person.id = person_search_key.personId
+WHERE person_search MATCH :expression
+ORDER BY person_search.rank, person.lastName, person.firstName
+LIMIT :limit
+"""
+
+
+def tokens(query: str) -> List[str]:
+    """ Splits what the user typed into words, punctuation is ignored """
+    return re.findall(r"\w+", query.casefold())[:MAX_TOKENS]
+
+
+def match_expression(query: str) -> str:
+    """ Builds the FTS5 expression matching the persons having a name
+    starting with every word of 'query', in any order.
+
+    Args:
+        query (str): what the user typed
+    Returns:
+        str: the FTS5 expression, empty if 'query' has no word
+    """
+    return " ".join(f'"{token}"*' for token in tokens(query))
+
+
+def search_args(args: dict) -> tuple:
+    """ Reads the 'q' and 'limit' parameters of a search request.
+
+    Args:
+        args (dict): the query string parameters of the request
+    Returns:
+        tuple: the query and the maximum number of results
+    Raises:
+        InvalidRequestException: If 'q' has no word or 'limit' is invalid.
+    """
+    query = args.get("q", "")
+    if not tokens(query):
+        raise InvalidRequestException("q should contain at least one word")
+
+    limit = args.get("limit", current_app.config["SEARCH_DEFAULT_LIMIT"])
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidRequestException("limit should be an integer")
+    if limit < 1:
+        raise InvalidRequestException("limit should be positive")
+
+    return query, min(limit, current_app.config["SEARCH_MAX_LIMIT"])
+
+
+def search_persons(query: str, limit: int) -> List[Person]:
+    """ Finds the persons whose first and last names start with the words of
+    'query', the best matches first.
+
+    Args:
+        query (str): what the user typed
+        limit (int): the maximum number of persons returned
+    Returns:
+        List[Person]: the matching persons, ranked
+    """
+    if db.engine.dialect.name == "sqlite":
+        return Person.query.from_statement(text(SEARCH)).params(
+            expression=match_expression(query), limit=limit).all()
+
+    # Without FTS5, each word is matched as a prefix of the indexed names
+    persons = Person.query
+    for token in tokens(query):
+        persons = persons.filter(or_(
+            Person.firstName.ilike(f"{token}%"),
+            Person.lastName.ilike(f"{token}%")
+        ))
+    return persons.order_by(
+        Person.lastName, Person.firstName).limit(limit).all()
+
+
+# The index follows the life of the 'person' table
+
+def execute_all(connection, statements: tuple):
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@event.listens_for(db.metadata, "after_create")
+def receive_after_create(target, connection, **kwargs):
+    if connection.dialect.name != "sqlite":
+        return
+
+    def exists(name: str) -> bool:
+        return connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = :name"
+        ), name=name).scalar() is not None
+
+    if not exists("person_search_key"):
+        execute_all(connection, DROP_INDEX)
+    built = exists("person_search")
+
+    execute_all(connection, CREATE_INDEX + CREATE_TRIGGERS)
+    if not built:
+        execute_all(connection, REBUILD_INDEX)
+
+
+@event.listens_for(Person.__table__, "after_drop")
+def receive_after_drop(target, connection, **kwargs):
+    if connection.dialect.name == "sqlite":
+        execute_all(connection, DROP_INDEX)
@@ -0,0 +1,144 @@
+import datetime
+import threading
+import weakref
+from typing import Any, Callable
+
+from marshmallow import fields, missing
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import ensure_text_type
+from fiches_urgence import ma
+
+#   ____  _____ ____  ___    _    _     ___ _____ _____ ____  ____
+#  / ___|| ____|  _ \|_ _|  / \  | |   |_ _|__  /| ____|  _ \/ ___|
+#  \___ \|  _| | |_) || |  / _ \ | |    | |  / / |  _| | |_) \___ \
+#   ___) | |___|  _ < | | / ___ \| |___ | | / /_ | |___|  _ < ___) |
+#  |____/|_____|_| \_\___/_/   \_\_____|___/____||_____|_| \_\____/
+
+# A function serializing one object as 'schema.dump' would
+Dumper = Callable[[Any], dict]
+
+_compiled = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _field_source(name: str, key: str, field: fields.Field, index: int,
+                  namespace: dict) -> list:
+    """ Generates the lines serializing one field of the object 'obj' into
+    the dict 'result', specialized on the type of the field. The behaviour of
+    'field.serialize' is kept, fields without a fast path call it directly.
+    """
+    attribute = field.attribute or name
+    fast = attribute.isidentifier() and "." not in attribute
+
+    if fast and type(field) is fields.String:
+        return [
+            f"    value = obj.{attribute}",
+            f"    result[{key!r}] = value if value is None "
+            f"or value.__class__ is str else ensure_text_type(value)"
+        ]
+
+    if fast and type(field) is fields.Boolean:
+        namespace[f"field_{index}"] = field
+        return [
+            f"    value = obj.{attribute}",
+            f"    result[{key!r}] = value if value is None or value is True "
+            f"or value is False "
+            f"else field_{index}._serialize(value, {name!r}, obj)"
+        ]
+
+    if fast and type(field) is fields.Date and field.format in (None, "iso"):
+        return [
+            f"    value = obj.{attribute}",
+            f"    result[{key!r}] = None if value is None "
+            f"else date_isoformat(value)"
+        ]
+
+    if fast and type(field) is fields.Nested and not (
+        field.many or field.schema.many
+    ):
+        namespace[f"dump_{index}"] = compile_schema(field.schema)
+        return [
+            f"    value = obj.{attribute}",
+            f"    result[{key!r}] = None if value is None "
+            f"else dump_{index}(value)"
+        ]
+
+    namespace[f"field_{index}"] = field
+    return [
+        f"    value = field_{index}.serialize({name!r}, obj, "
+        f"accessor=get_attribute)",
+        "    if value is not missing:",
+        f"        result[{key!r}] = value"
+    ]
+
+
+def compile_schema(schema: ma.SQLAlchemyAutoSchema) -> Dumper:
+    """ Generates a function dumping objects exactly as 'schema.dump' does,
+    without walking the field objects of the schema for every attribute of
+    every row. Schemas with dump hooks are not compiled.
+
+    Args:
+        schema (ma.SQLAlchemyAutoSchema): the schema to compile
+    Returns:
+        Dumper: a function taking an object, or a list of objects if the
+        schema is 'many', and returning its serialization
+    """
+    with _lock:
+        dumper = _compiled.get(schema)
+    if dumper is not None:
+        return dumper
+
+    if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+        return schema.dump
+
+    namespace = {
+        "ensure_text_type": ensure_text_type,
+        "date_isoformat": datetime.date.isoformat,
+        "missing": missing,
+        "get_attribute": schema.get_attribute
+    }
+    lines = ["def dump_one(obj):", "    result = {}"]
+
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        lines.extend(_field_source(name, key, field, index, namespace))
+
+    lines.append("    return result")
+    exec(compile("\n".join(lines), f"<dump {type(schema).__name__}>", "exec"),
+         namespace)
+    dump_one = namespace["dump_one"]
+
+    if schema.many:
+        def dumper(items):
+            return [dump_one(item) for item in items]
+    else:
+        dumper = dump_one
+
+    with _lock:
+        _compiled[schema] = dumper
+    return dumper
+
+
+def dump(schema: ma.SQLAlchemyAutoSchema, obj: Any, many: bool = None) -> Any:
+    """ Serializes 'obj' with the compiled version of 'schema'
+
+    Args:
+        schema (ma.SQLAlchemyAutoSchema): the schema to serialize with
+        obj (Any): the object, or the objects, to serialize
+        many (bool, optional): whether 'obj' is a collection of objects.
+            Defaults to None, in that case 'schema.many' is used
+    Returns:
+        Any: the serialized object, or list of serialized objects
+    """
+    dumper = compile_schema(schema)
+    if many is None or many == schema.many:
+        return dumper(obj)
+
+    if dumper == schema.dump:
+        return schema.dump(obj, many=many)
+
+    # The object level function is the one of the schema when it is not
+    # 'many', and is applied on each item otherwise
+    if many:
+        return [dumper(item) for item in obj]
+    return dumper([obj])[0]
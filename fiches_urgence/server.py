@@ -0,0 +1,281 @@
+""" Production server, forking workers from a parent which preloads the
+application once, so that they share its memory copy-on-write.
+
+Usage:
+    python -m fiches_urgence.server [--host 0.0.0.0] [--port 5000]
+        [--workers N] [--max-requests N] [--max-requests-jitter N]
+
+Each worker serves one request at a time on the socket opened by the
+parent, and exits once it served its share of requests, to be replaced by a
+fresh fork. Signals sent to the parent:
+
+    SIGTERM, SIGINT: stop, letting the workers finish their requests
+    SIGHUP: reload the code, without refusing any connection. The parent
+        executes itself again on the same socket, preloads the new code and
+        starts new workers, then stops the former ones gracefully.
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+from typing import Iterable
+
+from flask import Flask
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from fiches_urgence import create_app, db
+
+#   ___ ___ _____   _____ ___
+#  / __| __| _ \ \ / / __| _ \
+#  \__ \ _||   /\ V /| _||   /
+#  |___/___|_|_\ \_/ |___|_|_\
+
+# Environment passing the socket and the workers through a reload
+LISTEN_FD = "FICHES_URGENCE_LISTEN_FD"
+FORMER_WORKERS = "FICHES_URGENCE_FORMER_WORKERS"
+
+# Seconds workers are given to finish their requests when stopped, and
+# seconds between two checks of a worker for a stop request
+GRACEFUL_TIMEOUT = 30
+POLL_INTERVAL = 1.0
+
+logger = logging.getLogger("fiches_urgence.server")
+
+
+class RequestHandler(WSGIRequestHandler):
+    """ Handles a request without logging it, errors are still logged """
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def open_socket(host: str, port: int) -> socket.socket:
+    """ Opens the listening socket, or takes the one of the parent being
+    reloaded
+    """
+    fd = os.environ.pop(LISTEN_FD, None)
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def serve(app: Flask, sock: socket.socket, max_requests: int):
+    """ Loop of a worker, serving until it is asked to stop or it served
+    'max_requests' requests
+    """
+    stopping = []
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    random.seed()
+
+    served = [0]
+
+    def counted(environ, start_response):
+        served[0] += 1
+        return app(environ, start_response)
+
+    host, port = sock.getsockname()[:2]
+    server = BaseWSGIServer(
+        host, port, counted, RequestHandler, fd=sock.fileno())
+    server.timeout = POLL_INTERVAL
+    # Every idle worker is woken up by a connection, the ones which do not
+    # get it find no request rather than block in 'accept' until the next
+    # one, unaware of a stop request
+    server.socket.setblocking(False)
+    while not stopping and served[0] < max_requests:
+        server.handle_request()
+    server.server_close()
+
+
+class PreforkServer(object):
+    """ Parent process, keeping 'workers' workers alive """
+
+    def __init__(
+        self,
+        app: Flask,
+        sock: socket.socket,
+        workers: int,
+        max_requests: int,
+        max_requests_jitter: int
+    ):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.pids = set()
+        self.signals = []
+
+    def spawn(self):
+        # Recycled at different times, so that they are not all replaced
+        # at once
+        max_requests = self.max_requests + random.randint(
+            0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            logger.info("Booting worker %d", pid)
+            return
+
+        status = 0
+        try:
+            serve(self.app, self.sock, max_requests)
+        except BaseException:
+            logger.exception("Worker %d failed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def handle_signal(self, signum: int, frame):
+        self.signals.append(signum)
+
+    def reap(self) -> int:
+        """ Collects the workers which exited
+
+        Returns:
+            int: the number of workers which exited
+        """
+        exited = 0
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.pids:
+                self.pids.discard(pid)
+                exited += 1
+                if os.WIFSIGNALED(status) or os.WEXITSTATUS(status):
+                    logger.warning("Worker %d exited with status %d",
+                                   pid, status)
+        return exited
+
+    def stop_workers(self, pids: Iterable[int]):
+        """ Asks workers to stop once their request is served, and kills
+        the ones still running after GRACEFUL_TIMEOUT
+        """
+        pids = set(pids)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pids.discard(pid)
+
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while pids and time.monotonic() < deadline:
+            for pid in list(pids):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        pids.discard(pid)
+                except ChildProcessError:
+                    pids.discard(pid)
+            time.sleep(0.05)
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+    def reload(self):
+        """ Executes the server again, passing it the socket and the workers
+        which keep serving until the new ones are started
+        """
+        logger.info("Reloading")
+        os.set_inheritable(self.sock.fileno(), True)
+        os.environ[LISTEN_FD] = str(self.sock.fileno())
+        os.environ[FORMER_WORKERS] = ",".join(map(str, self.pids))
+        os.execv(sys.executable,
+                 [sys.executable, "-m", "fiches_urgence.server"]
+                 + sys.argv[1:])
+
+    def run(self):
+        former = [int(pid) for pid in
+                  os.environ.pop(FORMER_WORKERS, "").split(",") if pid]
+
+        # Woken up by any signal, handled in the loop below
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                       signal.SIGCHLD):
+            signal.signal(signum, self.handle_signal)
+
+        # Connections are not shared across forks, and objects loaded
+        # until now are not scanned by the collector of the workers, which
+        # would copy their pages
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        gc.collect()
+        gc.freeze()
+
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Serving on %s with %d workers",
+                    self.sock.getsockname(), self.workers)
+        if former:
+            self.stop_workers(former)
+
+        while True:
+            select.select([wakeup_read], [], [], POLL_INTERVAL)
+            try:
+                os.read(wakeup_read, 512)
+            except BlockingIOError:
+                pass
+
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    logger.info("Stopping")
+                    self.stop_workers(self.pids)
+                    return
+                if signum == signal.SIGHUP:
+                    self.reload()
+
+            self.reap()
+            while len(self.pids) < self.workers:
+                self.spawn()
+
+
+def main():
+    logging.basicConfig(format="[%(asctime)s] %(process)d %(message)s")
+    logger.setLevel(logging.INFO)
+
+    # Loaded before parsing the arguments, which default to its settings
+    app = create_app()
+    config = app.config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=config["SERVER_HOST"])
+    parser.add_argument("--port", type=int, default=config["SERVER_PORT"])
+    parser.add_argument(
+        "--workers", type=int, default=config["SERVER_WORKERS"])
+    parser.add_argument(
+        "--max-requests", type=int, default=config["SERVER_MAX_REQUESTS"])
+    parser.add_argument(
+        "--max-requests-jitter", type=int,
+        default=config["SERVER_MAX_REQUESTS_JITTER"])
+    args = parser.parse_args()
+
+    PreforkServer(
+        app,
+        open_socket(args.host, args.port),
+        args.workers,
+        args.max_requests,
+        args.max_requests_jitter
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
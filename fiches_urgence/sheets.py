@@ -0,0 +1,328 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload
+from fiches_urgence import db, schemas, serializers
+from fiches_urgence.versions import versions
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    ContributionRelationship,
+    City,
+    Contributor,
+    HealthMutual
+)
+
+#   ____  _   _ _____ _____ _____ ____
+#  / ___|| | | | ____| ____|_   _/ ___|
+#  \___ \| |_| |  _| |  _|   | | \___ \
+#   ___) |  _  | |___| |___  | |  ___) |
+#  |____/|_| |_|_____|_____| |_| |____/
+
+# A row a sheet is built from, as (table name, primary key)
+RowKey = Tuple[str, str]
+
+
+def row_key(item: db.Model) -> RowKey:
+    return item.__tablename__, item.id
+
+
+class SheetCache(object):
+    """ Thread-safe store of serialized emergency sheets, indexed by the rows
+    each of them was built from so that a change on any row only drops the
+    sheets depending on it.
+
+    Sheets are also tagged with the count of writes committed by other
+    processes on their tables when they were built, and ignored once it
+    changed, since those writes are not seen by the index.
+
+    A sheet is only stored if nothing was invalidated while it was built,
+    since it may have been built from the rows a concurrent write replaced
+    after the entry it would fill was dropped.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._documents = OrderedDict()
+        self._dependencies = {}
+        self._dependents = {}
+        self._invalidations = 0
+
+    def invalidations(self) -> int:
+        """ Counts the invalidations so far, to read before the rows of a
+        sheet are and pass to 'put'
+        """
+        with self._lock:
+            return self._invalidations
+
+    def get(self, resident_id: str, version: tuple = ()) -> Optional[str]:
+        with self._lock:
+            entry = self._documents.get(resident_id)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._discard(resident_id)
+                return None
+            self._documents.move_to_end(resident_id)
+            return entry[1]
+
+    def put(self, resident_id: str, document: str, keys: Set[RowKey],
+            version: tuple = (), invalidations: int = None):
+        with self._lock:
+            if invalidations is not None and \
+                    invalidations != self._invalidations:
+                return
+            self._discard(resident_id)
+            self._documents[resident_id] = (version, document)
+            self._dependencies[resident_id] = keys
+            for key in keys:
+                self._dependents.setdefault(key, set()).add(resident_id)
+
+            while len(self._documents) > self.max_entries:
+                self._discard(next(iter(self._documents)))
+
+    def invalidate(self, keys: Iterable[RowKey]):
+        """ Drops every sheet built from one of the given rows """
+        keys = set(keys)
+        if not keys:
+            return
+        with self._lock:
+            self._invalidations += 1
+            for key in keys:
+                for resident_id in list(self._dependents.get(key, ())):
+                    self._discard(resident_id)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._documents.clear()
+            self._dependencies.clear()
+            self._dependents.clear()
+
+    def _discard(self, resident_id: str):
+        self._documents.pop(resident_id, None)
+        for key in self._dependencies.pop(resident_id, ()):
+            dependents = self._dependents.get(key)
+            if dependents is not None:
+                dependents.discard(resident_id)
+                if not dependents:
+                    del self._dependents[key]
+
+
+cache = SheetCache()
+
+# Tables a sheet is built from
+TABLES = tuple(sorted(model.__tablename__ for model in (
+    Resident,
+    Person,
+    City,
+    HealthMutual,
+    EmergencyRelationship,
+    ContributionRelationship,
+    Contributor
+)))
+
+
+def build_sheet(resident_id: str) -> Optional[Tuple[dict, Set[RowKey]]]:
+    """ Aggregates everything known about a resident in a single document
+
+    Args:
+        resident_id (str): the id of the resident
+    Returns:
+        Optional[Tuple[dict, Set[RowKey]]]: the sheet and the rows it was
+        built from, None if the resident does not exist
+    """
+    # The city and health mutual are served from the reference cache by the
+    # schema, but the keys of the sheet are read from them
+    resident = Resident.query.options(
+        *schemas.resident_schema.loader_options(),
+        joinedload(Resident.city),
+        joinedload(Resident.health_mutual)
+    ).filter_by(id=resident_id).first()
+    if resident is None:
+        return None
+
+    keys = {row_key(resident)}
+    for related in (
+        resident.person,
+        resident.city,
+        resident.health_mutual,
+        resident.doctor,
+        resident.psychiatrist
+    ):
+        if related is not None:
+            keys.add(row_key(related))
+
+    emergency_contacts = []
+    for relationship, person in db.session.query(
+        EmergencyRelationship, Person
+    ).outerjoin(
+        Person, Person.id == EmergencyRelationship.personId
+    ).filter(
+        EmergencyRelationship.residentId == resident_id
+    ).order_by(EmergencyRelationship.id):
+        contact = serializers.dump(
+            schemas.emergency_relationship_schema, relationship)
+        contact["person"] = None
+        keys.add(row_key(relationship))
+        if person is not None:
+            contact["person"] = serializers.dump(schemas.person_schema, person)
+            keys.add(row_key(person))
+        emergency_contacts.append(contact)
+
+    contributors = []
+    for relationship, contributor, person in db.session.query(
+        ContributionRelationship, Contributor, Person
+    ).outerjoin(
+        Contributor, Contributor.id == ContributionRelationship.contributorId
+    ).outerjoin(
+        Person, Person.id == Contributor.id
+    ).filter(
+        ContributionRelationship.residentId == resident_id
+    ).order_by(ContributionRelationship.id):
+        contribution = serializers.dump(
+            schemas.contribution_relationship_schema, relationship)
+        contribution["contributor"] = None
+        keys.add(row_key(relationship))
+        if contributor is not None:
+            contribution["contributor"] = serializers.dump(
+                schemas.contributor_schema, contributor)
+            contribution["contributor"]["person"] = None
+            keys.add(row_key(contributor))
+        if person is not None:
+            contribution["contributor"]["person"] = serializers.dump(
+                schemas.person_schema, person)
+            keys.add(row_key(person))
+        contributors.append(contribution)
+
+    sheet = {
+        "resident": serializers.dump(schemas.resident_schema, resident),
+        "emergencyContacts": emergency_contacts,
+        "contributors": contributors
+    }
+    return sheet, keys
+
+
+def get_sheet(resident_id: str) -> Optional[str]:
+    """ Gets the serialized sheet of a resident, from the cache when it is
+    still valid or freshly built otherwise.
+
+    Args:
+        resident_id (str): the id of the resident
+    Returns:
+        Optional[str]: the sheet in JSON, None if the resident does not exist
+    """
+    # Read before building, a write committed meanwhile makes it stale
+    version = versions.foreign(TABLES)
+    document = cache.get(resident_id, version)
+    if document is not None:
+        return document
+
+    # Counted when the transaction began, before the rows were read from
+    # it, so that any write committed since refuses the sheet
+    db.session.connection()
+    invalidations = db.session.info["sheet_invalidations"]
+    built = build_sheet(resident_id)
+    if built is None:
+        return None
+
+    sheet, keys = built
+    document = json.dumps(sheet)
+    cache.put(resident_id, document, keys, version, invalidations)
+    return document
+
+
+# Invalidation
+
+def changed_keys(item: db.Model) -> Set[RowKey]:
+    """ Lists the rows whose sheets are stale once 'item' is written.
+    A relationship row also invalidates the sheets of the residents it is
+    attached to, before and after the change, since they may not have been
+    built from it yet.
+    """
+    keys = {row_key(item)}
+
+    if isinstance(item, (EmergencyRelationship, ContributionRelationship)):
+        history = inspect(item).attrs.residentId.history
+        for resident_id in history.sum():
+            if resident_id is not None:
+                keys.add((Resident.__tablename__, resident_id))
+
+    return keys
+
+
+def invalidate_written(session, keys: Set[RowKey]):
+    # Invalidated twice: now, and once committed, so that a sheet built by a
+    # concurrent request from the former rows is dropped if it was stored
+    # meanwhile, or refused if it is still being built
+    cache.invalidate(keys)
+    session.info.setdefault("sheet_keys", set()).update(keys)
+
+
+def invalidate_statement(session, model: db.Model, id: str, columns):
+    """ Drops the sheets depending on a row written by a statement bypassing
+    the unit of work, given the columns it wrote
+    """
+    if issubclass(model, (EmergencyRelationship, ContributionRelationship)) \
+            and "residentId" in columns:
+        # The resident the row was attached to is unknown
+        invalidate_all(session)
+        return
+    invalidate_written(session, {(model.__tablename__, id)})
+
+
+def invalidate_all(session):
+    """ Drops every sheet, now and once committed, for writes whose rows
+    are not known
+    """
+    cache.clear()
+    session.info["sheet_clear"] = True
+
+
+@event.listens_for(db.session, "after_flush")
+def receive_after_flush(session, flush_context):
+    keys = set()
+    for item in session.new | session.dirty | session.deleted:
+        if isinstance(item, db.Model):
+            keys |= changed_keys(item)
+    invalidate_written(session, keys)
+
+
+@event.listens_for(db.session, "after_begin")
+def receive_after_begin(session, transaction, connection):
+    session.info.setdefault("sheet_invalidations", cache.invalidations())
+
+
+@event.listens_for(db.session, "after_commit")
+def receive_after_commit(session):
+    # Released savepoints are committed with the transaction only
+    if session.transaction.nested:
+        return
+    session.info.pop("sheet_invalidations", None)
+    if session.info.pop("sheet_clear", False):
+        cache.clear()
+    cache.invalidate(session.info.pop("sheet_keys", ()))
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def receive_after_soft_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("sheet_invalidations", None)
+        session.info.pop("sheet_keys", None)
+        session.info.pop("sheet_clear", None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+def receive_after_bulk_update(update_context):
+    # Rows written by 'query.update' are unknown, drop everything
+    cache.clear()
+
+
+@event.listens_for(db.session, "after_bulk_delete")
+def receive_after_bulk_delete(delete_context):
+    cache.clear()
@@ -1,5 +1,8 @@
 import os
+from contextlib import contextmanager
 from flask_testing import TestCase
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from fiches_urgence import create_app, db, config
 
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -50,3 +53,22 @@ def is_dict_subset_of_superset(subset: dict, superset: dict) -> bool:
         bool: True if the subset is part of the superset, False otherwise
     """
     return subset.items() <= superset.items()
+
+
+@contextmanager
+def count_queries():
+    """ Counts the SQL statements executed within the 'with' block
+
+    Yields:
+        list: the statements executed so far, filled as they are executed
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+from config_test import TestApi, client
+from nose.tools import eq_, ok_
+from sqlalchemy.pool import StaticPool
+from fiches_urgence import create_app, db
+from fiches_urgence.config import Config
+
+#     _   ___  __  __ ___ _  _
+#    /_\ |   \|  \/  |_ _| \| |
+#   / _ \| |) | |\/| || || .` |
+#  /_/ \_\___/|_|  |_|___|_|\_|
+
+
+class TestAdmin(TestApi):
+
+    def test_pool_stats(self):
+        before = client.get('/admin/pool').json["pool"]
+        client.get('/persons')
+        res = client.get('/admin/pool')
+
+        eq_(200, res.status_code)
+        pool = res.json["pool"]
+        ok_(pool["checkouts"] > before["checkouts"])
+        eq_(pool["checkouts"], pool["checkins"] + pool["checkedOut"])
+        ok_(pool["size"] >= 1)
+        ok_(pool["waitSeconds"]["max"] >= pool["waitSeconds"]["mean"] >= 0)
+
+    def test_metrics(self):
+        client.get('/persons')
+        client.get('/persons/unknown')
+        client.get('/no-such-route')
+        res = client.get('/metrics')
+
+        eq_(200, res.status_code)
+        ok_(res.content_type.startswith("text/plain"))
+        lines = res.get_data(as_text=True).splitlines()
+        ok_("# TYPE http_request_duration_seconds histogram" in lines)
+        ok_(any(line.startswith(
+            'http_requests_total{method="GET",route="/persons/<string:id>",'
+            'status="404"}') for line in lines))
+        ok_(any(line.startswith(
+            'http_requests_total{method="GET",route="<unmatched>",'
+            'status="404"}') for line in lines))
+
+        samples = dict(line.rsplit(" ", 1) for line in lines
+                       if not line.startswith("#"))
+        route = 'method="GET",route="/persons"'
+        count = float(samples[
+            'sql_queries_per_request_count{' + route + '}'])
+        ok_(count >= 1)
+        ok_(float(samples['sql_queries_per_request_sum{' + route + '}'])
+            >= count)
+        eq_(samples['http_request_duration_seconds_count{' + route + '}'],
+            samples['http_request_duration_seconds_bucket{' + route
+                    + ',le="+Inf"}'])
+
+    def test_in_memory_database(self):
+        with patch.object(Config, "SQLALCHEMY_DATABASE_URI", "sqlite://"):
+            memory_app = create_app()
+
+        engine = db.get_engine(memory_app)
+        eq_(StaticPool, type(engine.pool))
+        eq_(1, engine.execute("PRAGMA foreign_keys").scalar())
+        ok_("person" in engine.table_names())
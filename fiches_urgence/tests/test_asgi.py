@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+import time
+
+from config_test import TestApi, app, client
+from nose.tools import eq_, ok_
+from sqlalchemy import event
+from fiches_urgence import db
+from fiches_urgence.asgi import WsgiToAsgi, asgi_app
+
+#     _   ___  ___ ___
+#    /_\ / __|/ __|_ _|
+#   / _ \\__ \ (_ || |
+#  /_/ \_\___/\___|___|
+
+# Time spent by the requests of 'delayed' waiting, as for a slow query
+DELAY = 0.05
+
+
+async def call(asgi, method: str, path: str, body: dict = None) -> tuple:
+    """ Sends a request to an ASGI application, as a server would
+
+    Returns:
+        tuple: the status, the headers and the chunks of the body
+    """
+    path, _, query = path.partition("?")
+    data = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(b"content-type", b"application/json")],
+    }
+    requests = [{"type": "http.request", "body": data}]
+    messages = []
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi(scope, receive, send)
+    start = messages[0]
+    chunks = [message["body"] for message in messages[1:] if message["body"]]
+    return start["status"], dict(start["headers"]), chunks
+
+
+def delayed(wsgi_app, slow_path: str = None):
+    """ Makes every request of 'wsgi_app' wait DELAY, and the ones to
+    'slow_path' wait a second
+    """
+    def application(environ, start_response):
+        slow = environ["PATH_INFO"] == slow_path
+        time.sleep(1 if slow else DELAY)
+        return wsgi_app(environ, start_response)
+    return application
+
+
+class TestAsgi(TestApi):
+
+    def test_routes(self):
+        asgi = asgi_app(app)
+
+        status, headers, chunks = asyncio.run(
+            call(asgi, "POST", "/cities", {"name": "Lyon"}))
+        eq_(201, status)
+        city = json.loads(b"".join(chunks))
+        eq_("Lyon", city["name"])
+
+        status, headers, chunks = asyncio.run(
+            call(asgi, "GET", f"/cities/{city['id']}"))
+        eq_(200, status)
+        eq_(b"application/json", headers[b"content-type"])
+        eq_(city, json.loads(b"".join(chunks)))
+
+        status, _, chunks = asyncio.run(
+            call(asgi, "GET", "/cities?stream=1"))
+        eq_(200, status)
+        eq_([city], [json.loads(line) for line in
+                     b"".join(chunks).splitlines()])
+
+    def test_slow_request_does_not_block(self):
+        asgi = WsgiToAsgi(delayed(app, "/residents"), 2)
+
+        async def scenario():
+            slow = asyncio.ensure_future(call(asgi, "GET", "/residents"))
+            await asyncio.sleep(DELAY)
+            status, _, _ = await call(asgi, "GET", "/lookup/phone/0600000000")
+            return status, slow.done(), await slow
+
+        status, slow_done, (slow_status, _, _) = asyncio.run(scenario())
+        eq_(200, status)
+        ok_(not slow_done)
+        eq_(200, slow_status)
+
+    def test_throughput_scales_with_threads(self):
+        durations = {}
+        for threads in (1, 4):
+            asgi = WsgiToAsgi(delayed(app), threads)
+
+            async def scenario():
+                return await asyncio.gather(*(
+                    call(asgi, "GET", "/persons") for _ in range(8)))
+
+            start = time.perf_counter()
+            results = asyncio.run(scenario())
+            durations[threads] = time.perf_counter() - start
+            eq_([200] * 8, [status for status, _, _ in results])
+
+        ok_(durations[1] > 2 * durations[4], durations)
+
+    def test_concurrent_reads(self):
+        persons = {}
+        for index in range(4):
+            person = {"firstName": f"first{index}", "lastName": "last"}
+            persons[client.post('/persons', json=person).json["id"]] = person
+
+        threads = 4
+        # Every request waits in its transaction until as many are open as
+        # there are threads, so that they all read at the same time
+        barrier = threading.Barrier(threads, timeout=5)
+        sessions = []
+
+        def receive_after_begin(session, transaction, connection):
+            sessions.append((threading.get_ident(), session))
+            barrier.wait()
+
+        asgi = WsgiToAsgi(app, threads)
+
+        async def scenario():
+            return await asyncio.gather(
+                *(call(asgi, "GET", "/persons") for _ in range(threads)),
+                *(call(asgi, "GET", f"/persons/{id}") for id in persons))
+
+        event.listen(db.session, "after_begin", receive_after_begin)
+        try:
+            results = asyncio.run(scenario())
+        finally:
+            event.remove(db.session, "after_begin", receive_after_begin)
+
+        bodies = [json.loads(b"".join(chunks)) for _, _, chunks in results]
+        eq_([200] * 2 * threads, [status for status, _, _ in results])
+        for body in bodies[:threads]:
+            eq_(persons, {
+                person["id"]: {
+                    "firstName": person["firstName"],
+                    "lastName": person["lastName"]
+                } for person in body
+            })
+        eq_(list(persons), [body["id"] for body in bodies[threads:]])
+        eq_([person["firstName"] for person in persons.values()],
+            [body["firstName"] for body in bodies[threads:]])
+
+        # One transaction per request, each in a session of its own thread
+        eq_(2 * threads, len(sessions))
+        eq_(threads, len({thread for thread, _ in sessions}))
+        for thread, session in sessions:
+            eq_({thread}, {other for other, used in sessions
+                           if used is session})
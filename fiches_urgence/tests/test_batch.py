@@ -0,0 +1,118 @@
+from config_test import TestApi, client
+from nose.tools import eq_, ok_
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#   ___   _ _____ ___ _  _
+#  | _ ) /_\_   _/ __| || |
+#  | _ \/ _ \| || (__| __ |
+#  |___/_/ \_\_| \___|_||_|
+
+
+PERSON = {
+    "firstName": "name",
+    "lastName": "name"
+}
+
+NEW_RESIDENT = [
+    {"ref": "person", "method": "POST", "path": "/persons", "body": PERSON},
+    {"method": "POST", "path": "/residents",
+     "body": {"id": "${person.id}", "birthplace": "Lyon"}},
+    {"ref": "contact", "method": "POST", "path": "/persons",
+     "body": {"firstName": "contact", "lastName": "contact"}},
+    {"method": "POST",
+     "path": "/residents/${person.id}/emergency-relationships",
+     "body": {"personId": "${contact.id}", "relationship": "sister"}},
+]
+
+
+class TestBatch(TestApi):
+
+    def test_batch(self):
+        commits = []
+
+        def receive_commit(conn):
+            commits.append(conn)
+
+        event.listen(Engine, "commit", receive_commit)
+        try:
+            res = client.post('/batch', json=NEW_RESIDENT)
+        finally:
+            event.remove(Engine, "commit", receive_commit)
+        eq_(200, res.status_code)
+        eq_([201] * 4, [result["status"] for result in res.json["results"]])
+        eq_(1, len(commits))
+
+        person_id = res.json["results"][0]["body"]["id"]
+        contact_id = res.json["results"][2]["body"]["id"]
+        eq_("Lyon", client.get(f'/residents/{person_id}').json["birthplace"])
+        relationship, = client.get(
+            f'/residents/{person_id}/emergency-relationships').json
+        eq_(contact_id, relationship["personId"])
+
+    def test_batch_rolled_back(self):
+        operations = NEW_RESIDENT + [
+            {"method": "PATCH", "path": "/persons/${person.id}",
+             "body": {"firstName": None}}
+        ]
+        res = client.post('/batch', json=operations)
+        eq_(422, res.status_code)
+        eq_(4, res.json["failed"])
+        eq_(5, len(res.json["results"]))
+        eq_([], client.get('/persons').json)
+        eq_([], client.get('/residents').json)
+
+    def test_batch_failed_route(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        res = client.post('/batch', json=[
+            {"method": "PATCH", "path": f"/persons/{person_id}",
+             "body": {"address": "new"}},
+            {"method": "GET", "path": "/no-such-route"}
+        ])
+        eq_(404, res.status_code)
+        eq_(1, res.json["failed"])
+        eq_(None, client.get(f'/persons/{person_id}').json["address"])
+
+    def test_batch_if_match(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        operation = {
+            "method": "PATCH", "path": f"/persons/{person_id}",
+            "body": {"address": "new"}, "headers": {"If-Match": '"1"'}
+        }
+        res = client.post('/batch', json=[operation, operation])
+        eq_(412, res.status_code)
+        eq_(200, res.json["results"][0]["status"])
+        eq_(1, client.get(f'/persons/{person_id}').json["version"])
+
+    def test_batch_unknown_reference(self):
+        res = client.post('/batch', json=[
+            {"method": "POST", "path": "/persons", "body": PERSON},
+            {"method": "POST", "path": "/residents",
+             "body": {"id": "${person.id}"}}
+        ])
+        eq_(400, res.status_code)
+        eq_(1, res.json["failed"])
+        eq_([], client.get('/persons').json)
+
+    def test_batch_invalid(self):
+        eq_(400, client.post('/batch').status_code)
+        eq_(400, client.post('/batch', json={"method": "GET"}).status_code)
+        eq_(400, client.post('/batch', json=[
+            {"method": "GET", "path": "/batch"}]).status_code)
+        eq_(400, client.post('/batch', json=[
+            {"method": "TRACE", "path": "/persons"}]).status_code)
+        eq_(400, client.post('/batch', json=[
+            {"ref": "a", "method": "GET", "path": "/persons"},
+            {"ref": "a", "method": "GET", "path": "/persons"}]).status_code)
+
+    def test_batch_versions_bumped_on_commit(self):
+        etag = client.get('/persons').headers["ETag"]
+        res = client.post('/batch', json=[
+            {"method": "POST", "path": "/persons", "body": PERSON},
+            {"method": "GET", "path": "/no-such-route"}
+        ])
+        eq_(404, res.status_code)
+        eq_(etag, client.get('/persons').headers["ETag"])
+
+        client.post('/batch', json=NEW_RESIDENT[:1])
+        ok_(etag != client.get('/persons').headers["ETag"])
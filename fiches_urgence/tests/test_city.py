@@ -1,5 +1,5 @@
-from config_test import TestApi, client
-from nose.tools import eq_
+from config_test import TestApi, client, count_queries
+from nose.tools import eq_, ok_
 
 #    ___ ___ _______   __
 #   / __|_ _|_   _\ \ / /
@@ -31,7 +31,7 @@ class TestCity(TestApi):
 
         res = client.get(f'/cities/{CITY["id"]}')
         eq_(200, res.status_code)
-        eq_(CITY, res.json)
+        eq_({**CITY, "version": 1}, res.json)
 
     # ---------------- POST ----------------
     def test_post_cities_no_data(self):
@@ -42,7 +42,7 @@ class TestCity(TestApi):
         res = client.post('/cities', json=CITY)
         eq_(201, res.status_code)
         CITY["id"] = res.json["id"]
-        eq_(CITY, res.json)
+        eq_({**CITY, "version": 1}, res.json)
 
     # ---------------- PUT ----------------
     def test_put_city(self):
@@ -53,6 +53,7 @@ class TestCity(TestApi):
         }
         res = client.put(f'/cities/{res_post.json["id"]}', json=new_city)
         new_city["id"] = res_post.json["id"]
+        new_city["version"] = 2
         eq_(200, res.status_code)
         eq_(new_city, res.json)
 
@@ -61,3 +62,60 @@ class TestCity(TestApi):
         res_post = client.post('/cities', json=CITY)
         res = client.delete(f"/cities/{res_post.json['id']}")
         eq_(204, res.status_code)
+
+    def test_delete_city_clears_residents(self):
+        city_id = client.post('/cities', json=CITY).json["id"]
+        person_id = client.post(
+            '/persons', json={"firstName": "name", "lastName": "name"}
+        ).json["id"]
+        client.post('/residents', json={"id": person_id, "cityId": city_id})
+        client.get(f'/cities/{city_id}')
+
+        res = client.delete(f'/cities/{city_id}?dryRun=1')
+        eq_({"deleted": {"city": 1}, "updated": {"resident": 1}}, res.json)
+
+        eq_(204, client.delete(f'/cities/{city_id}').status_code)
+        eq_(404, client.get(f'/cities/{city_id}').status_code)
+        eq_(None, client.get(f'/residents/{person_id}').json["cityId"])
+
+    # ---------------- CACHE ----------------
+    def test_get_city_cached(self):
+        res_post = client.post('/cities', json=CITY)
+        city_id = res_post.json["id"]
+        client.get(f'/cities/{city_id}')
+
+        with count_queries() as statements:
+            res = client.get(f'/cities/{city_id}')
+        eq_(200, res.status_code)
+        # Only the versions the cached row is checked against are read
+        eq_(1, len(statements))
+        ok_(statements[0].endswith("FROM table_version"))
+        ok_(client.get('/admin/cache').json["reference"]["hits"] >= 1)
+
+    def test_patch_city_etag_of_projection(self):
+        city_id = client.post('/cities', json=CITY).json["id"]
+        url = f'/cities/{city_id}'
+
+        res = client.get(f'{url}?fields=name')
+        eq_({"name": CITY["name"]}, res.json)
+        res = client.patch(
+            url, json={"name": "Tokyo"},
+            headers={"If-Match": res.headers["ETag"]})
+        eq_(200, res.status_code)
+        eq_("Tokyo", client.get(url).json["name"])
+
+    def test_put_city_invalidates_cache(self):
+        res_post = client.post('/cities', json=CITY)
+        city_id = res_post.json["id"]
+        client.get(f'/cities/{city_id}')
+        client.get('/cities')
+
+        client.put(f'/cities/{city_id}', json={"name": "Tokyo"})
+        eq_("Tokyo", client.get(f'/cities/{city_id}').json["name"])
+        eq_("Tokyo", client.get('/cities').json[0]["name"])
+
+    def test_post_city_invalidates_collection(self):
+        client.post('/cities', json=CITY)
+        eq_(1, len(client.get('/cities').json))
+        client.post('/cities', json=CITY)
+        eq_(2, len(client.get('/cities').json))
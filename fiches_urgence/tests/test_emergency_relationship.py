@@ -1,5 +1,5 @@
 from config_test import TestApi, client, is_dict_subset_of_superset
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 #   ___ __  __ ___ ___  ___ ___ _  _  _____   __
 #  | __|  \/  | __| _ \/ __| __| \| |/ __\ \ / /
@@ -67,6 +67,41 @@ class TestEmergencyRelationship(TestApi):
         eq_(201, res.status_code)
         eq_(True, is_dict_subset_of_superset(EMERGENCY_RELATIONSHIP, res.json))
 
+    def test_post_emergency_relationship_unknown_person(self):
+        res = client.post(
+            f'/residents/{RESIDENT["id"]}/emergency-relationships',
+            json={"personId": "unknown", "relationship": "brother"}
+        )
+        eq_(400, res.status_code)
+        ok_("FOREIGN KEY" in res.json["message"])
+        res = client.get(
+            f'/residents/{RESIDENT["id"]}/emergency-relationships')
+        eq_([], res.json)
+
+    def test_post_emergency_relationships_bulk(self):
+        res = client.post(
+            f'/residents/{RESIDENT["id"]}/emergency-relationships/bulk',
+            json=[
+                {"personId": PERSON["id"], "relationship": "brother"},
+                {"personId": PERSON["id"], "relationship": "friend"}
+            ]
+        )
+        eq_(201, res.status_code)
+
+        res = client.get(
+            f'/residents/{RESIDENT["id"]}/emergency-relationships')
+        eq_(2, len(res.json))
+        eq_({RESIDENT["id"]}, {er["residentId"] for er in res.json})
+
+    def test_post_emergency_relationships_bulk_unknown_person(self):
+        res = client.post(
+            f'/residents/{RESIDENT["id"]}/emergency-relationships/bulk',
+            json=[{"personId": PERSON["id"]}, {"personId": "unknown"}]
+        )
+        eq_(422, res.status_code)
+        eq_(["1"], list(res.json["errors"]))
+        ok_("personId" in res.json["errors"]["1"])
+
     # ---------------- PUT ----------------
     def test_put_emergency_relationship(self):
         res_post = client.post(
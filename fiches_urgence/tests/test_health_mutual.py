@@ -33,7 +33,7 @@ class TestHealthMutual(TestApi):
 
         res = client.get(f'/health-mutuals/{HEALTH_MUTUAL["id"]}')
         eq_(200, res.status_code)
-        eq_(HEALTH_MUTUAL, res.json)
+        eq_({**HEALTH_MUTUAL, "version": 1}, res.json)
 
     # ---------------- POST ----------------
     def test_post_health_mutuals_no_data(self):
@@ -44,7 +44,7 @@ class TestHealthMutual(TestApi):
         res = client.post('/health-mutuals', json=HEALTH_MUTUAL)
         eq_(201, res.status_code)
         HEALTH_MUTUAL["id"] = res.json["id"]
-        eq_(HEALTH_MUTUAL, res.json)
+        eq_({**HEALTH_MUTUAL, "version": 1}, res.json)
 
     # ---------------- PUT ----------------
     def test_put_health_mutual(self):
@@ -58,6 +58,7 @@ class TestHealthMutual(TestApi):
         res = client.put(
             f'/health-mutuals/{res_post.json["id"]}', json=new_health_mutual)
         new_health_mutual["id"] = res_post.json["id"]
+        new_health_mutual["version"] = 2
         eq_(200, res.status_code)
         eq_(new_health_mutual, res.json)
 
@@ -0,0 +1,49 @@
+from unittest import mock
+from config_test import TestApi, client
+from nose.tools import eq_, ok_
+from src import ids
+
+#   ___ ___  ___
+#  |_ _|   \/ __|
+#   | || |) \__ \
+#  |___|___/|___/
+
+
+PERSON = {
+    "firstName": "name",
+    "lastName": "name"
+}
+
+
+class TestIds(TestApi):
+
+    def test_ids_sorted_and_unique(self):
+        allocated = [ids.new_id() for _ in range(1000)] + ids.new_ids(1000)
+        eq_(allocated, sorted(allocated))
+        eq_(2000, len(set(allocated)))
+        ok_(all(len(id) == ids.ID_LENGTH for id in allocated))
+        ok_(set("".join(allocated)) <= set(ids.ENCODING))
+
+    def test_ids_time_prefixed(self):
+        allocator = ids.IdAllocator()
+        with mock.patch("time.time_ns", return_value=2 * 10 ** 6):
+            first, = allocator.allocate()
+        with mock.patch("time.time_ns", return_value=10 ** 6):
+            second, = allocator.allocate()
+
+        # A clock going backwards does not break the ordering
+        ok_(first < second)
+        eq_("0000000002", first[:10])
+
+    def test_post_retries_on_collision(self):
+        taken = client.post('/persons', json=PERSON).json["id"]
+        fresh = ids.new_id()
+
+        with mock.patch.object(
+            ids.allocator, "allocate", side_effect=[[taken], [fresh]]
+        ):
+            res = client.post('/persons', json=PERSON)
+
+        eq_(201, res.status_code)
+        eq_(fresh, res.json["id"])
+        eq_(2, len(client.get('/persons').json))
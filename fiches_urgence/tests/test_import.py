@@ -0,0 +1,95 @@
+import os
+import tempfile
+from config_test import TestApi, app, client
+from nose.tools import eq_, ok_
+from fiches_urgence import db
+from fiches_urgence.cli import import_command
+from fiches_urgence.models import Person
+
+#   ___ __  __ ___  ___  ___ _____
+#  |_ _|  \/  | _ \/ _ \| _ \_   _|
+#   | || |\/| |  _/ (_) |   / | |
+#  |___|_|  |_|_|  \___/|_|_\ |_|
+
+
+PERSONS_CSV = """id,firstName,lastName,address
+p1,first1,last1,
+p2,first2,last2,address2
+p3,first3,last3,
+"""
+
+
+class TestImport(TestApi):
+
+    def setUp(self):
+        super(TestImport, self).setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "persons.csv")
+        with open(self.path, "w") as file:
+            file.write(PERSONS_CSV)
+
+    def tearDown(self):
+        super(TestImport, self).tearDown()
+        self.directory.cleanup()
+
+    def invoke(self, *args):
+        return app.test_cli_runner().invoke(import_command, list(args))
+
+    def test_import_csv(self):
+        res = self.invoke("persons", self.path, "--chunk-size", "2")
+        eq_(0, res.exit_code)
+        ok_("Imported 3 persons" in res.output)
+
+        res = client.get('/persons/p2')
+        eq_("address2", res.json["address"])
+        eq_(None, client.get('/persons/p1').json["address"])
+
+    def test_import_ndjson_references(self):
+        self.invoke("persons", self.path)
+        path = os.path.join(self.directory.name, "residents.ndjson")
+        with open(path, "w") as file:
+            file.write('{"id": "p1", "referringDoctorId": "p2"}\n')
+
+        res = self.invoke("residents", path)
+        eq_(0, res.exit_code)
+        eq_("p2", client.get('/residents/p1').json["doctor"]["id"])
+
+    def test_import_resumes_from_checkpoint(self):
+        with open(self.path, "a") as file:
+            file.write(",missingLastName,\n")
+
+        res = self.invoke("persons", self.path, "--chunk-size", "2")
+        eq_(1, res.exit_code)
+        eq_(2, len(client.get('/persons').json))
+
+        with open(self.path, "w") as file:
+            file.write(PERSONS_CSV)
+            file.write("p4,first4,last4,\n")
+
+        res = self.invoke("persons", self.path, "--chunk-size", "2")
+        eq_(0, res.exit_code)
+        ok_("Resuming after row 2" in res.output)
+        eq_(4, len(client.get('/persons').json))
+
+    def test_import_skip_invalid(self):
+        with open(self.path, "a") as file:
+            file.write(",missingLastName,\n")
+
+        res = self.invoke("persons", self.path, "--skip-invalid")
+        eq_(0, res.exit_code)
+        ok_("1 skipped" in res.output)
+        eq_(3, len(client.get('/persons').json))
+
+    def test_import_skip_invalid_references(self):
+        db.session.add(Person(id="p2", firstName="first", lastName="last"))
+        db.session.commit()
+        with open(self.path, "a") as file:
+            file.write(",missingLastName,\n")
+
+        res = self.invoke("persons", self.path, "--skip-invalid")
+        eq_(0, res.exit_code)
+        ok_("Row 2: {'id': ['p2 already exists.']}" in res.output)
+        ok_("Row 4: " in res.output)
+        ok_("Imported 2 persons" in res.output)
+        ok_("2 skipped" in res.output)
+        eq_(3, len(client.get('/persons').json))
@@ -0,0 +1,86 @@
+from config_test import TestApi, client
+from nose.tools import eq_
+
+#   _    ___   ___  _  ___   _ ___
+#  | |  / _ \ / _ \| |/ / | | | _ \
+#  | |_| (_) | (_) | ' <| |_| |  _/
+#  |____\___/ \___/|_|\_\\___/|_|
+
+
+def new_person(**phones) -> str:
+    return client.post('/persons', json={
+        "firstName": "first", "lastName": "last", **phones}).json["id"]
+
+
+class TestLookup(TestApi):
+
+    def test_lookup_unknown_number(self):
+        res = client.get('/lookup/phone/0612345678')
+        eq_(200, res.status_code)
+        eq_({
+            "number": "+33612345678",
+            "persons": [],
+            "healthMutuals": [],
+            "residents": []
+        }, res.json)
+
+    def test_lookup_invalid_number(self):
+        eq_(400, client.get('/lookup/phone/not-a-number').status_code)
+
+    def test_lookup_normalizes_numbers(self):
+        person_id = new_person(
+            mainPhoneNumber="01 23 45 67 89",
+            alternativePhoneNumber="+33 6.12.34.56.78"
+        )
+        for number in ("0123456789", "+33123456789", "0033612345678"):
+            res = client.get(f'/lookup/phone/{number}')
+            eq_([person_id], [person["id"] for person in res.json["persons"]])
+
+        person = res.json["persons"][0]
+        eq_("+33 6.12.34.56.78", person["alternativePhoneNumber"])
+        eq_(False, "alternativePhoneE164" in person)
+
+    def test_lookup_follows_updates(self):
+        person_id = new_person(mainPhoneNumber="0123456789")
+        client.put(f'/persons/{person_id}',
+                   json={"mainPhoneNumber": "0987654321"})
+
+        eq_([], client.get('/lookup/phone/0123456789').json["persons"])
+        eq_(1, len(client.get('/lookup/phone/0987654321').json["persons"]))
+
+    def test_lookup_linked_residents(self):
+        doctor_id = new_person(mainPhoneNumber="0123456789")
+        relative_id = new_person(alternativePhoneNumber="0123456789")
+        mutual_id = client.post('/health-mutuals', json={
+            "name": "mutual", "mainPhoneNumber": "0123456789"}).json["id"]
+        resident_id = new_person()
+        client.post('/residents', json={
+            "id": resident_id,
+            "referringDoctorId": doctor_id,
+            "psychiatristId": doctor_id,
+            "healthMutualId": mutual_id
+        })
+        client.post(
+            f'/residents/{resident_id}/emergency-relationships',
+            json={"personId": relative_id, "relationship": "sister"}
+        )
+
+        res = client.get('/lookup/phone/+33123456789')
+        eq_(200, res.status_code)
+        eq_([resident_id], [r["id"] for r in res.json["residents"]])
+
+        links = {
+            person["id"]: person["links"] for person in res.json["persons"]
+        }
+        eq_({"referringDoctor", "psychiatrist"},
+            {link["role"] for link in links[doctor_id]})
+        eq_([{
+            "residentId": resident_id,
+            "role": "emergencyContact",
+            "relationship": "sister"
+        }], links[relative_id])
+
+        mutual, = res.json["healthMutuals"]
+        eq_(mutual_id, mutual["id"])
+        eq_([{"residentId": resident_id, "role": "healthMutual"}],
+            mutual["links"])
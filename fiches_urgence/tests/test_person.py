@@ -1,5 +1,6 @@
-from config_test import TestApi, client
-from nose.tools import eq_
+import json
+from config_test import TestApi, client, count_queries
+from nose.tools import eq_, ok_
 
 #   ___ ___ ___  ___  ___  _  _
 #  | _ \ __| _ \/ __|/ _ \| \| |
@@ -28,12 +29,114 @@ class TestPerson(TestApi):
         res = client.get('/persons/unknown')
         eq_(404, res.status_code)
 
+    def test_get_persons_paginated(self):
+        ids = sorted(
+            client.post('/persons', json=PERSON).json["id"] for _ in range(5)
+        )
+
+        res = client.get('/persons?limit=2')
+        eq_(200, res.status_code)
+        eq_(ids[:2], [person["id"] for person in res.json])
+        ok_('rel="next"' in res.headers["Link"])
+
+        res = client.get(
+            f'/persons?limit=2&cursor={res.headers["X-Next-Cursor"]}')
+        eq_(ids[2:4], [person["id"] for person in res.json])
+
+        res = client.get(
+            f'/persons?limit=2&cursor={res.headers["X-Next-Cursor"]}')
+        eq_(ids[4:], [person["id"] for person in res.json])
+        ok_("Link" not in res.headers)
+
+    def test_get_persons_stream(self):
+        ids = {
+            client.post('/persons', json=PERSON).json["id"] for _ in range(3)
+        }
+
+        res = client.get('/persons?stream=1')
+        eq_(200, res.status_code)
+        eq_("application/x-ndjson", res.mimetype)
+        lines = res.get_data(as_text=True).splitlines()
+        eq_(ids, {json.loads(line)["id"] for line in lines})
+
+        res = client.get(
+            '/persons', headers={"Accept": "application/x-ndjson"})
+        eq_(3, len(res.get_data(as_text=True).splitlines()))
+
+    def test_get_persons_sorted(self):
+        for last_name in ("b", "c", "a"):
+            client.post('/persons', json={**PERSON, "lastName": last_name})
+
+        res = client.get('/persons?sort=-lastName')
+        eq_(["c", "b", "a"], [person["lastName"] for person in res.json])
+
+        res = client.get('/persons?sort=lastName&limit=2')
+        eq_(["a", "b"], [person["lastName"] for person in res.json])
+        res = client.get(
+            f'/persons?sort=lastName&limit=2'
+            f'&cursor={res.headers["X-Next-Cursor"]}')
+        eq_(["c"], [person["lastName"] for person in res.json])
+
+    def test_get_persons_bad_cursor(self):
+        res = client.get('/persons?cursor=notacursor')
+        eq_(400, res.status_code)
+
+    def test_get_persons_fields(self):
+        client.post('/persons', json=PERSON)
+
+        with count_queries() as statements:
+            res = client.get('/persons?fields=firstName,mainPhoneNumber')
+        eq_(200, res.status_code)
+        eq_([{"firstName": "name", "mainPhoneNumber": "mainPhone"}], res.json)
+        ok_("address" not in statements[-1])
+
+    def test_get_person_fields(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        res = client.get(f'/persons/{person_id}?fields=id,lastName')
+        eq_({"id": person_id, "lastName": "name"}, res.json)
+
+    def test_get_persons_unknown_fields(self):
+        eq_(400, client.get('/persons?fields=unknown').status_code)
+        eq_(400, client.get('/persons?fields=,').status_code)
+
     def test_get_person_id(self):
         res = client.post('/persons', json=PERSON)
         PERSON["id"] = res.json["id"]
         res = client.get(f'/persons/{PERSON["id"]}')
         eq_(200, res.status_code)
-        eq_(PERSON, res.json)
+        eq_({**PERSON, "version": 1}, res.json)
+
+    def test_get_persons_not_modified(self):
+        client.post('/persons', json=PERSON)
+        res = client.get('/persons')
+        etag = res.headers["ETag"]
+
+        with count_queries() as statements:
+            res = client.get('/persons', headers={"If-None-Match": etag})
+        eq_(304, res.status_code)
+        eq_(b"", res.data)
+        eq_(1, len(statements))
+        ok_(statements[0].endswith("FROM table_version"))
+
+        res = client.get('/persons?limit=1', headers={"If-None-Match": etag})
+        eq_(200, res.status_code)
+
+        client.post('/persons', json=PERSON)
+        res = client.get('/persons', headers={"If-None-Match": etag})
+        eq_(200, res.status_code)
+        eq_(2, len(res.json))
+
+    def test_get_person_not_modified(self):
+        id = client.post('/persons', json=PERSON).json["id"]
+        etag = client.get(f'/persons/{id}').headers["ETag"]
+
+        res = client.get(f'/persons/{id}', headers={"If-None-Match": etag})
+        eq_(304, res.status_code)
+
+        client.put(f'/persons/{id}', json={"firstName": "changed"})
+        res = client.get(f'/persons/{id}', headers={"If-None-Match": etag})
+        eq_(200, res.status_code)
+        eq_("changed", res.json["firstName"])
 
     # ---------------- POST ----------------
     def test_post_persons_no_data(self):
@@ -45,7 +148,25 @@ class TestPerson(TestApi):
         eq_(201, res.status_code)
 
         PERSON["id"] = res.json["id"]
-        eq_(PERSON, res.json)
+        eq_({**PERSON, "version": 1}, res.json)
+
+    def test_post_persons_bulk(self):
+        res = client.post('/persons/bulk', json=[PERSON] * 3)
+        eq_(201, res.status_code)
+        eq_(3, len(set(res.json["ids"])))
+
+        res = client.get('/persons')
+        eq_(3, len(res.json))
+
+    def test_post_persons_bulk_invalid_rows(self):
+        res = client.post(
+            '/persons/bulk', json=[PERSON, {"lastName": "noFirstName"}])
+        eq_(422, res.status_code)
+        ok_("firstName" in res.json["errors"]["1"])
+        ok_("0" not in res.json["errors"])
+
+        res = client.get('/persons')
+        eq_([], res.json)
 
     # ---------------- PUT ----------------
     def test_put_person(self):
@@ -59,11 +180,193 @@ class TestPerson(TestApi):
         }
         res = client.put(f'/persons/{res_post.json["id"]}', json=new_person)
         new_person["id"] = res_post.json["id"]
+        new_person["version"] = 2
         eq_(200, res.status_code)
         eq_(new_person, res.json)
 
+    def test_put_person_if_match(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        url = f'/persons/{person_id}'
+
+        res = client.put(
+            url, json={"address": "a"}, headers={"If-Match": '"2"'})
+        eq_(412, res.status_code)
+        res = client.put(
+            url, json={"address": "a"}, headers={"If-Match": '"1"'})
+        eq_(200, res.status_code)
+        eq_(2, res.json["version"])
+
+    def test_put_person_version(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        client.put(f'/persons/{person_id}', json={"address": "a"})
+
+        res = client.put(f'/persons/{person_id}', json={"version": 1})
+        eq_(422, res.status_code)
+        eq_(2, client.get(f'/persons/{person_id}').json["version"])
+
+    def test_put_unknown(self):
+        res = client.put('/persons/unknown', json={"address": "a"})
+        eq_(404, res.status_code)
+
+    # ---------------- PATCH ----------------
+    def test_patch_person(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+
+        with count_queries() as statements:
+            res = client.patch(
+                f'/persons/{person_id}', json={"address": "address2"})
+        eq_(200, res.status_code)
+        eq_({**PERSON, "id": person_id, "address": "address2", "version": 2},
+            res.json)
+        eq_(1, sum(statement.startswith("UPDATE person")
+                   for statement in statements))
+
+    def test_patch_person_phone_lookup(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        client.patch(
+            f'/persons/{person_id}', json={"mainPhoneNumber": "0612345678"})
+
+        res = client.get('/lookup/phone/0612345678')
+        eq_([person_id], [match["id"] for match in res.json["persons"]])
+
+    def test_patch_person_invalid(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        url = f'/persons/{person_id}'
+
+        eq_(400, client.patch(url, json={"id": "other"}).status_code)
+        eq_(422, client.patch(url, json={"firstName": None}).status_code)
+        eq_(422, client.patch(url, json={"version": 5}).status_code)
+        eq_(422, client.patch(url, json={"unknown": 1}).status_code)
+        eq_(1, client.get(url).json["version"])
+
+    def test_patch_unknown(self):
+        res = client.patch('/persons/unknown', json={"address": "a"})
+        eq_(404, res.status_code)
+
+    def test_patch_person_if_match(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        url = f'/persons/{person_id}'
+
+        # Both clients read version 1, the second write is refused
+        res = client.patch(
+            url, json={"address": "first"}, headers={"If-Match": '"1"'})
+        eq_(200, res.status_code)
+        res = client.patch(
+            url, json={"address": "second"}, headers={"If-Match": '"1"'})
+        eq_(412, res.status_code)
+        eq_("first", client.get(url).json["address"])
+
+        res = client.patch(
+            url, json={"address": "second"}, headers={"If-Match": '"2", "3"'})
+        eq_(200, res.status_code)
+        eq_(3, res.json["version"])
+
+        res = client.patch(
+            url, json={"address": "any"}, headers={"If-Match": '*'})
+        eq_(200, res.status_code)
+        res = client.patch(
+            url, json={"address": "any"}, headers={"If-Match": 'W/"4"'})
+        eq_(412, res.status_code)
+
+    def test_patch_person_etag_round_trip(self):
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        url = f'/persons/{person_id}'
+        # Writes on other rows of the table do not refuse this one's
+        client.post('/persons', json=PERSON)
+
+        etag = client.get(url).headers["ETag"]
+        res = client.patch(
+            url, json={"address": "first"}, headers={"If-Match": etag})
+        eq_(200, res.status_code)
+        new_etag = res.headers["ETag"]
+        ok_(new_etag != etag)
+        eq_(304, client.get(
+            url, headers={"If-None-Match": new_etag}).status_code)
+
+        # Written meanwhile by another client, with the tag it was sent
+        res = client.put(
+            url, json={"address": "second"}, headers={"If-Match": etag})
+        eq_(412, res.status_code)
+        res = client.put(
+            url, json={"address": "second"}, headers={"If-Match": new_etag})
+        eq_(200, res.status_code)
+        eq_(res.headers["ETag"], client.get(url).headers["ETag"])
+
     # ---------------- DELETE ----------------
     def test_delete_person(self):
         res_post = client.post('/persons', json=PERSON)
         res = client.delete(f"/persons/{res_post.json['id']}")
         eq_(204, res.status_code)
+
+    def create_dependents(self) -> tuple:
+        """ Creates a person who is a resident with an emergency contact and
+        a contributor, a contributor of another resident, and the doctor of
+        a third one """
+        person_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/residents', json={"id": person_id})
+        client.post('/contributors', json={"id": person_id})
+
+        other_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/residents', json={"id": other_id})
+        client.post('/contributors', json={"id": other_id})
+        client.post(
+            f'/residents/{person_id}/emergency-relationships',
+            json={"personId": other_id, "relationship": "sister"})
+        client.post(
+            f'/residents/{other_id}/emergency-relationships',
+            json={"personId": person_id, "relationship": "brother"})
+        client.post(
+            f'/residents/{person_id}/contribution-relationships',
+            json={"contributorId": other_id})
+        client.post(
+            f'/residents/{other_id}/contribution-relationships',
+            json={"contributorId": person_id})
+
+        patient_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/residents', json={
+            "id": patient_id, "referringDoctorId": person_id,
+            "psychiatristId": person_id})
+        return person_id, other_id, patient_id
+
+    def test_delete_person_dry_run(self):
+        person_id, other_id, patient_id = self.create_dependents()
+
+        res = client.delete(f'/persons/{person_id}?dryRun=true')
+        eq_(200, res.status_code)
+        eq_({
+            "deleted": {
+                "person": 1,
+                "resident": 1,
+                "contributor": 1,
+                "emergency_relationship": 2,
+                "contribution_relationship": 2
+            },
+            "updated": {"resident": 1}
+        }, res.json)
+        eq_(200, client.get(f'/persons/{person_id}').status_code)
+        eq_(1, len(client.get(
+            f'/residents/{other_id}/emergency-relationships').json))
+
+    def test_delete_person_cascade(self):
+        person_id, other_id, patient_id = self.create_dependents()
+
+        with count_queries() as statements:
+            res = client.delete(f'/persons/{person_id}')
+        eq_(204, res.status_code)
+        eq_(6, sum(statement.startswith(("DELETE", "UPDATE"))
+                   and "table_version" not in statement
+                   for statement in statements))
+
+        eq_(404, client.get(f'/persons/{person_id}').status_code)
+        eq_(404, client.get(f'/residents/{person_id}').status_code)
+        eq_(404, client.get(f'/contributors/{person_id}').status_code)
+        eq_([], client.get(
+            f'/residents/{other_id}/emergency-relationships').json)
+        eq_([], client.get(
+            f'/residents/{other_id}/contribution-relationships').json)
+
+        patient = client.get(f'/residents/{patient_id}').json
+        eq_((None, None, 2), (
+            patient["referringDoctorId"], patient["psychiatristId"],
+            patient["version"]))
+        eq_(200, client.get(f'/residents/{other_id}').status_code)
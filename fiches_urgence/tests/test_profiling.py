@@ -0,0 +1,74 @@
+import os
+import tempfile
+
+from flask import Flask
+from config_test import TestApi, client
+from nose.tools import eq_, ok_
+from fiches_urgence.profiling import RequestProfiler
+
+#   ___ ___  ___  ___ ___ _    ___ _  _  ___
+#  | _ \ _ \/ _ \| __|_ _| |  |_ _| \| |/ __|
+#  |  _/   / (_) | _| | || |__ | || .` | (_ |
+#  |_| |_|_\\___/|_| |___|____|___|_|\_|\___|
+
+
+def profiled_app(directory: str, max_captures: int = 2) -> tuple:
+    app = Flask(__name__)
+    app.config.update(
+        PROFILING_ENABLED=True,
+        PROFILING_DIR=directory,
+        PROFILING_MAX_CAPTURES=max_captures
+    )
+    profiler = RequestProfiler()
+    profiler.init_app(app)
+
+    @app.route("/work")
+    def work():
+        return {"items": [str(i) for i in range(1000)]}
+
+    return app, profiler
+
+
+class TestProfiling(TestApi):
+
+    def test_disabled_by_default(self):
+        res = client.get('/admin/profiles')
+
+        eq_(200, res.status_code)
+        eq_({"enabled": False, "captures": []}, res.json)
+        ok_("X-Profile-Capture" not in client.get(
+            '/cities', headers={"X-Profile": "1"}).headers)
+
+    def test_profile_parameter_on_collection(self):
+        client.post('/persons', json={"firstName": "a", "lastName": "b"})
+        res = client.get('/persons?profile=1')
+
+        eq_(200, res.status_code)
+        eq_(1, len(res.json))
+
+    def test_profiled_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app, profiler = profiled_app(directory)
+            profiled = app.test_client()
+
+            ok_("X-Profile-Capture" not in profiled.get('/work').headers)
+            eq_([], profiler.captures())
+
+            res = profiled.get('/work', headers={"X-Profile": "1"})
+            name = res.headers["X-Profile-Capture"]
+            ok_(os.path.exists(os.path.join(directory, name + ".prof")))
+            capture, = profiler.captures()
+            eq_(name, capture["name"])
+            eq_("/work", capture["path"])
+            eq_(200, capture["status"])
+            ok_(capture["duration"] > 0)
+            ok_(capture["peakMemory"] > 0)
+            ok_(capture["allocations"])
+
+            profiled.get('/work?profile=1')
+            last = profiled.get('/work?profile=1').headers[
+                "X-Profile-Capture"]
+            names = [capture["name"] for capture in profiler.captures()]
+            eq_(2, len(names))
+            eq_(last, names[0])
+            ok_(name not in names)
@@ -1,4 +1,6 @@
-from config_test import TestApi, client, is_dict_subset_of_superset
+from config_test import (
+    TestApi, client, count_queries, is_dict_subset_of_superset
+)
 from nose.tools import eq_, ok_
 
 #   ____  _____ ____ ___ ____  _____ _   _ _____
@@ -53,7 +55,7 @@ class TestResident(TestApi):
         res = client.get(f'/residents/{RESIDENT["id"]}')
         eq_(200, res.status_code)
 
-        RESIDENT["person"] = PERSON
+        RESIDENT["person"] = {**PERSON, "version": 1}
         eq_(True, is_dict_subset_of_superset(RESIDENT, res.json))
 
         # Remove 'person' key and value from RESIDENT not to impact following
@@ -111,6 +113,112 @@ class TestResident(TestApi):
         eq_(True, is_dict_subset_of_superset(
             psychiatrist, res.json["psychiatrist"]))
 
+    def test_get_residents_query_count(self):
+        def create_residents(count):
+            city = client.post('/cities', json={"name": "city"}).json
+            for _ in range(count):
+                person = client.post('/persons', json=PERSON).json
+                doctor = client.post('/persons', json=PERSON).json
+                client.post('/residents', json={
+                    "id": person["id"],
+                    "cityId": city["id"],
+                    "referringDoctorId": doctor["id"],
+                    "psychiatristId": doctor["id"]
+                })
+
+        create_residents(2)
+        with count_queries() as statements:
+            res = client.get('/residents')
+        few_residents_count = len(statements)
+
+        create_residents(8)
+        with count_queries() as statements:
+            res = client.get('/residents')
+
+        eq_(10, len(res.json))
+        eq_(few_residents_count, len(statements))
+        ok_(all(resident["doctor"] for resident in res.json))
+
+    def test_get_residents_nested_fields(self):
+        city = client.post('/cities', json={"name": "city"}).json
+        client.post('/residents', json={**RESIDENT, "cityId": city["id"]})
+
+        with count_queries() as statements:
+            res = client.get(
+                '/residents?fields=id,person.lastName,city.name')
+        eq_(200, res.status_code)
+        eq_([{
+            "id": RESIDENT["id"],
+            "person": {"lastName": "name"},
+            "city": {"name": "city"}
+        }], res.json)
+        ok_(not any("birthplace" in statement for statement in statements))
+        ok_(not any("address" in statement for statement in statements))
+
+    def test_get_residents_filtered(self):
+        city = client.post('/cities', json={"name": "city"}).json
+        dates = ("2019-05-01", "2020-01-01", "2021-03-01", None)
+        ids = {}
+        for date in dates:
+            person = client.post('/persons', json=PERSON).json
+            client.post('/residents', json={
+                "id": person["id"], "cityId": city["id"], "entranceDate": date
+            })
+            ids[date] = person["id"]
+
+        res = client.get(f'/residents?cityId={city["id"]}')
+        eq_(set(ids.values()), {resident["id"] for resident in res.json})
+
+        res = client.get(
+            f'/residents?cityId={city["id"]}&entranceDate[gte]=2020-01-01')
+        eq_({ids["2020-01-01"], ids["2021-03-01"]},
+            {resident["id"] for resident in res.json})
+
+        res = client.get('/residents?entranceDate[null]=true')
+        eq_([ids[None]], [resident["id"] for resident in res.json])
+
+    def test_get_residents_sorted_pages(self):
+        dates = ("2020-01-01", None, "2021-03-01", "2020-01-01", "2019-05-01")
+        for date in dates:
+            person = client.post('/persons', json=PERSON).json
+            client.post('/residents', json={
+                "id": person["id"], "entranceDate": date})
+
+        expected = [
+            resident["entranceDate"]
+            for resident in client.get('/residents?sort=-entranceDate').json
+        ]
+        eq_(["2021-03-01", "2020-01-01", "2020-01-01", "2019-05-01"],
+            expected[:4])
+
+        seen, cursor = [], ""
+        while cursor is not None:
+            res = client.get(
+                f'/residents?sort=-entranceDate&limit=2&cursor={cursor}')
+            seen.extend(resident["entranceDate"] for resident in res.json)
+            cursor = res.headers.get("X-Next-Cursor")
+        eq_(expected, seen)
+
+    def test_get_residents_bad_filters(self):
+        eq_(400, client.get('/residents?socialWelfareNumber=1').status_code)
+        eq_(400, client.get('/residents?cityId[like]=1').status_code)
+        eq_(400, client.get('/residents?birthDate=notadate').status_code)
+        eq_(400, client.get('/residents?sort=birthplace').status_code)
+
+    def test_resident_city_from_cache(self):
+        city = client.post('/cities', json={"name": "city"}).json
+        client.post('/residents', json={**RESIDENT, "cityId": city["id"]})
+        client.get('/residents')
+
+        with count_queries() as statements:
+            res = client.get('/residents')
+        eq_(city, res.json[0]["city"])
+        ok_(not any("FROM city" in statement for statement in statements))
+
+        client.put(f'/cities/{city["id"]}', json={"name": "renamed"})
+        res = client.get(f'/residents/{RESIDENT["id"]}')
+        eq_("renamed", res.json["city"]["name"])
+
     # ---------------- POST ----------------
     def test_post_residents_no_data(self):
         res = client.post('/residents')
@@ -142,7 +250,7 @@ class TestResident(TestApi):
 
         res = client.put(f'/residents/{ RESIDENT["id"]}', json=new_resident)
         new_resident["id"] = RESIDENT["id"]
-        new_resident["person"] = PERSON
+        new_resident["person"] = {**PERSON, "version": 1}
         eq_(200, res.status_code)
         eq_(True, is_dict_subset_of_superset(new_resident, res.json))
 
@@ -0,0 +1,100 @@
+from config_test import TestApi, count_queries
+from nose.tools import eq_, ok_, assert_raises
+from sqlalchemy import inspect
+from fiches_urgence import db, schemas
+from fiches_urgence.models import City, ContributionRelationship, Person
+from fiches_urgence.schema_version import (
+    SchemaError,
+    schema_version,
+    current_version,
+    stored_version,
+    ensure_schema,
+    missing_columns
+)
+
+#   ___  ___ _  _ ___ __  __   _    __   _____ ___  ___ ___ ___  _  _
+#  / __|/ __| || | __|  \/  | /_\   \ \ / / __| _ \/ __|_ _/ _ \| \| |
+#  \__ \ (__| __ | _|| |\/| |/ _ \   \ V /| _||   /\__ \| | (_) | .` |
+#  |___/\___|_||_|___|_|  |_/_/ \_\   \_/ |___|_|_\|___/___\___/|_|\_|
+
+
+class TestSchemaVersion(TestApi):
+
+    def test_created_with_current_version(self):
+        eq_(current_version(db.engine.dialect), stored_version(db.engine))
+
+    def test_matching_version_skips_ddl(self):
+        with count_queries() as statements:
+            eq_(False, ensure_schema())
+        eq_(1, len(statements))
+
+    def test_missing_version_is_upgraded(self):
+        db.engine.execute(schema_version.delete())
+
+        with self.assertLogs("fiches_urgence.schema_version", "WARNING"):
+            eq_(True, ensure_schema())
+        eq_(current_version(db.engine.dialect), stored_version(db.engine))
+        eq_(False, ensure_schema())
+
+    def test_outdated_version_is_upgraded(self):
+        db.engine.execute(schema_version.update().values(version="old"))
+
+        with self.assertLogs("fiches_urgence.schema_version", "WARNING"):
+            eq_(True, ensure_schema())
+        eq_(current_version(db.engine.dialect), stored_version(db.engine))
+
+    def test_created_tables_without_version(self):
+        db.engine.execute(schema_version.delete())
+        ContributionRelationship.__table__.drop(db.engine)
+
+        db.create_all()
+        eq_(None, stored_version(db.engine))
+
+    def test_missing_column_refuses_to_start(self):
+        db.engine.execute(schema_version.delete())
+        db.engine.execute("ALTER TABLE person DROP COLUMN address")
+
+        with self.assertLogs("fiches_urgence.schema_version", "WARNING"):
+            with assert_raises(SchemaError):
+                ensure_schema()
+        eq_(None, stored_version(db.engine))
+
+    def test_phone_columns_upgraded(self):
+        for column in ("mainPhoneE164", "alternativePhoneE164"):
+            db.engine.execute(f'DROP INDEX "ix_person_{column}"')
+            db.engine.execute(f'ALTER TABLE person DROP COLUMN "{column}"')
+        db.engine.execute(
+            'INSERT INTO person (id, "firstName", "lastName", '
+            '"mainPhoneNumber", version) VALUES (\'p1\', \'a\', \'b\', '
+            '\'06 12 34 56 78\', 1)')
+        db.engine.execute(schema_version.delete())
+
+        with self.assertLogs("fiches_urgence.schema_version", "WARNING"):
+            eq_(True, ensure_schema())
+        person = Person.query.get("p1")
+        eq_("+33612345678", person.mainPhoneE164)
+        eq_(None, person.alternativePhoneE164)
+        ok_("ix_person_mainPhoneE164" in {
+            index["name"] for index in inspect(db.engine).get_indexes(
+                "person")})
+
+    def test_version_columns_upgraded(self):
+        db.engine.execute(
+            "INSERT INTO city (id, name, version) VALUES ('c1', 'city', 3)")
+        for table in ("city", "resident"):
+            db.engine.execute(f"ALTER TABLE {table} DROP COLUMN version")
+        db.engine.execute(schema_version.delete())
+
+        with self.assertLogs("fiches_urgence.schema_version", "WARNING"):
+            eq_(True, ensure_schema())
+        eq_(1, City.query.get("c1").version)
+        with db.engine.connect() as connection:
+            eq_([], missing_columns(connection))
+
+    def test_lazy_schemas(self):
+        schema = schemas.resident_schema
+
+        ok_(schema is schemas.resident_schema)
+        ok_(schemas.residents_schema.many)
+        with assert_raises(AttributeError):
+            schemas.unknown_schema
@@ -0,0 +1,74 @@
+from config_test import TestApi, client
+from nose.tools import eq_
+from fiches_urgence import db, search
+
+#   ___ ___   _   ___  ___ _  _
+#  / __| __| /_\ | _ \/ __| || |
+#  \__ \ _| / _ \|   / (__| __ |
+#  |___/___/_/ \_\_|_\\___|_||_|
+
+
+def names(res) -> list:
+    return [(person["firstName"], person["lastName"]) for person in res.json]
+
+
+class TestSearch(TestApi):
+
+    def setUp(self):
+        """ Overloads setUp method to create a few persons to look for """
+        super(TestSearch, self).setUp()
+        for first_name, last_name in (
+            ("Jean", "Dupont"),
+            ("Jeanne", "Dupré"),
+            ("Hélène", "Martin"),
+            ("Marc", "Jeannot"),
+        ):
+            client.post('/persons', json={
+                "firstName": first_name, "lastName": last_name})
+
+    def test_search_prefix(self):
+        res = client.get('/persons/search?q=dup')
+        eq_(200, res.status_code)
+        eq_({("Jean", "Dupont"), ("Jeanne", "Dupré")}, set(names(res)))
+
+    def test_search_tokens(self):
+        res = client.get('/persons/search?q=dupr jea')
+        eq_([("Jeanne", "Dupré")], names(res))
+
+    def test_search_accents(self):
+        eq_([("Hélène", "Martin")],
+            names(client.get('/persons/search?q=helen')))
+        eq_([("Jeanne", "Dupré")],
+            names(client.get('/persons/search?q=DUPRÉ')))
+
+    def test_search_limit(self):
+        res = client.get('/persons/search?q=jean&limit=2')
+        eq_(2, len(res.json))
+
+    def test_search_follows_writes(self):
+        person = client.get('/persons/search?q=martin').json[0]
+        client.put(f'/persons/{person["id"]}', json={"lastName": "Durand"})
+        eq_([], client.get('/persons/search?q=martin').json)
+        eq_([("Hélène", "Durand")],
+            names(client.get('/persons/search?q=dura')))
+
+        client.delete(f'/persons/{person["id"]}')
+        eq_([], client.get('/persons/search?q=dura').json)
+
+    def test_search_renumbered_rowids(self):
+        db.engine.execute("UPDATE person SET rowid = rowid + 1000")
+
+        res = client.get('/persons/search?q=dup')
+        eq_({("Jean", "Dupont"), ("Jeanne", "Dupré")}, set(names(res)))
+
+    def test_search_index_rebuilt(self):
+        with db.engine.begin() as connection:
+            search.execute_all(connection, search.DROP_INDEX)
+        db.create_all()
+
+        res = client.get('/persons/search?q=dup')
+        eq_({("Jean", "Dupont"), ("Jeanne", "Dupré")}, set(names(res)))
+
+    def test_search_no_word(self):
+        eq_(400, client.get('/persons/search?q=" *').status_code)
+        eq_(400, client.get('/persons/search').status_code)
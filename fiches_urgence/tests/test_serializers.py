@@ -0,0 +1,102 @@
+import datetime
+import json
+from config_test import TestApi, client
+from nose.tools import eq_, ok_
+from fiches_urgence import schemas, serializers
+from fiches_urgence.models import (
+    Resident,
+    Person,
+    EmergencyRelationship,
+    ContributionRelationship,
+    City,
+    Contributor,
+    HealthMutual
+)
+
+#   ___ ___ ___ ___   _   _    ___ ___ ___ ___  ___
+#  / __| __| _ \_ _| /_\ | |  |_ _|_  / __| _ \/ __|
+#  \__ \ _||   /| | / _ \| |__ | | / /| _||   /\__ \
+#  |___/___|_|_\___/_/ \_\____|___/___|___|_|_\|___/
+
+
+PERSON = Person(
+    id="person",
+    firstName="first",
+    lastName="last",
+    address=None,
+    mainPhoneNumber="0600000000",
+    alternativePhoneNumber=None
+)
+
+OBJECTS = {
+    "person_schema": PERSON,
+    "city_schema": City(id="city", name="name", postalCode=None),
+    "contributor_schema": Contributor(id="person", role="doctor"),
+    "health_mutual_schema": HealthMutual(id="mutual", name="name"),
+    "emergency_relationship_schema": EmergencyRelationship(
+        id="er", residentId="person", personId=None, relationship="sister"),
+    "contribution_relationship_schema": ContributionRelationship(
+        id="cr", contributorId="person", socialAdvising=False),
+    "resident_schema": Resident(
+        id="person",
+        person=PERSON,
+        birthDate=datetime.date(1940, 2, 29),
+        entranceDate=None,
+        health_mutual=HealthMutual(id="mutual", name="mutual"),
+        doctor=Person(id="doctor", firstName="doctor", lastName="doctor")
+    )
+}
+
+
+def as_bytes(payload) -> bytes:
+    return json.dumps(payload).encode()
+
+
+class TestSerializers(TestApi):
+
+    def test_single_objects(self):
+        for name, obj in OBJECTS.items():
+            schema = getattr(schemas, name)
+            eq_(
+                as_bytes(schema.dump(obj)),
+                as_bytes(serializers.dump(schema, obj)),
+                name
+            )
+
+    def test_collections(self):
+        many_schemas = {
+            "person_schema": schemas.persons_schema,
+            "resident_schema": schemas.residents_schema,
+            "contribution_relationship_schema":
+                schemas.contribution_relationships_schema
+        }
+        for name, schema in many_schemas.items():
+            objects = [OBJECTS[name], OBJECTS[name]]
+            eq_(
+                as_bytes(schema.dump(objects)),
+                as_bytes(serializers.dump(schema, objects))
+            )
+            eq_(
+                as_bytes(schema.dump(objects[0], many=False)),
+                as_bytes(serializers.dump(schema, objects[0], many=False))
+            )
+
+    def test_compiled_once(self):
+        ok_(
+            serializers.compile_schema(schemas.resident_schema)
+            is serializers.compile_schema(schemas.resident_schema)
+        )
+
+    def test_routes_unchanged(self):
+        person = client.post('/persons', json={
+            "firstName": "first",
+            "lastName": "last"
+        }).json
+        client.post('/residents', json={
+            "id": person["id"],
+            "birthDate": "2000-01-31"
+        })
+
+        res = client.get(f'/residents/{person["id"]}')
+        resident = Resident.query.get(person["id"])
+        eq_(as_bytes(schemas.resident_schema.dump(resident)), res.data)
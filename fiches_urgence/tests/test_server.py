@@ -0,0 +1,155 @@
+import os
+import selectors
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from http.client import HTTPConnection
+from unittest import mock
+
+from config_test import TestApi, app
+from fiches_urgence.server import GRACEFUL_TIMEOUT, serve
+from nose.tools import eq_, ok_
+
+#   ___ ___ _____   _____ ___
+#  / __| __| _ \ \ / / __| _ \
+#  \__ \ _||   /\ V /| _||   /
+#  |___/___|_|_\ \_/ |___|_|_\
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, path: str) -> tuple:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as res:
+        return res.status, res.read()
+
+
+def conditional_get(port: int, path: str, etag: str) -> tuple:
+    connection = HTTPConnection("127.0.0.1", port)
+    try:
+        connection.request("GET", path, headers={"If-None-Match": etag})
+        res = connection.getresponse()
+        res.read()
+        return res.status, res.getheader("ETag")
+    finally:
+        connection.close()
+
+
+WRITE_PERSON = """
+from fiches_urgence import create_app
+create_app().test_client().post(
+    '/persons', json={'firstName': 'first', 'lastName': 'last'})
+"""
+
+
+def wait_until_serving(port: int, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get(port, "/cities")
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class TestServer(TestApi):
+
+    def test_prefork_server(self):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                DATABASE_URL="sqlite:///" + os.path.join(directory, "s.db"))
+            server = subprocess.Popen(
+                [sys.executable, "-m", "fiches_urgence.server",
+                 "--port", str(port), "--workers", "2",
+                 "--max-requests", "2", "--max-requests-jitter", "0"],
+                env=env, stderr=subprocess.PIPE, text=True)
+            try:
+                wait_until_serving(port)
+                for _ in range(8):
+                    eq_(200, get(port, "/cities")[0])
+
+                server.send_signal(signal.SIGHUP)
+                for _ in range(4):
+                    eq_(200, get(port, "/cities")[0])
+            finally:
+                server.send_signal(signal.SIGTERM)
+                _, log = server.communicate(timeout=60)
+
+        eq_(0, server.returncode)
+        booted = log.count("Booting worker")
+        # 2 workers, replaced after every other request, and 2 new ones
+        # once reloaded
+        ok_(booted >= 6, log)
+        ok_("Reloading" in log, log)
+        ok_("Stopping" in log, log)
+
+    def test_worker_stops_after_lost_connection(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(8)
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                # Woken up by connections another worker accepts first
+                with mock.patch.object(
+                    socketserver._ServerSelector, "select",
+                    lambda *args, **kwargs: [(None, selectors.EVENT_READ)]
+                ):
+                    serve(app, sock, 100)
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+
+        sock.close()
+        time.sleep(0.5)
+        started = time.monotonic()
+        os.kill(pid, signal.SIGTERM)
+        while not os.waitpid(pid, os.WNOHANG)[0]:
+            if time.monotonic() - started > GRACEFUL_TIMEOUT / 3:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                raise AssertionError("the worker did not stop")
+            time.sleep(0.05)
+
+    def test_versions_across_processes(self):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                DATABASE_URL="sqlite:///" + os.path.join(directory, "s.db"))
+            server = subprocess.Popen(
+                [sys.executable, "-m", "fiches_urgence.server",
+                 "--port", str(port), "--workers", "2"],
+                env=env, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_serving(port)
+                etag = conditional_get(port, "/persons", "*")[1]
+                eq_(304, conditional_get(port, "/persons", etag)[0])
+
+                # Written by another process, as the import command would
+                subprocess.run(
+                    [sys.executable, "-c", WRITE_PERSON], env=env, check=True)
+                status, new_etag = conditional_get(port, "/persons", etag)
+                eq_(200, status)
+                ok_(new_etag != etag)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
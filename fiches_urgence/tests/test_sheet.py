@@ -0,0 +1,163 @@
+import threading
+from unittest import mock
+
+from config_test import TestApi, client, count_queries
+from fiches_urgence import sheets
+from nose.tools import eq_, ok_
+
+#   ____  _   _ _____ _____ _____
+#  / ___|| | | | ____| ____|_   _|
+#  \___ \| |_| |  _| |  _|   | |
+#   ___) |  _  | |___| |___  | |
+#  |____/|_| |_|_____|_____| |_|
+
+
+PERSON = {
+    "firstName": "name",
+    "lastName": "name",
+    "address": "address"
+}
+
+CONTACT = {
+    "firstName": "contactFirst",
+    "lastName": "contactLast",
+    "mainPhoneNumber": "0600000000"
+}
+
+
+class TestSheet(TestApi):
+
+    def setUp(self):
+        """ Overloads setUp method to automatically create a resident with an
+        emergency contact and a contributor """
+        super(TestSheet, self).setUp()
+        self.resident_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/residents', json={"id": self.resident_id})
+
+        self.contact_id = client.post('/persons', json=CONTACT).json["id"]
+        self.er_id = client.post(
+            f'/residents/{self.resident_id}/emergency-relationships',
+            json={"personId": self.contact_id, "relationship": "sister"}
+        ).json["id"]
+
+        contributor_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/contributors', json={"id": contributor_id})
+        client.post(
+            f'/residents/{self.resident_id}/contribution-relationships',
+            json={"contributorId": contributor_id, "socialAdvising": True}
+        )
+
+    def test_get_unknown(self):
+        res = client.get('/residents/unknown/sheet')
+        eq_(404, res.status_code)
+
+    def test_get_sheet(self):
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_(200, res.status_code)
+        eq_(self.resident_id, res.json["resident"]["person"]["id"])
+
+        contact, = res.json["emergencyContacts"]
+        eq_("sister", contact["relationship"])
+        eq_("contactFirst", contact["person"]["firstName"])
+
+        contribution, = res.json["contributors"]
+        eq_(True, contribution["socialAdvising"])
+        eq_("name", contribution["contributor"]["person"]["firstName"])
+
+    def test_get_sheet_cached(self):
+        client.get(f'/residents/{self.resident_id}/sheet')
+        with count_queries() as statements:
+            res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_(200, res.status_code)
+        # Only the versions the cached sheet is checked against are read
+        eq_(1, len(statements))
+        ok_(statements[0].endswith("FROM table_version"))
+
+    def test_sheet_built_during_write(self):
+        url = f'/residents/{self.resident_id}/sheet'
+        build_sheet = sheets.build_sheet
+
+        def write():
+            client.patch(
+                f'/persons/{self.contact_id}', json={"firstName": "changed"})
+
+        def build_then_write(resident_id):
+            built = build_sheet(resident_id)
+            # Committed by a concurrent request once the rows were read
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join()
+            return built
+
+        with mock.patch.object(sheets, "build_sheet", build_then_write):
+            contact, = client.get(url).json["emergencyContacts"]
+        eq_("contactFirst", contact["person"]["firstName"])
+
+        contact, = client.get(url).json["emergencyContacts"]
+        eq_("changed", contact["person"]["firstName"])
+
+    def test_get_sheet_queries(self):
+        city_id = client.post('/cities', json={"name": "city"}).json["id"]
+        health_mutual_id = client.post(
+            '/health-mutuals', json={"name": "mutual"}).json["id"]
+        client.put(f'/residents/{self.resident_id}', json={
+            "cityId": city_id, "healthMutualId": health_mutual_id})
+
+        with count_queries() as statements:
+            res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_(200, res.status_code)
+        eq_("city", res.json["resident"]["city"]["name"])
+        eq_("mutual", res.json["resident"]["healthMutual"]["name"])
+        # The versions, the resident, its contacts and its contributors
+        eq_(4, len(statements))
+
+    def test_sheet_invalidated_on_update(self):
+        client.get(f'/residents/{self.resident_id}/sheet')
+        client.put(f'/persons/{self.contact_id}', json={"firstName": "new"})
+
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_("new", res.json["emergencyContacts"][0]["person"]["firstName"])
+
+    def test_sheet_invalidated_on_patch(self):
+        client.get(f'/residents/{self.resident_id}/sheet')
+        client.patch(f'/persons/{self.contact_id}', json={"firstName": "new"})
+
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_("new", res.json["emergencyContacts"][0]["person"]["firstName"])
+
+    def test_sheet_invalidated_on_moved_relationship(self):
+        other_id = client.post('/persons', json=PERSON).json["id"]
+        client.post('/residents', json={"id": other_id})
+        client.get(f'/residents/{self.resident_id}/sheet')
+        client.get(f'/residents/{other_id}/sheet')
+
+        client.patch(
+            f'/residents/{self.resident_id}/emergency-relationships/'
+            f'{self.er_id}',
+            json={"residentId": other_id}
+        )
+
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_([], res.json["emergencyContacts"])
+        res = client.get(f'/residents/{other_id}/sheet')
+        eq_(1, len(res.json["emergencyContacts"]))
+
+    def test_sheet_invalidated_on_new_relationship(self):
+        client.get(f'/residents/{self.resident_id}/sheet')
+        client.post(
+            f'/residents/{self.resident_id}/emergency-relationships',
+            json={"personId": self.contact_id, "relationship": "friend"}
+        )
+
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_(2, len(res.json["emergencyContacts"]))
+
+    def test_sheet_invalidated_on_delete(self):
+        client.get(f'/residents/{self.resident_id}/sheet')
+        client.delete(
+            f'/residents/{self.resident_id}/emergency-relationships/'
+            f'{self.er_id}'
+        )
+
+        res = client.get(f'/residents/{self.resident_id}/sheet')
+        eq_([], res.json["emergencyContacts"])
@@ -0,0 +1,55 @@
+from sqlalchemy import bindparam, select
+from sqlalchemy.engine import Connection
+from src import phones
+from fiches_urgence.schema_version import (
+    add_missing_column,
+    model_tables,
+    upgrade_step
+)
+from fiches_urgence.models import Person, HealthMutual
+
+#   _   _ ___  ___ ___    _   ___  ___ ___
+#  | | | | _ \/ __| _ \  /_\ |   \| __/ __|
+#  | |_| |  _/ (_ |   / / _ \| |) | _|\__ \
+#   \___/|_|  \___|_|_\/_/ \_\___/|___|___/
+
+# Steps bringing the tables of a database created with older models up to
+# date, run by 'schema_version.upgrade' in the order they are defined.
+
+
+@upgrade_step
+def add_phone_e164_columns(connection: Connection):
+    """ Adds the E.164 copies of the phone numbers, computed from the numbers
+    already stored
+    """
+    for model in (Person, HealthMutual):
+        table = model.__table__
+        for column, derived in model.PHONE_COLUMNS.items():
+            add_missing_column(connection, table.c[derived])
+
+            rows = connection.execute(
+                select([table.c.id, table.c[column]])
+                .where(table.c[column].isnot(None))
+                .where(table.c[derived].is_(None))
+            ).fetchall()
+            values = [
+                {"row_id": id, "value": phones.to_e164(number)}
+                for id, number in rows
+            ]
+            values = [value for value in values if value["value"] is not None]
+            if values:
+                connection.execute(
+                    table.update()
+                    .where(table.c.id == bindparam("row_id"))
+                    .values({derived: bindparam("value")}),
+                    values)
+
+
+@upgrade_step
+def add_version_columns(connection: Connection):
+    """ Adds the version of the rows checked by conditional writes, every
+    existing row starting at 1
+    """
+    for table in model_tables():
+        if "version" in table.c:
+            add_missing_column(connection, table.c.version, default="1")
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Iterable, Tuple
+
+from marshmallow import fields
+from sqlalchemy import event, select
+from fiches_urgence import db, ma
+
+#  __     _______ ____  ____ ___ ___  _   _ ____
+#  \ \   / / ____|  _ \/ ___|_ _/ _ \| \ | / ___|
+#   \ \ / /|  _| | |_) \___ \| | | | |  \| \___ \
+#    \ V / | |___|  _ < ___) | | |_| | |\  |___) |
+#     \_/  |_____|_| \_\____/___\___/|_| \_|____/
+
+
+# Version of the data of every table, bumped in the transaction of each
+# write, so that the writes committed by any process are seen by all of them
+table_version = db.Table(
+    "table_version",
+    db.Column("name", db.String, primary_key=True),
+    db.Column("version", db.Integer, nullable=False)
+)
+
+
+class TableVersions(object):
+    """ Reads the count of committed writes on every table, stored in the
+    database by 'table_version'. The versions of the tables a response was
+    built from identify the version of its data, and take the writes of the
+    other workers, of the import command, or of a process since replaced,
+    into account. They are read with a single query per session, and again
+    once it committed.
+
+    The writes committed by the current process are counted apart as well,
+    so that caches invalidated precisely by the process itself can tell
+    when the others wrote.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}
+
+    def stored(self) -> Dict[str, int]:
+        """ Reads the versions of every table, once per session
+
+        Returns:
+            Dict[str, int]: the versions, by table name
+        """
+        session = db.session()
+        stored = session.info.get("table_versions")
+        if stored is None:
+            stored = session.info["table_versions"] = dict(session.execute(
+                select([table_version.c.name, table_version.c.version])
+            ).fetchall())
+        return stored
+
+    def get(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        stored = self.stored()
+        return tuple(stored.get(table, 0) for table in tables)
+
+    def foreign(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """ Counts the writes on 'tables' committed by other processes """
+        tables = tuple(tables)
+        stored = self.get(tables)
+        with self._lock:
+            return tuple(
+                version - self._local.get(table, 0)
+                for table, version in zip(tables, stored)
+            )
+
+    def bump(self, tables: Iterable[str]):
+        """ Counts writes on 'tables' committed by the current process """
+        with self._lock:
+            for table in tables:
+                self._local[table] = self._local.get(table, 0) + 1
+
+
+versions = TableVersions()
+
+
+def schema_tables(schema: ma.SQLAlchemyAutoSchema) -> Tuple[str, ...]:
+    """ Lists the tables the data serialized by 'schema' comes from, the one
+    of its model and the ones of its nested schemas.
+
+    Args:
+        schema (ma.SQLAlchemyAutoSchema): the schema serializing the data
+    Returns:
+        Tuple[str, ...]: the names of the tables, sorted
+    """
+    tables = {schema.Meta.model.__tablename__}
+    for field in schema.dump_fields.values():
+        if isinstance(field, fields.Nested):
+            tables.update(schema_tables(field.schema))
+    return tuple(sorted(tables))
+
+
+def etag(tables: Iterable[str], *parts: str) -> str:
+    """ Builds an entity tag from the versions of the 'tables' a response is
+    built from and everything else it depends on.
+
+    Args:
+        tables (Iterable[str]): the tables the data of the response comes from
+        parts (str): whatever else changes the response, such as its URL
+    Returns:
+        str: the entity tag, unquoted
+    """
+    tables = tuple(tables)
+    key = repr((tables, versions.get(tables), parts))
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def all_tables() -> Tuple[str, ...]:
+    return tuple(db.metadata.tables)
+
+
+# Versions are bumped by the transaction of the writes, so that a response
+# built from uncommitted rows is never tagged with their version
+
+def pending_tables(session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(db.session, "after_flush")
+def receive_after_flush(session, flush_context):
+    pending_tables(session).update(
+        item.__tablename__
+        for item in session.new | session.dirty | session.deleted
+        if isinstance(item, db.Model)
+    )
+
+
+@event.listens_for(db.session, "after_bulk_update")
+def receive_after_bulk_update(update_context):
+    pending_tables(update_context.session).add(
+        update_context.mapper.local_table.name)
+
+
+@event.listens_for(db.session, "after_bulk_delete")
+def receive_after_bulk_delete(delete_context):
+    pending_tables(delete_context.session).add(
+        delete_context.mapper.local_table.name)
+
+
+@event.listens_for(db.session, "before_commit")
+def receive_before_commit(session):
+    # Released savepoints are committed with the transaction only
+    if session.transaction.nested:
+        return
+    # Flushed now rather than by the commit, to know every table written
+    session.flush()
+    tables = pending_tables(session)
+    if tables:
+        session.execute(
+            table_version.update()
+            .where(table_version.c.name.in_(sorted(tables)))
+            .values(version=table_version.c.version + 1))
+
+
+@event.listens_for(db.session, "after_commit")
+def receive_after_commit(session):
+    if session.transaction.nested:
+        return
+    session.info.pop("table_versions", None)
+    versions.bump(session.info.pop("changed_tables", ()))
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def receive_after_soft_rollback(session, previous_transaction):
+    # Writes flushed before a savepoint rolled back are still pending
+    if previous_transaction.parent is None:
+        session.info.pop("changed_tables", None)
+        session.info.pop("table_versions", None)
+
+
+@event.listens_for(db.metadata, "after_create")
+def receive_after_create(target, connection, **kwargs):
+    # Each table starts at a random version, so that the tags of a database
+    # created again never match the ones of the former one
+    existing = {
+        name for name, in connection.execute(select([table_version.c.name]))}
+    missing = [name for name in all_tables() if name not in existing]
+    if missing:
+        connection.execute(table_version.insert(), [
+            {"name": name, "version": int.from_bytes(os.urandom(4), "big")}
+            for name in missing
+        ])
+
+
+@event.listens_for(db.metadata, "after_drop")
+def receive_after_drop(target, connection, **kwargs):
+    # Every row is gone with 'drop_all', whatever the session did
+    versions.bump(all_tables())
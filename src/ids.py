@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from typing import List
+
+# Crockford's base32, which keeps ids case-insensitive and sortable
+ENCODING = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# Every 10 bits value as its 2 characters, so that ids are encoded pairwise
+PAIRS = [first + second for first in ENCODING for second in ENCODING]
+PAIR_SHIFTS = tuple(range(120, -1, -10))
+
+TIME_BITS = 48
+RANDOM_BITS = 80
+ID_LENGTH = 26
+MAX_RANDOM = (1 << RANDOM_BITS) - 1
+
+
+# The last 6 characters of an id, which change along a batch
+SUFFIX_BITS = 30
+SUFFIX_MASK = (1 << SUFFIX_BITS) - 1
+
+
+def encode(value: int) -> str:
+    """ Encodes a 128 bits integer in 26 characters of Crockford's base32 """
+    return "".join([PAIRS[(value >> shift) & 0x3FF] for shift in PAIR_SHIFTS])
+
+
+class IdAllocator(object):
+    """ Allocates ULID-like ids: a 48 bits millisecond timestamp followed by
+    80 bits drawn from the OS CSPRNG, in 26 characters. Ids sort by creation
+    time, so that new rows are appended at the end of the primary key index
+    instead of landing on random pages. Ids allocated within the same
+    millisecond increment the random part, so they keep sorting in order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_time = -1
+        self._last_random = 0
+
+    def allocate(self, count: int = 1) -> List[str]:
+        """ Allocates a batch of consecutive ids
+
+        Args:
+            count (int, optional): the number of ids. Defaults to 1
+        Returns:
+            List[str]: the ids, in increasing order
+        """
+        if count < 1:
+            return []
+
+        with self._lock:
+            now = time.time_ns() // 1_000_000
+            if now > self._last_time:
+                self._last_time = now
+                # Leaves room for the batch before the random part overflows
+                self._last_random = int.from_bytes(
+                    os.urandom(10), "big") >> 1
+            else:
+                self._last_random += 1
+
+            if self._last_random + count > MAX_RANDOM:
+                self._last_time += 1
+                self._last_random = 0
+
+            first = (self._last_time << RANDOM_BITS) | self._last_random
+            self._last_random += count - 1
+
+        # Consecutive ids share their first 20 characters, encoded only once
+        allocated = []
+        prefix_value = prefix = None
+        for value in range(first, first + count):
+            if value >> SUFFIX_BITS != prefix_value:
+                prefix_value = value >> SUFFIX_BITS
+                prefix = encode(value)[:-6]
+            suffix = value & SUFFIX_MASK
+            allocated.append(
+                prefix
+                + PAIRS[suffix >> 20]
+                + PAIRS[(suffix >> 10) & 0x3FF]
+                + PAIRS[suffix & 0x3FF]
+            )
+
+        return allocated
+
+
+allocator = IdAllocator()
+
+
+def new_id() -> str:
+    """ Allocates a single id from the shared allocator """
+    return allocator.allocate()[0]
+
+
+def new_ids(count: int) -> List[str]:
+    """ Allocates 'count' ids at once from the shared allocator """
+    return allocator.allocate(count)
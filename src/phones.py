@@ -0,0 +1,48 @@
+import re
+from typing import Optional
+
+# Country calling code of the numbers dialed without one
+DEFAULT_COUNTRY_CODE = "33"
+
+# E.164 numbers have up to 15 digits, country code included
+MIN_DIGITS = 8
+MAX_DIGITS = 15
+
+_SEPARATORS = re.compile(r"[\s.\-/()]")
+
+
+def to_e164(
+    number: Optional[str],
+    country_code: str = DEFAULT_COUNTRY_CODE
+) -> Optional[str]:
+    """ Normalizes a phone number typed in free text to the E.164 format,
+    e.g. '06 12 34 56 78', '+33 6.12.34.56.78' and '0033612345678' all
+    become '+33612345678'.
+
+    Args:
+        number (Optional[str]): the phone number as typed
+        country_code (str, optional): the country calling code of national
+            numbers. Defaults to DEFAULT_COUNTRY_CODE
+    Returns:
+        Optional[str]: the number in E.164 format, None if it is not a
+        phone number
+    """
+    if not number:
+        return None
+
+    digits = _SEPARATORS.sub("", number)
+    if digits.startswith("+"):
+        digits = digits[1:]
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif digits.startswith("0"):
+        # The trunk prefix of national numbers is not dialed from abroad
+        digits = country_code + digits[1:]
+    else:
+        digits = country_code + digits
+
+    if not (digits.isascii() and digits.isdigit()):
+        return None
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS:
+        return None
+    return "+" + digits
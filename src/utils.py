@@ -1,8 +1,9 @@
 import string
 import random
 import json
+from typing import Iterable
 
-from flask import Response
+from flask import Response, stream_with_context
 from http import HTTPStatus
 
 
@@ -19,9 +20,28 @@ def random_id(size: int) -> str:
     return generated_id
 
 
-def http_response(status_code: HTTPStatus, payload: dict) -> Response:
+def http_response(
+    status_code: HTTPStatus,
+    payload: dict,
+    headers: dict = None
+) -> Response:
     http_response = Response(
         json.dumps(payload),
-        status=status_code.value, mimetype='application/json')
+        status=status_code.value, mimetype='application/json',
+        headers=headers)
 
     return http_response
+
+
+def ndjson_response(
+    status_code: HTTPStatus,
+    payloads: Iterable[dict],
+    headers: dict = None
+) -> Response:
+    lines = (json.dumps(payload) + "\n" for payload in payloads)
+    ndjson_response = Response(
+        stream_with_context(lines),
+        status=status_code.value, mimetype='application/x-ndjson',
+        headers=headers)
+
+    return ndjson_response